@@ -1,6 +1,29 @@
-from flask import Flask, render_template, request, redirect, url_for
+from flask import Flask, render_template, request, redirect, url_for, g, jsonify, abort, Response
+from flask import before_render_template, template_rendered
+import circulation
+import click
+import eresource_sessions
+import eresource_usage
+import holds
+import ill
+import itertools
+import os
 import pymysql
-from datetime import datetime
+import re
+import sys
+import time
+from datetime import datetime, timedelta
+
+from db_pool import ConnectionPool
+from exports import EXPORT_FORMATS, stream_rows
+from fine_accrual import accrue_fines
+from id_sequence import allocate_ids
+from page_queries import PageExecutor, Query
+from patron_import import IMPORT_FORMATS, import_patrons, read_rows, text_stream
+from query_cache import ResultCache, RedisTier
+from query_registry import QueryRegistry
+from sql_metrics import SqlMetrics, instrumented_cursor
+from transactions import run_transaction
 
 app = Flask(__name__)
 
@@ -23,202 +46,256 @@ def dateformat(value, format='%Y-%m-%d'):
     return str(value)
 
 # -----------------------------
-# Database connection helper
+# SQL instrumentation (per-route query histograms, Server-Timing, slow-query log)
+# -----------------------------
+# Statements slower than UNILIB_SLOW_QUERY_MS are logged with their EXPLAIN
+sql_metrics = SqlMetrics(slow_ms=float(os.environ.get("UNILIB_SLOW_QUERY_MS", "200")))
+
+@app.before_request
+def start_request_timing():
+    sql_metrics.start_request(request.endpoint or "unmatched")
+
+@app.after_request
+def add_server_timing(response):
+    timing = sql_metrics.finish_request()
+    if timing:
+        response.headers["Server-Timing"] = timing
+    return response
+
+@app.teardown_request
+def end_request_timing(exc):
+    sql_metrics.clear_request()
+
+@before_render_template.connect_via(app)
+def start_render_timing(sender, template, context, **extra):
+    sql_metrics.render_started()
+
+@template_rendered.connect_via(app)
+def end_render_timing(sender, template, context, **extra):
+    sql_metrics.render_finished()
+
+# -----------------------------
+# Database connection pool
 # -----------------------------
+DB_CONFIG = dict(
+    host="localhost",
+    port=3307,
+    user="root",
+    password="Qh#330320",
+    database="UniLibPlus",
+    cursorclass=instrumented_cursor(sql_metrics, pymysql.cursors.DictCursor),
+    charset="utf8mb4",
+    # Pooled connections outlive a request, so each statement commits on its
+    # own rather than leaving an implicit transaction (and its locks) open on
+    # a connection handed to the next request. Writes that must be atomic
+    # go through transactions.run_transaction.
+    autocommit=True
+)
+
+# Pool sizing: requests borrow one connection each, so max_size bounds
+# the number of concurrent requests that can hit MySQL at once.
+pool = ConnectionPool(
+    lambda: pymysql.connect(**DB_CONFIG),
+    min_size=2,
+    max_size=20,
+    timeout=5.0,          # seconds a request waits for a free connection
+    max_idle=300.0,       # close idle connections (above min_size) after 5 min
+    max_lifetime=3600.0,  # recycle every connection after 1 hour
+    ping_after=30.0       # ping connections idle for longer than this on checkout
+)
+
 def get_connection():
-    return pymysql.connect(
-        host="localhost",
-        port=3307,
-        user="root",
-        password="Qh#330320",
-        database="UniLibPlus",
-        cursorclass=pymysql.cursors.DictCursor,
-        charset="utf8mb4"
-    )
+    """Borrow a pooled connection for the current request (returned on teardown)"""
+    if 'db_conn' not in g:
+        g.db_conn = pool.acquire()
+    return g.db_conn
+
+# Runs a page's independent queries concurrently, each extra one on its own
+# pooled connection when one is free right away; otherwise it runs on the
+# request's connection after the others (keep max_workers below max_size)
+page_executor = PageExecutor(pool, max_workers=8)
+
+@app.teardown_appcontext
+def release_connection(exc):
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        pool.release(conn, discard=exc is not None and not conn.open)
+
+# Named statements from queries.sql, parsed and compiled to positional SQL
+# once at import; routes bind their parameters by name
+QUERIES = QueryRegistry.load()
+
+# -----------------------------
+# Query-result cache for the analytics routes
+# -----------------------------
+# Optional shared tier: set UNILIB_CACHE_URL=redis://localhost:6379/0
+# (any Redis-compatible server) to share cached results between processes.
+CACHE_URL = os.environ.get("UNILIB_CACHE_URL")
+result_cache = ResultCache(local_size=256, shared=RedisTier(CACHE_URL) if CACHE_URL else None)
+
+# Per-query cache policy: the tables each query reads (invalidation tags) and its TTL in seconds
+CACHE_POLICIES = {
+    "patron-ranking":        (("Patron", "Fine"), 600),
+    "multi-branch-patrons":  (("Patron", "Loan", "Copy", "Branch"), 900),
+    "book-popularity":       (("Book", "Copy", "Loan"), 900),
+    "reservations-no-loans": (("Patron", "Reservation", "Loan"), 300),
+    "repeat-borrowers":      (("Patron", "Loan", "Copy", "Book"), 900),
+    "fine-analysis":         (("Fine", "FineReason"), 600),
+    "subject-patterns":      (("Patron", "Loan", "BookSubject", "Subject"), 900),
+    "monthly-loans":         (("Patron", "Loan", "LoanMonthlyRollup"), 1800),
+    "co-authors":            (("Author", "BookAuthor"), 3600),
+    "eresource-usage":       (("EResourceUsageDaily", "EResource", "License"), 600),
+    "eresource-providers":   (("EResourceUsageDaily", "EResource", "License"), 600),
+}
+
+def cached_rows(name, sql, params=()):
+    """Run a read-only query through the result cache using its CACHE_POLICIES entry"""
+    tables, ttl = CACHE_POLICIES[name]
+
+    def load():
+        with get_connection().cursor() as cur:
+            cur.execute(sql, params)
+            return cur.fetchall()
+
+    return result_cache.get_or_load(name, params, tables, ttl, load)
+
+@app.route("/admin/pool-stats")
+def pool_stats():
+    """Connection pool wait-time and saturation counters for monitoring"""
+    return jsonify(pool.stats())
+
+@app.route("/metrics")
+def metrics():
+    """Prometheus metrics: per-route request and SQL statement latency histograms"""
+    return Response(sql_metrics.prometheus(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/admin/session-stats")
+def session_stats():
+    """E-resource session seat-wait and denial counters"""
+    return jsonify(session_metrics.stats())
+
+@app.route("/admin/ill-stats")
+def ill_stats():
+    """Per-partner ILL dispatch throughput and turnaround"""
+    return jsonify(partners=ill.partner_stats(get_connection()))
+
+@app.route("/admin/cache-stats")
+def cache_stats():
+    """Result cache hit/miss and invalidation counters"""
+    return jsonify(result_cache.stats())
 
 # -----------------------------
 # Dashboard - Home page with statistics
 # -----------------------------
+
 @app.route("/")
 @app.route("/dashboard")
 def dashboard():
     conn = get_connection()
     stats = {}
-    try:
-        with conn.cursor() as cur:
-            # -------------------------------------------------
-            # Use updated_complex_query.sql "DASHBOARD MEGA SUMMARY"
-            # -------------------------------------------------
-            cur.execute("""
-                SET @today := CURDATE();
-            """)
-            cur.execute("""
-                SET @last_7 := DATE_SUB(@today, INTERVAL 7 DAY);
-            """)
-            cur.execute("""
-                SET @last_90 := DATE_SUB(@today, INTERVAL 90 DAY);
-            """)
-            cur.execute("""
-                WITH
-                BookStats AS (
-                  SELECT
-                    COUNT(*) AS total_books,
-                    COUNT(DISTINCT c.copy_id) AS total_copies,
-                    COUNT(DISTINCT bs.subject_id) AS total_subjects
-                  FROM Book b
-                  LEFT JOIN Copy c       ON b.isbn = c.isbn
-                  LEFT JOIN BookSubject bs ON b.isbn = bs.isbn
-                ),
-                PatronStats AS (
-                  SELECT
-                    COUNT(*) AS total_patrons,
-                    COUNT(DISTINCT l.patron_id) AS active_patrons_90d
-                  FROM Patron p
-                  LEFT JOIN Loan l
-                    ON p.patron_id = l.patron_id
-                   AND l.loan_ts >= @last_90
-                ),
-                LoanCore AS (
-                  SELECT
-                    l.loan_id,
-                    l.loan_ts,
-                    l.due_ts,
-                    l.return_ts,
-                    DATEDIFF(COALESCE(l.return_ts, @today), DATE(l.loan_ts)) AS duration_days
-                  FROM Loan l
-                ),
-                LoanStats AS (
-                  SELECT
-                    COUNT(*) AS total_loans,
-                    SUM(CASE WHEN return_ts IS NULL THEN 1 ELSE 0 END) AS current_loans,
-                    SUM(
-                      CASE
-                        WHEN return_ts IS NULL AND due_ts < @today THEN 1
-                        ELSE 0
-                      END
-                    ) AS overdue_loans,
-                    AVG(duration_days) AS avg_duration_days
-                  FROM LoanCore
-                ),
-                RecentLoanActivity AS (
-                  SELECT
-                    SUM(CASE WHEN DATE(loan_ts)   >= @last_7 THEN 1 ELSE 0 END) AS loans_last_7d,
-                    SUM(CASE WHEN DATE(return_ts) >= @last_7 THEN 1 ELSE 0 END) AS returns_last_7d
-                  FROM LoanCore
-                )
-                SELECT
-                  bs.total_books,
-                  bs.total_copies,
-                  bs.total_subjects,
-                  ps.total_patrons,
-                  ps.active_patrons_90d,
-                  ls.total_loans,
-                  ls.current_loans,
-                  ls.overdue_loans,
-                  ROUND(ls.avg_duration_days, 2) AS avg_duration_days,
-                  ra.loans_last_7d,
-                  ra.returns_last_7d
-                FROM BookStats bs
-                CROSS JOIN PatronStats ps
-                CROSS JOIN LoanStats   ls
-                CROSS JOIN RecentLoanActivity ra;
-            """)
-            summary = cur.fetchone() or {}
-            stats.update(summary)
-
-            # For compatibility with existing template keys
-            stats['total_books'] = stats.get('total_books', 0)
-            stats['total_patrons'] = stats.get('total_patrons', 0)
-            stats['current_loans'] = stats.get('current_loans', 0)
-            stats['overdue_loans'] = stats.get('overdue_loans', 0)
-
-            # -------------------------------------------------
-            # Use updated_complex_query.sql "DASHBOARD OVERDUE ALERT WITH RISK SCORE"
-            # -------------------------------------------------
-            cur.execute("SET @today := CURDATE();")
-            cur.execute("""
-                WITH PatronHistory AS (
-                  SELECT
-                    p.patron_id,
-                    COUNT(l.loan_id) AS all_loans,
-                    SUM(
-                      CASE
-                        WHEN l.return_ts IS NULL AND l.due_ts < @today THEN 1
-                        WHEN l.return_ts IS NOT NULL AND l.return_ts > l.due_ts THEN 1
-                        ELSE 0
-                      END
-                    ) AS overdue_or_late_loans
-                  FROM Patron p
-                  LEFT JOIN Loan l ON p.patron_id = l.patron_id
-                  GROUP BY p.patron_id
-                ),
-                PatronFineSummary AS (
-                  SELECT
-                    patron_id,
-                    COALESCE(SUM(amount), 0) AS total_fines,
-                    COALESCE(SUM(CASE WHEN status = 'Unpaid' THEN amount ELSE 0 END), 0) AS unpaid_fines
-                  FROM Fine
-                  GROUP BY patron_id
-                ),
-                OverdueLoans AS (
-                  SELECT
-                    l.loan_id,
-                    l.patron_id,
-                    l.copy_id,
-                    l.loan_ts,
-                    l.due_ts,
-                    l.return_ts,
-                    DATEDIFF(@today, DATE(l.due_ts)) AS days_overdue
-                  FROM Loan l
-                  WHERE l.return_ts IS NULL
-                    AND l.due_ts < @today
-                )
-                SELECT
-                  o.loan_id,
-                  o.patron_id,
-                  CONCAT(p.first_name, ' ', p.last_name) AS patron_name,
-                  b.title AS book_title,
-                  DATE(o.due_ts) AS due_date,
-                  o.days_overdue,
-                  ph.all_loans,
-                  ph.overdue_or_late_loans,
-                  pfs.unpaid_fines,
-                  (
-                    o.days_overdue * 1.0
-                    + ph.overdue_or_late_loans * 2.0
-                    + (pfs.unpaid_fines / 10.0)
-                  ) AS risk_score
-                FROM OverdueLoans o
-                JOIN Patron p ON o.patron_id = p.patron_id
-                JOIN Copy   c ON o.copy_id   = c.copy_id
-                JOIN Book   b ON c.isbn      = b.isbn
-                LEFT JOIN PatronHistory    ph  ON p.patron_id = ph.patron_id
-                LEFT JOIN PatronFineSummary pfs ON p.patron_id = pfs.patron_id
-                ORDER BY risk_score DESC, o.days_overdue DESC
-                LIMIT 10;
-            """)
-            stats['overdue_risk'] = cur.fetchall()
-
-            # Also compute total unpaid fines for display
-            cur.execute("""
-                SELECT COALESCE(SUM(amount), 0) AS total_unpaid
-                FROM Fine
-                WHERE status = 'Unpaid'
-            """)
-            row = cur.fetchone()
-            stats['total_fines'] = row['total_unpaid'] if row else 0
-    finally:
-        conn.close()
+
+    # Materialized "DASHBOARD MEGA SUMMARY" (DashboardSummary, kept current by
+    # triggers) and the overdue risk list are independent: fetch them together
+    results = page_executor.run({
+        'summary': Query(*QUERIES.bind("dashboard-summary"), one=True),
+        'overdue_risk': Query(*QUERIES.bind("dashboard-overdue-risk")),
+    }, conn=conn)
+
+    # Never reconciled from a request: stale time-window counters are shown
+    # with their as_of_date until ev_dashboard_summary_reconcile or
+    # `flask reconcile-dashboard` rebases them (no slots yet: all zero)
+    summary = results['summary'] or {}
+    stats.update((key, 0 if value is None and key != 'as_of_date' else value)
+                 for key, value in summary.items())
+
+    # For compatibility with existing template keys
+    stats['total_books'] = stats.get('total_books', 0)
+    stats['total_patrons'] = stats.get('total_patrons', 0)
+    stats['current_loans'] = stats.get('current_loans', 0)
+    stats['overdue_loans'] = stats.get('overdue_loans', 0)
+    stats['total_fines'] = stats.pop('total_unpaid_fines', 0)
+    stats['overdue_risk'] = results['overdue_risk']
 
     return render_template("dashboard.html", stats=stats)
 
 # -----------------------------
 # Books - Enhanced with search and filters
 # -----------------------------
+BOOKS_DEFAULT_PAGE_SIZE = 50
+BOOKS_MAX_PAGE_SIZE = 200
+# InnoDB ignores FULLTEXT words shorter than innodb_ft_min_token_size (default 3)
+FULLTEXT_MIN_WORD = 3
+
+def fulltext_query(term):
+    """Boolean-mode FULLTEXT query requiring every word, each prefix-matched"""
+    words = [w for w in re.findall(r'\w+', term) if len(w) >= FULLTEXT_MIN_WORD]
+    if not words:
+        return None
+    return ' '.join('+%s*' % w for w in words)
+
+def like_prefix(term):
+    """Escape LIKE wildcards and append % for a prefix match"""
+    return re.sub(r'([\\%_])', r'\\\1', term) + '%'
+
+def search_book_page(cur, search_term, subject_id, limit, offset):
+    """Return the ISBNs for one page of catalog results, best match first"""
+    subject_sql = "AND bsr.primary_subject_id = %s" if subject_id is not None else ""
+    subject_params = [subject_id] if subject_id is not None else []
+    isbn_digits = search_term.replace('-', '').replace(' ', '') if search_term else ''
+
+    if isbn_digits.isdigit():
+        # ISBN prefix match: a primary key range scan
+        cur.execute("""
+            SELECT bsr.isbn
+            FROM BookSearch bsr
+            WHERE bsr.isbn LIKE %s """ + subject_sql + """
+            ORDER BY bsr.isbn
+            LIMIT %s OFFSET %s
+        """, [isbn_digits + '%'] + subject_params + [limit, offset])
+    elif search_term and fulltext_query(search_term):
+        # Ranked FULLTEXT match over title, authors, subjects and publisher;
+        # title matches count double
+        query = fulltext_query(search_term)
+        cur.execute("""
+            SELECT
+              bsr.isbn,
+              MATCH (bsr.title) AGAINST (%s IN BOOLEAN MODE) * 2
+              + MATCH (bsr.title, bsr.authors, bsr.subjects, bsr.publisher_name)
+                  AGAINST (%s IN BOOLEAN MODE) AS relevance
+            FROM BookSearch bsr
+            WHERE MATCH (bsr.title, bsr.authors, bsr.subjects, bsr.publisher_name)
+                  AGAINST (%s IN BOOLEAN MODE) """ + subject_sql + """
+            ORDER BY relevance DESC, bsr.isbn
+            LIMIT %s OFFSET %s
+        """, [query, query, query] + subject_params + [limit, offset])
+    elif search_term:
+        # Only words too short for the FULLTEXT index: title prefix match
+        cur.execute("""
+            SELECT bsr.isbn
+            FROM BookSearch bsr
+            WHERE bsr.title LIKE %s """ + subject_sql + """
+            ORDER BY bsr.title, bsr.isbn
+            LIMIT %s OFFSET %s
+        """, [like_prefix(search_term)] + subject_params + [limit, offset])
+    else:
+        # Browsing: most borrowed first, walking idx_bookcirc_popularity
+        cur.execute("""
+            SELECT bcs.isbn
+            FROM BookCirculationStats bcs
+            JOIN BookSearch bsr ON bcs.isbn = bsr.isbn
+            WHERE 1 = 1 """ + subject_sql + """
+            ORDER BY bcs.times_loaned DESC, bcs.isbn
+            LIMIT %s OFFSET %s
+        """, subject_params + [limit, offset])
+    return [row['isbn'] for row in cur.fetchall()]
+
 @app.route("/books")
 def books():
     search = request.args.get('search', '')
     subject = request.args.get('subject', '')
+    page = max(1, request.args.get('page', 1, type=int))
+    page_size = request.args.get('page_size', BOOKS_DEFAULT_PAGE_SIZE, type=int)
+    page_size = max(1, min(page_size, BOOKS_MAX_PAGE_SIZE))
     
     # Normalize filters
     subject_id = int(subject) if subject and subject.isdigit() else None
@@ -227,115 +304,49 @@ def books():
     conn = get_connection()
     books = []
     subjects = []
+    has_next = False
     
-    try:
-        with conn.cursor() as cur:
-            # Get all subjects for filter
-            cur.execute("SELECT DISTINCT subject_id, name FROM Subject ORDER BY name")
-            subjects = cur.fetchall()
-            
-            # Use updated_complex_query.sql "BOOKS CATALOG – ADVANCED SEARCH + SUBJECT RANK"
+    with conn.cursor() as cur:
+        # Get all subjects for filter
+        cur.execute("SELECT DISTINCT subject_id, name FROM Subject ORDER BY name")
+        subjects = cur.fetchall()
+
+        # Stage 1: find one page of matching ISBNs (one extra to detect a next page)
+        isbns = search_book_page(cur, search_term, subject_id, page_size + 1, (page - 1) * page_size)
+        has_next = len(isbns) > page_size
+        isbns = isbns[:page_size]
+
+        # Stage 2: enrich only the books on this page, by primary key.
+        # The subject rank of updated_complex_query.sql "BOOKS CATALOG – ADVANCED
+        # SEARCH + SUBJECT RANK" is precomputed nightly in BookCirculationStats,
+        # as ranking here would window over every book of each page book's subject.
+        if isbns:
+            placeholders = ', '.join(['%s'] * len(isbns))
             sql = """
-                WITH BookCore AS (
-                  SELECT
-                    b.isbn,
-                    b.title,
-                    b.pub_year,
-                    b.publisher_id,
-                    MIN(bs.subject_id) AS primary_subject_id
-                  FROM Book b
-                  LEFT JOIN BookSubject bs ON b.isbn = bs.isbn
-                  GROUP BY b.isbn, b.title, b.pub_year, b.publisher_id
-                ),
-                BookPopularity AS (
-                  SELECT
-                    bc.isbn,
-                    bc.primary_subject_id,
-                    COUNT(l.loan_id) AS times_loaned
-                  FROM BookCore bc
-                  LEFT JOIN Copy c ON bc.isbn = c.isbn
-                  LEFT JOIN Loan l ON c.copy_id = l.copy_id
-                  GROUP BY bc.isbn, bc.primary_subject_id
-                ),
-                BookAvailability AS (
-                  SELECT
-                    bc.isbn,
-                    COUNT(DISTINCT c.copy_id) AS total_copies,
-                    SUM(
-                      CASE
-                        WHEN l.loan_id IS NULL OR l.return_ts IS NOT NULL THEN 1
-                        ELSE 0
-                      END
-                    ) AS available_copies
-                  FROM BookCore bc
-                  LEFT JOIN Copy c ON bc.isbn = c.isbn
-                  LEFT JOIN Loan l ON c.copy_id = l.copy_id
-                                    AND l.return_ts IS NULL
-                  GROUP BY bc.isbn
-                ),
-                BookDetail AS (
-                  SELECT
-                    bc.isbn,
-                    bc.title,
-                    bc.pub_year,
-                    bc.publisher_id,
-                    bc.primary_subject_id,
-                    GROUP_CONCAT(DISTINCT CONCAT(a.first_name, ' ', a.last_name)
-                                 ORDER BY a.last_name SEPARATOR ', ') AS authors,
-                    GROUP_CONCAT(DISTINCT s.name
-                                 ORDER BY s.name SEPARATOR ', ') AS subjects
-                  FROM BookCore bc
-                  LEFT JOIN BookAuthor ba   ON bc.isbn = ba.isbn
-                  LEFT JOIN Author a        ON ba.author_id = a.author_id
-                  LEFT JOIN BookSubject bs2 ON bc.isbn = bs2.isbn
-                  LEFT JOIN Subject s       ON bs2.subject_id = s.subject_id
-                  GROUP BY bc.isbn, bc.title, bc.pub_year, bc.publisher_id, bc.primary_subject_id
-                )
                 SELECT
-                  bd.isbn,
-                  bd.title,
-                  bd.pub_year,
-                  pub.name AS publisher_name,
-                  bd.authors,
-                  bd.subjects,
-                  COALESCE(bp.times_loaned, 0) AS times_loaned,
-                  ba.total_copies,
-                  ba.available_copies,
+                  bsr.isbn,
+                  bsr.title,
+                  bsr.pub_year,
+                  bsr.publisher_name,
+                  bsr.authors,
+                  bsr.subjects,
+                  COALESCE(bcs.times_loaned, 0) AS times_loaned,
+                  COALESCE(bcs.total_copies, 0) AS total_copies,
+                  COALESCE(bcs.available_copies, 0) AS available_copies,
                   s_main.name AS primary_subject,
-                  RANK() OVER (
-                    PARTITION BY bd.primary_subject_id
-                    ORDER BY COALESCE(bp.times_loaned, 0) DESC, bd.title
-                  ) AS subject_popularity_rank
-                FROM BookDetail bd
-                LEFT JOIN Publisher pub ON bd.publisher_id     = pub.publisher_id
-                LEFT JOIN BookPopularity  bp ON bd.isbn        = bp.isbn
-                LEFT JOIN BookAvailability ba ON bd.isbn       = ba.isbn
-                LEFT JOIN Subject s_main  ON bd.primary_subject_id = s_main.subject_id
-                WHERE
-                  (%s IS NULL OR %s = ''
-                   OR bd.title LIKE CONCAT('%%', %s, '%%')
-                   OR bd.isbn  LIKE CONCAT('%%', %s, '%%')
-                  )
-                  AND (
-                    %s IS NULL
-                    OR bd.primary_subject_id = %s
-                  )
-                ORDER BY
-                  COALESCE(bp.times_loaned, 0) DESC,
-                  bd.title;
+                  bcs.subject_rank AS subject_popularity_rank
+                FROM BookSearch bsr
+                LEFT JOIN BookCirculationStats bcs ON bsr.isbn = bcs.isbn
+                LEFT JOIN Subject s_main   ON bsr.primary_subject_id = s_main.subject_id
+                WHERE bsr.isbn IN (""" + placeholders + """)
             """
-            # parameters: search_term x4, subject_id x2 (MySQL will handle NULL)
-            params = [
-                search_term, search_term or '',
-                search_term or '', search_term or '',
-                subject_id, subject_id
-            ]
-            cur.execute(sql, params)
-            books = cur.fetchall()
-    finally:
-        conn.close()
+            cur.execute(sql, isbns)
+            by_isbn = {row['isbn']: row for row in cur.fetchall()}
+            # Keep the stage 1 ordering (relevance / popularity)
+            books = [by_isbn[isbn] for isbn in isbns if isbn in by_isbn]
     
-    return render_template("books.html", books=books, subjects=subjects, search=search, selected_subject=subject)
+    return render_template("books.html", books=books, subjects=subjects, search=search, selected_subject=subject,
+                           page=page, page_size=page_size, has_next=has_next)
 
 # -----------------------------
 # Book Details
@@ -346,43 +357,51 @@ def book_detail(isbn):
     book = None
     copies = []
     
-    try:
-        with conn.cursor() as cur:
-            # Get book details
-            cur.execute("""
-                SELECT 
-                    b.isbn,
-                    b.title,
-                    b.pub_year,
-                    p.name AS publisher_name,
-                    GROUP_CONCAT(DISTINCT CONCAT(a.first_name, ' ', a.last_name) SEPARATOR ', ') AS authors,
-                    GROUP_CONCAT(DISTINCT s.name SEPARATOR ', ') AS subjects
-                FROM Book b
-                LEFT JOIN Publisher p ON b.publisher_id = p.publisher_id
-                LEFT JOIN BookAuthor ba ON b.isbn = ba.isbn
-                LEFT JOIN Author a ON ba.author_id = a.author_id
-                LEFT JOIN BookSubject bs ON b.isbn = bs.isbn
-                LEFT JOIN Subject s ON bs.subject_id = s.subject_id
-                WHERE b.isbn = %s
-                GROUP BY b.isbn, b.title, b.pub_year, p.name
-            """, (isbn,))
-            book = cur.fetchone()
-            
-            # Get copy locations
-            cur.execute("""
-                SELECT copy_id, barcode, branch_name, checkin_term
-                FROM vw_copy_location
-                WHERE isbn = %s
-            """, (isbn,))
-            copies = cur.fetchall()
-    finally:
-        conn.close()
+    with conn.cursor() as cur:
+        # Get book details
+        cur.execute("""
+            SELECT 
+                b.isbn,
+                b.title,
+                b.pub_year,
+                p.name AS publisher_name,
+                GROUP_CONCAT(DISTINCT CONCAT(a.first_name, ' ', a.last_name) SEPARATOR ', ') AS authors,
+                GROUP_CONCAT(DISTINCT s.name SEPARATOR ', ') AS subjects
+            FROM Book b
+            LEFT JOIN Publisher p ON b.publisher_id = p.publisher_id
+            LEFT JOIN BookAuthor ba ON b.isbn = ba.isbn
+            LEFT JOIN Author a ON ba.author_id = a.author_id
+            LEFT JOIN BookSubject bs ON b.isbn = bs.isbn
+            LEFT JOIN Subject s ON bs.subject_id = s.subject_id
+            WHERE b.isbn = %s
+            GROUP BY b.isbn, b.title, b.pub_year, p.name
+        """, (isbn,))
+        book = cur.fetchone()
+        
+        # Get copy locations and availability
+        cur.execute("""
+            SELECT copy_id, barcode, branch_name, checkin_term, status
+            FROM vw_copy_location
+            WHERE isbn = %s
+        """, (isbn,))
+        copies = cur.fetchall()
     
     return render_template("book_detail.html", book=book, copies=copies)
 
 # -----------------------------
 # Patrons - Enhanced
 # -----------------------------
+PATRONS_DEFAULT_PAGE_SIZE = 50
+PATRONS_MAX_PAGE_SIZE = 500
+
+def decode_patron_cursor(token):
+    """Return (risk_rank, patron_id) for a cursor token, or None if it is invalid"""
+    try:
+        risk_rank, patron_id = token.split('_')
+        return int(risk_rank), int(patron_id)
+    except ValueError:
+        return None
+
 @app.route("/patrons", methods=["GET", "POST"])
 def patrons():
     if request.method == "POST":
@@ -394,86 +413,83 @@ def patrons():
 
         if first_name and last_name and patron_type:
             conn = get_connection()
-            try:
-                with conn.cursor() as cur:
-                    sql = """
-                        INSERT INTO Patron (patron_id, first_name, last_name, email, patron_type, address_id, balance)
-                        VALUES (
-                            (SELECT COALESCE(MAX(patron_id), 0) + 1 FROM Patron p2),
-                            %s, %s, %s, %s, %s, 0.00
-                        )
-                    """
-                    cur.execute(sql, (first_name, last_name, email, patron_type, address_id or None))
-                conn.commit()
-            finally:
-                conn.close()
+            patron_id = allocate_ids(conn, "patron")
+
+            def add_patron(cur):
+                sql = """
+                    INSERT INTO Patron (patron_id, first_name, last_name, email, patron_type, address_id, balance)
+                    VALUES (%s, %s, %s, %s, %s, %s, 0.00)
+                """
+                cur.execute(sql, (patron_id, first_name, last_name, email, patron_type, address_id or None))
+
+            run_transaction(conn, add_patron)
+            result_cache.invalidate("Patron")
 
         return redirect(url_for("patrons"))
 
-    # GET: show list of patrons with activity & risk profile
+    # GET: show list of patrons with activity & risk profile (PatronActivity),
+    # keyset-paginated on (risk_rank, patron_id)
+    page_size = request.args.get('page_size', PATRONS_DEFAULT_PAGE_SIZE, type=int)
+    page_size = max(1, min(page_size, PATRONS_MAX_PAGE_SIZE))
+    cursor = request.args.get('cursor', '')
+    position = decode_patron_cursor(cursor) if cursor else None
+
     conn = get_connection()
     patrons = []
-    try:
-        with conn.cursor() as cur:
-            cur.execute("""
-                WITH LoanAgg AS (
-                  SELECT
-                    p.patron_id,
-                    COUNT(l.loan_id) AS total_loans,
-                    SUM(CASE WHEN l.return_ts IS NULL THEN 1 ELSE 0 END) AS active_loans,
-                    SUM(CASE WHEN l.return_ts IS NULL AND l.due_ts < CURDATE() THEN 1 ELSE 0 END)
-                      AS overdue_loans,
-                    MAX(l.loan_ts) AS last_loan_ts
-                  FROM Patron p
-                  LEFT JOIN Loan l ON p.patron_id = l.patron_id
-                  GROUP BY p.patron_id
-                ),
-                FineAgg AS (
-                  SELECT
-                    patron_id,
-                    COALESCE(SUM(amount), 0) AS total_fines,
-                    COALESCE(SUM(CASE WHEN status = 'Unpaid' THEN amount ELSE 0 END), 0) AS unpaid_fines
-                  FROM Fine
-                  GROUP BY patron_id
-                )
-                SELECT
-                  p.patron_id,
-                  p.first_name,
-                  p.last_name,
-                  p.email,
-                  p.patron_type,
-                  p.balance,
-                  COALESCE(la.total_loans, 0) AS total_loans,
-                  COALESCE(la.active_loans, 0) AS active_loans,
-                  COALESCE(la.overdue_loans, 0) AS overdue_loans,
-                  la.last_loan_ts,
-                  COALESCE(fa.total_fines, 0)   AS total_fines,
-                  COALESCE(fa.unpaid_fines, 0)  AS unpaid_fines,
-                  CASE
-                    WHEN COALESCE(fa.unpaid_fines, 0) >= 50
-                       OR COALESCE(la.overdue_loans, 0) >= 3
-                    THEN 'HIGH'
-                    WHEN COALESCE(fa.unpaid_fines, 0) BETWEEN 10 AND 49
-                       OR COALESCE(la.overdue_loans, 0) BETWEEN 1 AND 2
-                    THEN 'MEDIUM'
-                    ELSE 'LOW'
-                  END AS risk_level
-                FROM Patron p
-                LEFT JOIN LoanAgg la ON p.patron_id = la.patron_id
-                LEFT JOIN FineAgg fa ON p.patron_id = fa.patron_id
-                ORDER BY
-                  CASE risk_level
-                    WHEN 'HIGH' THEN 1
-                    WHEN 'MEDIUM' THEN 2
-                    ELSE 3
-                  END,
-                  p.patron_id
-            """)
-            patrons = cur.fetchall()
-    finally:
-        conn.close()
-
-    return render_template("patrons.html", patrons=patrons)
+    with conn.cursor() as cur:
+        where = ""
+        params = []
+        if position:
+            where = "WHERE pa.risk_rank > %s OR (pa.risk_rank = %s AND pa.patron_id > %s)"
+            params = [position[0], position[0], position[1]]
+        cur.execute("""
+            SELECT
+              p.patron_id,
+              p.first_name,
+              p.last_name,
+              p.email,
+              p.patron_type,
+              p.balance,
+              pa.total_loans,
+              pa.active_loans,
+              pa.overdue_loans,
+              pa.last_loan_ts,
+              pa.total_fines,
+              pa.unpaid_fines,
+              pa.risk_level,
+              pa.risk_rank
+            FROM PatronActivity pa
+            JOIN Patron p ON pa.patron_id = p.patron_id
+            """ + where + """
+            ORDER BY pa.risk_rank, pa.patron_id
+            LIMIT %s
+        """, params + [page_size + 1])
+        patrons = cur.fetchall()
+
+    next_cursor = None
+    if len(patrons) > page_size:
+        patrons = patrons[:page_size]
+        next_cursor = "%d_%d" % (patrons[-1]['risk_rank'], patrons[-1]['patron_id'])
+
+    return render_template("patrons.html", patrons=patrons,
+                           page_size=page_size, cursor=cursor, next_cursor=next_cursor)
+
+@app.route("/patrons/import", methods=["POST"])
+def import_patrons_upload():
+    """Bulk-load patrons from an uploaded CSV/NDJSON file (or the raw request body)"""
+    upload = request.files.get('file')
+    filename = upload.filename if upload else ''
+    fmt = request.args.get('format') or (filename.rsplit('.', 1)[-1].lower() if '.' in filename else '')
+    if not fmt:
+        fmt = 'ndjson' if 'ndjson' in (request.mimetype or '') else 'csv'
+    if fmt not in IMPORT_FORMATS:
+        return jsonify(error="format must be one of: %s" % ", ".join(IMPORT_FORMATS)), 400
+
+    stream = text_stream(upload.stream if upload else request.stream)
+    report = import_patrons(get_connection(), read_rows(stream, fmt))
+    if report.inserted:
+        result_cache.invalidate("Patron")
+    return jsonify(report.to_dict()), 200 if not report.failed else 207
 
 # -----------------------------
 # Patron Details
@@ -481,152 +497,420 @@ def patrons():
 @app.route("/patron/<int:patron_id>")
 def patron_detail(patron_id):
     conn = get_connection()
-    patron = None
-    loans = []
-    fines = None
-    
-    try:
-        with conn.cursor() as cur:
-            # Get patron info
-            cur.execute("""
-                SELECT p.*, ps.total_fines, ps.unpaid_fines
-                FROM Patron p
-                LEFT JOIN vw_patron_fines_summary ps ON p.patron_id = ps.patron_id
-                WHERE p.patron_id = %s
-            """, (patron_id,))
-            patron = cur.fetchone()
-            
-            # Get loan history
-            cur.execute("""
-                SELECT loan_id, copy_id, barcode, isbn, title, loan_ts, due_ts, return_ts, loan_status
-                FROM vw_patron_loans_with_status
-                WHERE patron_id = %s
-                ORDER BY loan_ts DESC
-            """, (patron_id,))
-            loans = cur.fetchall()
-            
-            # Get fines summary
-            cur.execute("""
-                SELECT total_fines, unpaid_fines
-                FROM vw_patron_fines_summary
-                WHERE patron_id = %s
-            """, (patron_id,))
-            fines = cur.fetchone()
-    finally:
-        conn.close()
-    
-    return render_template("patron_detail.html", patron=patron, loans=loans, fines=fines)
+
+    # Patron info, loan history and fines summary are independent lookups
+    results = page_executor.run({
+        'patron': Query("""
+            SELECT p.*, ps.total_fines, ps.unpaid_fines
+            FROM Patron p
+            LEFT JOIN vw_patron_fines_summary ps ON p.patron_id = ps.patron_id
+            WHERE p.patron_id = %s
+        """, (patron_id,), one=True),
+        'loans': Query("""
+            SELECT loan_id, copy_id, barcode, isbn, title, loan_ts, due_ts, return_ts, loan_status
+            FROM vw_patron_loans_with_status
+            WHERE patron_id = %s
+            ORDER BY loan_ts DESC
+        """, (patron_id,)),
+        'fines': Query("""
+            SELECT total_fines, unpaid_fines
+            FROM vw_patron_fines_summary
+            WHERE patron_id = %s
+        """, (patron_id,), one=True),
+    }, conn=conn)
+
+    return render_template("patron_detail.html", patron=results['patron'],
+                           loans=results['loans'], fines=results['fines'])
 
 # -----------------------------
 # Loans Management
 # -----------------------------
+# Status filters pushed down to sargable predicates on the Loan base columns
+LOAN_STATUS_PREDICATES = {
+    'all': "1 = 1",
+    'current': "l.return_ts IS NULL AND l.due_ts >= CURDATE()",
+    'overdue': "l.return_ts IS NULL AND l.due_ts < CURDATE()",
+    'returned': "l.return_ts IS NOT NULL",
+}
+LOANS_DEFAULT_PAGE_SIZE = 50
+LOANS_MAX_PAGE_SIZE = 500
+
+def encode_loan_cursor(loan):
+    """Keyset cursor for the (loan_ts, loan_id) position of a loan row"""
+    return "%s_%d" % (loan['loan_ts'].strftime('%Y%m%d%H%M%S'), loan['loan_id'])
+
+def decode_loan_cursor(token):
+    """Return (loan_ts, loan_id) for a cursor token, or None if it is invalid"""
+    try:
+        ts, loan_id = token.split('_')
+        return datetime.strptime(ts, '%Y%m%d%H%M%S'), int(loan_id)
+    except (AttributeError, ValueError):
+        return None
+
 @app.route("/loans")
 def loans():
     filter_type = request.args.get('filter', 'all')  # all, current, overdue, returned
-    
+    if filter_type not in LOAN_STATUS_PREDICATES:
+        filter_type = 'all'
+    page_size = request.args.get('page_size', LOANS_DEFAULT_PAGE_SIZE, type=int)
+    page_size = max(1, min(page_size, LOANS_MAX_PAGE_SIZE))
+    cursor = request.args.get('cursor', '')
+    position = decode_loan_cursor(cursor) if cursor else None
+
     conn = get_connection()
     loans = []
     
-    try:
-        with conn.cursor() as cur:
-            # Map filter_type to status_filter used in updated_complex_query.sql
-            status_filter = 'ALL'
-            if filter_type == 'current':
-                status_filter = 'CURRENT'
-            elif filter_type == 'overdue':
-                status_filter = 'OVERDUE'
-            elif filter_type == 'returned':
-                status_filter = 'RETURNED'
+    with conn.cursor() as cur:
+        # Keyset pagination on (loan_ts, loan_id): only the requested page of
+        # loans is read, then enriched and compared with each patron's average.
+        where = [LOAN_STATUS_PREDICATES[filter_type]]
+        params = []
+        if position:
+            where.append("(l.loan_ts < %s OR (l.loan_ts = %s AND l.loan_id < %s))")
+            params += [position[0], position[0], position[1]]
+        params.append(page_size + 1)
 
-            sql = """
-                WITH LoanEnriched AS (
-                  SELECT
-                    l.loan_id,
-                    l.copy_id,
-                    l.patron_id,
-                    c.barcode,
-                    b.isbn,
-                    b.title,
-                    br.branch_id,
-                    br.name AS branch_name,
-                    l.loan_ts,
-                    l.due_ts,
-                    l.return_ts,
-                    CASE
-                      WHEN l.return_ts IS NOT NULL THEN 'RETURNED'
-                      WHEN l.due_ts < CURDATE()   THEN 'OVERDUE'
-                      ELSE 'CURRENT'
-                    END AS status,
-                    DATEDIFF(COALESCE(l.return_ts, CURDATE()), DATE(l.loan_ts)) AS duration_days
-                  FROM Loan l
-                  JOIN Copy  c ON l.copy_id   = c.copy_id
-                  JOIN Book  b ON c.isbn      = b.isbn
-                  JOIN Branch br ON c.branch_id = br.branch_id
-                ),
-                PatronLoanStats AS (
-                  SELECT
-                    patron_id,
-                    AVG(duration_days) AS avg_duration_per_patron
-                  FROM LoanEnriched
-                  GROUP BY patron_id
-                )
-                SELECT
-                  le.loan_id,
-                  le.patron_id,
-                  CONCAT(p.first_name, ' ', p.last_name) AS patron_name,
-                  le.barcode,
-                  le.isbn,
-                  le.title,
-                  le.branch_name,
-                  le.loan_ts,
-                  le.due_ts,
-                  le.return_ts,
-                  le.status,
-                  le.duration_days,
-                  pls.avg_duration_per_patron,
-                  CASE
-                    WHEN le.duration_days > pls.avg_duration_per_patron THEN 'LONGER THAN USUAL'
-                    WHEN le.duration_days < pls.avg_duration_per_patron THEN 'SHORTER THAN USUAL'
-                    ELSE 'TYPICAL'
-                  END AS duration_vs_usual
-                FROM LoanEnriched le
-                JOIN Patron p ON le.patron_id = p.patron_id
-                LEFT JOIN PatronLoanStats pls ON le.patron_id = pls.patron_id
-                WHERE
-                  %s = 'ALL'
-                  OR (%s = 'CURRENT'  AND le.status = 'CURRENT')
-                  OR (%s = 'OVERDUE'  AND le.status = 'OVERDUE')
-                  OR (%s = 'RETURNED' AND le.status = 'RETURNED')
-                ORDER BY le.loan_ts DESC
-                LIMIT 200;
-            """
-            params = [status_filter, status_filter, status_filter, status_filter]
-            cur.execute(sql, params)
-            loans = cur.fetchall()
-    finally:
-        conn.close()
+        sql = """
+            WITH PageLoans AS (
+              SELECT
+                l.loan_id,
+                l.copy_id,
+                l.patron_id,
+                l.loan_ts,
+                l.due_ts,
+                l.return_ts
+              FROM Loan l
+              WHERE """ + " AND ".join(where) + """
+              ORDER BY l.loan_ts DESC, l.loan_id DESC
+              LIMIT %s
+            ),
+            PatronLoanStats AS (
+              SELECT
+                l.patron_id,
+                AVG(DATEDIFF(COALESCE(l.return_ts, CURDATE()), DATE(l.loan_ts))) AS avg_duration_per_patron
+              FROM Loan l
+              WHERE l.patron_id IN (SELECT patron_id FROM PageLoans)
+              GROUP BY l.patron_id
+            ),
+            LoanEnriched AS (
+              SELECT
+                pl.loan_id,
+                pl.patron_id,
+                c.barcode,
+                b.isbn,
+                b.title,
+                br.name AS branch_name,
+                pl.loan_ts,
+                pl.due_ts,
+                pl.return_ts,
+                CASE
+                  WHEN pl.return_ts IS NOT NULL THEN 'RETURNED'
+                  WHEN pl.due_ts < CURDATE()    THEN 'OVERDUE'
+                  ELSE 'CURRENT'
+                END AS status,
+                DATEDIFF(COALESCE(pl.return_ts, CURDATE()), DATE(pl.loan_ts)) AS duration_days
+              FROM PageLoans pl
+              JOIN Copy  c ON pl.copy_id   = c.copy_id
+              JOIN Book  b ON c.isbn       = b.isbn
+              JOIN Branch br ON c.branch_id = br.branch_id
+            )
+            SELECT
+              le.loan_id,
+              le.patron_id,
+              CONCAT(p.first_name, ' ', p.last_name) AS patron_name,
+              le.barcode,
+              le.isbn,
+              le.title,
+              le.branch_name,
+              le.loan_ts,
+              le.due_ts,
+              le.return_ts,
+              le.status,
+              le.duration_days,
+              pls.avg_duration_per_patron,
+              CASE
+                WHEN le.duration_days > pls.avg_duration_per_patron THEN 'LONGER THAN USUAL'
+                WHEN le.duration_days < pls.avg_duration_per_patron THEN 'SHORTER THAN USUAL'
+                ELSE 'TYPICAL'
+              END AS duration_vs_usual
+            FROM LoanEnriched le
+            JOIN Patron p ON le.patron_id = p.patron_id
+            LEFT JOIN PatronLoanStats pls ON le.patron_id = pls.patron_id
+            ORDER BY le.loan_ts DESC, le.loan_id DESC;
+        """
+        cur.execute(sql, params)
+        loans = cur.fetchall()
+
+    # The extra row only tells us whether another page exists
+    next_cursor = None
+    if len(loans) > page_size:
+        loans = loans[:page_size]
+        next_cursor = encode_loan_cursor(loans[-1])
     
-    return render_template("loans.html", loans=loans, filter_type=filter_type)
+    return render_template("loans.html", loans=loans, filter_type=filter_type,
+                           page_size=page_size, cursor=cursor, next_cursor=next_cursor)
+
+# -----------------------------
+# Circulation - checkout / return / renew (JSON API)
+# -----------------------------
+def payload_id(payload, name):
+    """``payload[name]`` as a positive integer id, or None if missing or malformed
+
+    MySQL would coerce a string such as "12abc" to 12 when comparing it with
+    an INT column, so ids are checked here rather than left to the database.
+    """
+    value = payload.get(name)
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value if value > 0 else None
+    if isinstance(value, str) and re.fullmatch(r"\s*[0-9]+\s*", value):
+        return int(value) or None
+    return None
+
+# Each accepts {"barcode": ...} or, for a self-check kiosk, {"barcodes": [...]};
+# checkout also needs "patron_id". Batches run one short transaction per item.
+CIRCULATION_MAX_BATCH = 50
+
+def circulation_payload():
+    """Return (payload, barcodes, error); barcodes is None for a single item"""
+    payload = request.get_json(silent=True) or request.form
+    barcodes = payload.get('barcodes')
+    if barcodes is None and hasattr(payload, 'getlist') and len(payload.getlist('barcode')) > 1:
+        barcodes = payload.getlist('barcode')
+    if barcodes is None:
+        return payload, None, None
+    # A bare string would otherwise be walked one character at a time
+    if not isinstance(barcodes, list) or not barcodes or not all(
+            isinstance(barcode, str) and barcode.strip() for barcode in barcodes):
+        return payload, None, "barcodes must be a non-empty list of barcode strings"
+    if len(barcodes) > CIRCULATION_MAX_BATCH:
+        return payload, None, f"at most {CIRCULATION_MAX_BATCH} barcodes per request"
+    return payload, barcodes, None
+
+def circulation_response(operation, batch=False):
+    """Run a circulation operation and shape its JSON reply"""
+    try:
+        result = operation(get_connection())
+    except circulation.CirculationError as exc:
+        return jsonify(exc.to_dict()), exc.status
+    # Returns and checkouts also move holds along their queues
+    if not batch:
+        result_cache.invalidate("Loan")
+        result_cache.invalidate("Reservation")
+        return jsonify(result)
+    if any(r['ok'] for r in result):
+        result_cache.invalidate("Loan")
+        result_cache.invalidate("Reservation")
+    return jsonify(results=result), 200 if all(r['ok'] for r in result) else 207
+
+@app.route("/circulation/checkout", methods=["POST"])
+def circulation_checkout():
+    payload, barcodes, error = circulation_payload()
+    if error:
+        return jsonify(ok=False, error="bad_request", message=error), 400
+    patron_id = payload_id(payload, 'patron_id')
+    if patron_id is None or (barcodes is None and not payload.get('barcode')):
+        return jsonify(ok=False, error="bad_request",
+                       message="an integer patron_id and barcode(s) are required"), 400
+    if barcodes is not None:
+        return circulation_response(
+            lambda conn: circulation.checkout_many(conn, patron_id, barcodes), batch=True)
+
+    def checkout_one(conn):
+        circulation.check_patron(conn, patron_id)
+        return circulation.checkout(conn, patron_id, payload['barcode'])
+
+    return circulation_response(checkout_one)
+
+@app.route("/circulation/return", methods=["POST"])
+def circulation_return():
+    payload, barcodes, error = circulation_payload()
+    if error:
+        return jsonify(ok=False, error="bad_request", message=error), 400
+    if barcodes is None and not payload.get('barcode'):
+        return jsonify(ok=False, error="bad_request", message="barcode(s) required"), 400
+    if barcodes is not None:
+        return circulation_response(lambda conn: circulation.return_many(conn, barcodes), batch=True)
+    return circulation_response(lambda conn: circulation.return_copy(conn, payload['barcode']))
+
+@app.route("/circulation/renew", methods=["POST"])
+def circulation_renew():
+    payload, barcodes, error = circulation_payload()
+    if error:
+        return jsonify(ok=False, error="bad_request", message=error), 400
+    if barcodes is None and not payload.get('barcode'):
+        return jsonify(ok=False, error="bad_request", message="barcode(s) required"), 400
+    if barcodes is not None:
+        return circulation_response(lambda conn: circulation.renew_many(conn, barcodes), batch=True)
+    return circulation_response(lambda conn: circulation.renew(conn, payload['barcode']))
+
+# -----------------------------
+# Holds - place / status / cancel (JSON API)
+# -----------------------------
+# Holds queue per (isbn, branch); returns hand the copy to the head of the
+# queue (see holds.py), so a hold's position is read from its queue alone
+def hold_response(operation, writes=False):
+    """Run a hold operation and shape its JSON reply"""
+    try:
+        result = operation(get_connection())
+    except holds.HoldError as exc:
+        return jsonify(exc.to_dict()), exc.status
+    if writes:
+        result_cache.invalidate("Reservation")
+    return jsonify(result)
+
+@app.route("/holds", methods=["POST"])
+def hold_place():
+    payload = request.get_json(silent=True) or request.form
+    patron_id = payload_id(payload, 'patron_id')
+    isbn = payload.get('isbn')
+    branch_id = payload_id(payload, 'branch_id')
+    if patron_id is None or not isbn or branch_id is None:
+        return jsonify(ok=False, error="bad_request",
+                       message="isbn and integer patron_id and branch_id are required"), 400
+    return hold_response(lambda conn: holds.place_hold(conn, patron_id, isbn, branch_id), writes=True)
+
+@app.route("/holds/<int:reservation_id>")
+def hold_detail(reservation_id):
+    """A hold's status, with its queue position and estimated wait while queued"""
+    return hold_response(lambda conn: holds.hold_status(conn, reservation_id))
+
+@app.route("/holds/<int:reservation_id>/cancel", methods=["POST"])
+def hold_cancel(reservation_id):
+    return hold_response(lambda conn: holds.cancel_hold(conn, reservation_id), writes=True)
+
+# -----------------------------
+# Inter-library loans - create / status (JSON API)
+# -----------------------------
+# New requests wait as 'Requested' until `flask dispatch-ill` sends them to
+# their partner library in batches (see ill.py)
+def ill_response(operation):
+    """Run an ILL operation and shape its JSON reply"""
+    try:
+        return jsonify(operation(get_connection()))
+    except ill.IllError as exc:
+        return jsonify(exc.to_dict()), exc.status
+
+@app.route("/ill/requests", methods=["POST"])
+def ill_request_create():
+    payload = request.get_json(silent=True) or request.form
+    patron_id = payload_id(payload, 'patron_id')
+    partner_id = payload_id(payload, 'partner_id')
+    isbn = payload.get('isbn')
+    if patron_id is None or partner_id is None or not isbn:
+        return jsonify(ok=False, error="bad_request",
+                       message="isbn and integer patron_id and partner_id are required"), 400
+    return ill_response(lambda conn: ill.create_request(conn, patron_id, partner_id, isbn))
+
+@app.route("/ill/requests/<int:request_id>")
+def ill_request_detail(request_id):
+    return ill_response(lambda conn: ill.get_request(conn, request_id))
+
+@app.route("/ill/requests/<int:request_id>/status", methods=["POST"])
+def ill_request_status(request_id):
+    payload = request.get_json(silent=True) or request.form
+    if not payload.get('status'):
+        return jsonify(ok=False, error="bad_request", message="status is required"), 400
+    return ill_response(lambda conn: ill.set_status(conn, request_id, payload['status']))
+
+# -----------------------------
+# E-resource access sessions - start / heartbeat / end (JSON API)
+# -----------------------------
+# Seats are counted per resource in EResourceSeat by the AccessSession
+# triggers; clients heartbeat at least every STALE_AFTER_S seconds
+session_metrics = eresource_sessions.SessionMetrics()
+
+def session_response(operation):
+    """Run a session operation and shape its JSON reply"""
+    try:
+        return jsonify(operation(get_connection()))
+    except eresource_sessions.SessionError as exc:
+        return jsonify(exc.to_dict()), exc.status
+
+@app.route("/sessions/start", methods=["POST"])
+def session_start():
+    payload = request.get_json(silent=True) or request.form
+    patron_id = payload_id(payload, 'patron_id')
+    resource_id = payload_id(payload, 'resource_id')
+    if patron_id is None or resource_id is None:
+        return jsonify(ok=False, error="bad_request",
+                       message="integer patron_id and resource_id are required"), 400
+    return session_response(lambda conn: eresource_sessions.start_session(
+        conn, patron_id, resource_id, metrics=session_metrics))
+
+@app.route("/sessions/heartbeat", methods=["POST"])
+def session_heartbeat():
+    payload = request.get_json(silent=True) or request.form
+    session_id = payload_id(payload, 'session_id')
+    if session_id is None:
+        return jsonify(ok=False, error="bad_request", message="an integer session_id is required"), 400
+    return session_response(lambda conn: eresource_sessions.heartbeat(
+        conn, session_id, metrics=session_metrics))
+
+@app.route("/sessions/end", methods=["POST"])
+def session_end():
+    payload = request.get_json(silent=True) or request.form
+    session_id = payload_id(payload, 'session_id')
+    if session_id is None:
+        return jsonify(ok=False, error="bad_request", message="an integer session_id is required"), 400
+    return session_response(lambda conn: eresource_sessions.end_session(
+        conn, session_id, metrics=session_metrics))
+
+# -----------------------------
+# Copy availability (JSON API)
+# -----------------------------
+# Copy.status is a stored column kept current by the Loan triggers, so these
+# are idx_copy_isbn_status_branch lookups whatever the size of the loan history
+AVAILABLE_COPIES_SQL = """
+    SELECT c.copy_id, c.barcode, c.branch_id, br.name AS branch_name
+    FROM Copy c
+    JOIN Branch br ON c.branch_id = br.branch_id
+    WHERE c.isbn = %s
+      AND c.status = 'AVAILABLE'
+      AND {where}
+    ORDER BY c.branch_id, c.copy_id
+"""
+
+@app.route("/availability/<isbn>")
+def copy_availability(isbn):
+    """Available copies of a book, at ``?branch_id=X`` or everywhere"""
+    branch_id = request.args.get('branch_id', type=int)
+    where, params = "TRUE", [isbn]
+    if branch_id is not None:
+        where = "c.branch_id = %s"
+        params.append(branch_id)
+    with get_connection().cursor() as cur:
+        cur.execute(AVAILABLE_COPIES_SQL.format(where=where), params)
+        copies = cur.fetchall()
+    return jsonify(isbn=isbn, branch_id=branch_id, available_copies=len(copies), copies=copies)
+
+@app.route("/availability/<isbn>/nearest")
+def nearest_available(isbn):
+    """The branch nearest to ``?branch_id=X`` with an available copy of the book"""
+    branch_id = request.args.get('branch_id', type=int)
+    if branch_id is None:
+        return jsonify(ok=False, error="bad_request", message="branch_id is required"), 400
+    with get_connection().cursor() as cur:
+        cur.execute(*QUERIES.bind("nearest-available", isbn=isbn, branch_id=branch_id))
+        branch = cur.fetchone()
+    if branch is None:
+        return jsonify(ok=False, error="none_available",
+                       message="No available copy of %s near branch %s" % (isbn, branch_id)), 404
+    return jsonify(ok=True, isbn=isbn, from_branch_id=branch_id, **branch)
 
 # -----------------------------
 # Fines Management
 # -----------------------------
+
 @app.route("/fines")
 def fines():
     conn = get_connection()
     fines_list = []
     
-    try:
-        with conn.cursor() as cur:
-            cur.execute("""
-                SELECT patron_id, first_name, last_name, email, total_fines, unpaid_fines
-                FROM vw_patron_fines_summary
-                WHERE unpaid_fines > 0
-                ORDER BY unpaid_fines DESC
-            """)
-            fines_list = cur.fetchall()
-    finally:
-        conn.close()
+    with conn.cursor() as cur:
+        cur.execute(*QUERIES.bind("fines"))
+        fines_list = cur.fetchall()
     
     return render_template("fines.html", fines_list=fines_list)
 
@@ -636,39 +920,38 @@ def fines():
 @app.route("/statistics")
 def statistics():
     conn = get_connection()
-    top_books = []
-    top_patrons = []
-    
-    try:
-        with conn.cursor() as cur:
-            # Top 10 most popular books
-            cur.execute("""
-                SELECT b.isbn, b.title, COUNT(l.loan_id) AS times_loaned
-                FROM Book b
-                JOIN Copy c ON b.isbn = c.isbn
-                JOIN Loan l ON c.copy_id = l.copy_id
-                GROUP BY b.isbn, b.title
-                ORDER BY times_loaned DESC, b.title
-                LIMIT 10
-            """)
-            top_books = cur.fetchall()
-            
-            # Top 10 patrons by loans
-            cur.execute("""
-                SELECT p.patron_id,
-                       CONCAT(p.first_name, ' ', p.last_name) AS patron_name,
-                       COUNT(l.loan_id) AS loan_count
-                FROM Patron p
-                LEFT JOIN Loan l ON p.patron_id = l.patron_id
-                GROUP BY p.patron_id, patron_name
-                ORDER BY loan_count DESC
-                LIMIT 10
-            """)
-            top_patrons = cur.fetchall()
-    finally:
-        conn.close()
-    
-    return render_template("statistics.html", top_books=top_books, top_patrons=top_patrons)
+
+    results = page_executor.run({
+        # Top 10 most popular books. Only books loaned at least as often as
+        # the 10th most borrowed can qualify, so the filesort stays tiny.
+        'top_books': Query("""
+            SELECT b.isbn, b.title, bcs.times_loaned
+            FROM BookCirculationStats bcs
+            JOIN Book b ON bcs.isbn = b.isbn
+            WHERE bcs.times_loaned > 0
+              AND bcs.times_loaned >= COALESCE((
+                SELECT times_loaned
+                FROM BookCirculationStats
+                ORDER BY times_loaned DESC
+                LIMIT 9, 1
+              ), 0)
+            ORDER BY bcs.times_loaned DESC, b.title
+            LIMIT 10
+        """),
+        # Top 10 patrons by loans, walking idx_patronactivity_loans
+        'top_patrons': Query("""
+            SELECT p.patron_id,
+                   CONCAT(p.first_name, ' ', p.last_name) AS patron_name,
+                   pa.total_loans AS loan_count
+            FROM PatronActivity pa
+            JOIN Patron p ON pa.patron_id = p.patron_id
+            ORDER BY pa.total_loans DESC
+            LIMIT 10
+        """),
+    }, conn=conn)
+
+    return render_template("statistics.html", top_books=results['top_books'],
+                           top_patrons=results['top_patrons'])
 
 # -----------------------------
 # Analytics - Complex Queries
@@ -681,421 +964,609 @@ def analytics():
 # -----------------------------
 # Q12: Window Functions - Rank patrons by fines within each type
 # -----------------------------
+
 @app.route("/analytics/patron-ranking")
 def patron_ranking():
-    conn = get_connection()
-    rankings = []
-    
-    try:
-        with conn.cursor() as cur:
-            cur.execute("""
-                SELECT
-                  patron_id,
-                  first_name,
-                  last_name,
-                  patron_type,
-                  total_fines,
-                  unpaid_fines,
-                  ROW_NUMBER() OVER (PARTITION BY patron_type ORDER BY total_fines DESC) AS row_num,
-                  RANK() OVER (PARTITION BY patron_type ORDER BY total_fines DESC) AS rank_fines,
-                  DENSE_RANK() OVER (PARTITION BY patron_type ORDER BY total_fines DESC) AS dense_rank_fines
-                FROM vw_patron_fines_summary
-                JOIN Patron p USING (patron_id)
-                WHERE total_fines > 0
-                ORDER BY patron_type, total_fines DESC
-            """)
-            rankings = cur.fetchall()
-    finally:
-        conn.close()
-    
+    rankings = cached_rows("patron-ranking", *QUERIES.bind("patron-ranking"))
+
     return render_template("analytics_patron_ranking.html", rankings=rankings)
 
 # -----------------------------
 # Q14: CTE - Patrons with loans in multiple branches
 # -----------------------------
+
 @app.route("/analytics/multi-branch-patrons")
 def multi_branch_patrons():
-    conn = get_connection()
-    patrons = []
-    
-    try:
-        with conn.cursor() as cur:
-            cur.execute("""
-                WITH PatronBranchLoans AS (
-                  SELECT DISTINCT
-                    l.patron_id,
-                    c.branch_id,
-                    br.name AS branch_name,
-                    COUNT(DISTINCT l.loan_id) AS loans_at_branch
-                  FROM Loan l
-                  JOIN Copy c ON l.copy_id = c.copy_id
-                  JOIN Branch br ON c.branch_id = br.branch_id
-                  GROUP BY l.patron_id, c.branch_id, br.name
-                ),
-                MultiBranchPatrons AS (
-                  SELECT
-                    patron_id,
-                    COUNT(DISTINCT branch_id) AS num_branches,
-                    SUM(loans_at_branch) AS total_loans
-                  FROM PatronBranchLoans
-                  GROUP BY patron_id
-                  HAVING num_branches > 1
-                )
-                SELECT
-                  p.patron_id,
-                  CONCAT(p.first_name, ' ', p.last_name) AS patron_name,
-                  mbp.num_branches,
-                  mbp.total_loans,
-                  GROUP_CONCAT(DISTINCT pbl.branch_name ORDER BY pbl.branch_name SEPARATOR ', ') AS branches_used
-                FROM MultiBranchPatrons mbp
-                JOIN Patron p ON mbp.patron_id = p.patron_id
-                JOIN PatronBranchLoans pbl ON mbp.patron_id = pbl.patron_id
-                GROUP BY p.patron_id, patron_name, mbp.num_branches, mbp.total_loans
-                ORDER BY mbp.num_branches DESC, mbp.total_loans DESC
-            """)
-            patrons = cur.fetchall()
-    finally:
-        conn.close()
-    
+    patrons = cached_rows("multi-branch-patrons", *QUERIES.bind("multi-branch-patrons"))
+
     return render_template("analytics_multi_branch.html", patrons=patrons)
 
 # -----------------------------
 # Q15: Complex CASE - Book popularity categories
 # -----------------------------
+
 @app.route("/analytics/book-popularity")
 def book_popularity():
-    conn = get_connection()
-    categories = []
-    
-    try:
-        with conn.cursor() as cur:
-            cur.execute("""
-                SELECT
-                  CASE
-                    WHEN loan_count = 0 THEN 'Never Loaned'
-                    WHEN loan_count BETWEEN 1 AND 5 THEN 'Low Popularity (1-5 loans)'
-                    WHEN loan_count BETWEEN 6 AND 15 THEN 'Medium Popularity (6-15 loans)'
-                    WHEN loan_count BETWEEN 16 AND 30 THEN 'High Popularity (16-30 loans)'
-                    ELSE 'Very High Popularity (30+ loans)'
-                  END AS popularity_category,
-                  COUNT(*) AS num_books,
-                  AVG(loan_count) AS avg_loans_per_book,
-                  MIN(loan_count) AS min_loans,
-                  MAX(loan_count) AS max_loans,
-                  SUM(loan_count) AS total_loans
-                FROM (
-                  SELECT
-                    b.isbn,
-                    b.title,
-                    COUNT(l.loan_id) AS loan_count
-                  FROM Book b
-                  LEFT JOIN Copy c ON b.isbn = c.isbn
-                  LEFT JOIN Loan l ON c.copy_id = l.copy_id
-                  GROUP BY b.isbn, b.title
-                ) AS book_loans
-                GROUP BY popularity_category
-                ORDER BY 
-                  CASE popularity_category
-                    WHEN 'Never Loaned' THEN 1
-                    WHEN 'Low Popularity (1-5 loans)' THEN 2
-                    WHEN 'Medium Popularity (6-15 loans)' THEN 3
-                    WHEN 'High Popularity (16-30 loans)' THEN 4
-                    ELSE 5
-                  END
-            """)
-            categories = cur.fetchall()
-    finally:
-        conn.close()
-    
+    categories = cached_rows("book-popularity", *QUERIES.bind("book-popularity"))
+
     return render_template("analytics_book_popularity.html", categories=categories)
 
 # -----------------------------
 # Q16: EXISTS - Patrons with reservations but no loans
 # -----------------------------
+
 @app.route("/analytics/reservations-no-loans")
 def reservations_no_loans():
-    conn = get_connection()
-    patrons = []
-    
-    try:
-        with conn.cursor() as cur:
-            cur.execute("""
-                SELECT
-                  p.patron_id,
-                  CONCAT(p.first_name, ' ', p.last_name) AS patron_name,
-                  p.email,
-                  p.patron_type,
-                  COUNT(r.reservation_id) AS active_reservations
-                FROM Patron p
-                JOIN Reservation r ON p.patron_id = r.patron_id
-                WHERE r.status IN ('Active', 'Waiting')
-                  AND NOT EXISTS (
-                    SELECT 1
-                    FROM Loan l
-                    WHERE l.patron_id = p.patron_id
-                  )
-                GROUP BY p.patron_id, patron_name, p.email, p.patron_type
-                ORDER BY active_reservations DESC, patron_name
-            """)
-            patrons = cur.fetchall()
-    finally:
-        conn.close()
-    
+    patrons = cached_rows("reservations-no-loans", *QUERIES.bind("reservations-no-loans"))
+
     return render_template("analytics_reservations_no_loans.html", patrons=patrons)
 
 # -----------------------------
 # Q19: Self-Join - Repeat borrowers of same book
 # -----------------------------
+
 @app.route("/analytics/repeat-borrowers")
 def repeat_borrowers():
-    conn = get_connection()
-    borrowers = []
-    
-    try:
-        with conn.cursor() as cur:
-            cur.execute("""
-                SELECT
-                  p.patron_id,
-                  CONCAT(p.first_name, ' ', p.last_name) AS patron_name,
-                  b.isbn,
-                  b.title,
-                  COUNT(DISTINCT l1.loan_id) AS times_borrowed,
-                  MIN(l1.loan_ts) AS first_loan,
-                  MAX(l1.loan_ts) AS last_loan,
-                  DATEDIFF(MAX(l1.loan_ts), MIN(l1.loan_ts)) AS days_between_first_last
-                FROM Patron p
-                JOIN Loan l1 ON p.patron_id = l1.patron_id
-                JOIN Copy c1 ON l1.copy_id = c1.copy_id
-                JOIN Book b ON c1.isbn = b.isbn
-                GROUP BY p.patron_id, patron_name, b.isbn, b.title
-                HAVING times_borrowed > 1
-                ORDER BY times_borrowed DESC, patron_name, b.title
-            """)
-            borrowers = cur.fetchall()
-    finally:
-        conn.close()
-    
+    borrowers = cached_rows("repeat-borrowers", *QUERIES.bind("repeat-borrowers"))
+
     return render_template("analytics_repeat_borrowers.html", borrowers=borrowers)
 
 # -----------------------------
 # Q23: Fine analysis by reason
 # -----------------------------
+
 @app.route("/analytics/fine-analysis")
 def fine_analysis():
-    conn = get_connection()
-    fine_stats = []
-    
-    try:
-        with conn.cursor() as cur:
-            cur.execute("""
-                SELECT
-                  fr.code AS fine_reason_code,
-                  fr.description AS fine_reason,
-                  COUNT(f.fine_id) AS total_fines,
-                  SUM(f.amount) AS total_amount,
-                  AVG(f.amount) AS avg_amount,
-                  MIN(f.amount) AS min_amount,
-                  MAX(f.amount) AS max_amount,
-                  SUM(CASE WHEN f.status = 'Paid' THEN f.amount ELSE 0 END) AS paid_amount,
-                  SUM(CASE WHEN f.status = 'Unpaid' THEN f.amount ELSE 0 END) AS unpaid_amount,
-                  COUNT(CASE WHEN f.status = 'Paid' THEN 1 END) AS paid_count,
-                  COUNT(CASE WHEN f.status = 'Unpaid' THEN 1 END) AS unpaid_count,
-                  ROUND(
-                    100.0 * COUNT(CASE WHEN f.status = 'Paid' THEN 1 END) / COUNT(f.fine_id),
-                    2
-                  ) AS payment_rate_pct
-                FROM FineReason fr
-                LEFT JOIN Fine f ON fr.reason_id = f.reason_id
-                GROUP BY fr.reason_id, fr.code, fr.description
-                ORDER BY total_amount DESC
-            """)
-            fine_stats = cur.fetchall()
-    finally:
-        conn.close()
-    
+    fine_stats = cached_rows("fine-analysis", *QUERIES.bind("fine-analysis"))
+
     return render_template("analytics_fine_analysis.html", fine_stats=fine_stats)
 
 # -----------------------------
 # Q22: Patron borrowing patterns by subject
 # -----------------------------
+# Reads the trigger-maintained PatronSubjectStats (with the per-patron total
+# in PatronActivity.subject_loans) in idx_patronsubject_order order;
+# {where} narrows it to one patron and/or a keyset page
+SUBJECT_PATTERNS_SQL = """
+    SELECT
+      ps.patron_id,
+      CONCAT(p.first_name, ' ', p.last_name) AS patron_name,
+      p.patron_type,
+      ps.subject_id,
+      s.name AS subject_name,
+      ps.loan_count,
+      ps.unique_books,
+      ROUND(100.0 * ps.loan_count / pa.subject_loans, 2) AS pct_of_total_loans
+    FROM PatronSubjectStats ps
+    JOIN PatronActivity pa ON ps.patron_id = pa.patron_id
+    JOIN Patron p ON ps.patron_id = p.patron_id
+    JOIN Subject s ON ps.subject_id = s.subject_id
+    WHERE pa.subject_loans >= 5
+      AND {where}
+    ORDER BY ps.patron_id, ps.loan_count DESC, ps.subject_id
+"""
+
+SUBJECT_PATTERNS_DEFAULT_PAGE_SIZE = 100
+SUBJECT_PATTERNS_MAX_PAGE_SIZE = 500
+
+def decode_subject_cursor(token):
+    """Return (patron_id, loan_count, subject_id) for a cursor token, or None if it is invalid"""
+    try:
+        patron_id, loan_count, subject_id = token.split('_')
+        return int(patron_id), int(loan_count), int(subject_id)
+    except ValueError:
+        return None
+
+def subject_patterns_where(patron_id, position=None):
+    """(where, params) for SUBJECT_PATTERNS_SQL: one patron and/or rows after ``position``"""
+    where = []
+    params = []
+    if patron_id:
+        where.append("ps.patron_id = %s")
+        params.append(patron_id)
+    if position:
+        where.append("(ps.patron_id > %s OR (ps.patron_id = %s AND "
+                     "(ps.loan_count < %s OR (ps.loan_count = %s AND ps.subject_id > %s))))")
+        params.extend([position[0], position[0], position[1], position[1], position[2]])
+    return " AND ".join(where) or "TRUE", params
+
 @app.route("/analytics/subject-patterns")
 def subject_patterns():
     patron_id = request.args.get('patron_id', '')
-    conn = get_connection()
-    patterns = []
-    
-    try:
-        with conn.cursor() as cur:
-            if patron_id:
-                sql = """
-                    WITH PatronSubjectLoans AS (
-                      SELECT
-                        l.patron_id,
-                        s.subject_id,
-                        s.name AS subject_name,
-                        COUNT(DISTINCT l.loan_id) AS loan_count,
-                        COUNT(DISTINCT b.isbn) AS unique_books
-                      FROM Loan l
-                      JOIN Copy c ON l.copy_id = c.copy_id
-                      JOIN Book b ON c.isbn = b.isbn
-                      JOIN BookSubject bs ON b.isbn = bs.isbn
-                      JOIN Subject s ON bs.subject_id = s.subject_id
-                      WHERE l.patron_id = %s
-                      GROUP BY l.patron_id, s.subject_id, s.name
-                    ),
-                    PatronTotalLoans AS (
-                      SELECT
-                        patron_id,
-                        SUM(loan_count) AS total_loans
-                      FROM PatronSubjectLoans
-                      GROUP BY patron_id
-                    )
-                    SELECT
-                      p.patron_id,
-                      CONCAT(p.first_name, ' ', p.last_name) AS patron_name,
-                      p.patron_type,
-                      psl.subject_name,
-                      psl.loan_count,
-                      psl.unique_books,
-                      ROUND(100.0 * psl.loan_count / ptl.total_loans, 2) AS pct_of_total_loans
-                    FROM PatronSubjectLoans psl
-                    JOIN Patron p ON psl.patron_id = p.patron_id
-                    JOIN PatronTotalLoans ptl ON p.patron_id = ptl.patron_id
-                    WHERE ptl.total_loans >= 5
-                    ORDER BY psl.loan_count DESC
-                """
-                cur.execute(sql, (patron_id,))
-            else:
-                sql = """
-                    WITH PatronSubjectLoans AS (
-                      SELECT
-                        l.patron_id,
-                        s.subject_id,
-                        s.name AS subject_name,
-                        COUNT(DISTINCT l.loan_id) AS loan_count,
-                        COUNT(DISTINCT b.isbn) AS unique_books
-                      FROM Loan l
-                      JOIN Copy c ON l.copy_id = c.copy_id
-                      JOIN Book b ON c.isbn = b.isbn
-                      JOIN BookSubject bs ON b.isbn = bs.isbn
-                      JOIN Subject s ON bs.subject_id = s.subject_id
-                      GROUP BY l.patron_id, s.subject_id, s.name
-                    ),
-                    PatronTotalLoans AS (
-                      SELECT
-                        patron_id,
-                        SUM(loan_count) AS total_loans
-                      FROM PatronSubjectLoans
-                      GROUP BY patron_id
-                    )
-                    SELECT
-                      p.patron_id,
-                      CONCAT(p.first_name, ' ', p.last_name) AS patron_name,
-                      p.patron_type,
-                      psl.subject_name,
-                      psl.loan_count,
-                      psl.unique_books,
-                      ROUND(100.0 * psl.loan_count / ptl.total_loans, 2) AS pct_of_total_loans
-                    FROM PatronSubjectLoans psl
-                    JOIN Patron p ON psl.patron_id = p.patron_id
-                    JOIN PatronTotalLoans ptl ON p.patron_id = ptl.patron_id
-                    WHERE ptl.total_loans >= 5
-                    ORDER BY p.patron_id, psl.loan_count DESC
-                    LIMIT 100
-                """
-                cur.execute(sql)
-            
-            patterns = cur.fetchall()
-    finally:
-        conn.close()
-    
-    return render_template("analytics_subject_patterns.html", patterns=patterns, patron_id=patron_id)
+    page_size = request.args.get('page_size', SUBJECT_PATTERNS_DEFAULT_PAGE_SIZE, type=int)
+    page_size = max(1, min(page_size, SUBJECT_PATTERNS_MAX_PAGE_SIZE))
+    cursor = request.args.get('cursor', '')
+    position = decode_subject_cursor(cursor) if cursor else None
+
+    where, params = subject_patterns_where(patron_id, position)
+    sql = SUBJECT_PATTERNS_SQL.format(where=where) + " LIMIT %s"
+    patterns = cached_rows("subject-patterns", sql, tuple(params) + (page_size + 1,))
+
+    # The extra row only tells us whether another page exists
+    next_cursor = None
+    if len(patterns) > page_size:
+        patterns = patterns[:page_size]
+        last = patterns[-1]
+        next_cursor = "%d_%d_%d" % (last['patron_id'], last['loan_count'], last['subject_id'])
+
+    return render_template("analytics_subject_patterns.html", patterns=patterns, patron_id=patron_id,
+                           page_size=page_size, cursor=cursor, next_cursor=next_cursor)
 
 # -----------------------------
 # Q25: Monthly loans by patron type (PIVOT-like)
 # -----------------------------
+
+def pivot_monthly_loans(rows):
+    """(patron_types, months): one row per month with a count per patron type and a running total"""
+    patron_types = sorted({r['patron_type'] for r in rows})
+    months = []
+    running_total = 0
+    for loan_month, group in itertools.groupby(rows, key=lambda r: r['loan_month']):
+        by_type = {}
+        for r in group:
+            by_type[r['patron_type']] = by_type.get(r['patron_type'], 0) + int(r['loan_count'])
+        total = sum(by_type.values())
+        running_total += total
+        months.append({'loan_month': loan_month, 'by_type': by_type,
+                       'total_loans': total, 'running_total_loans': running_total})
+    return patron_types, months
+
 @app.route("/analytics/monthly-loans")
 def monthly_loans():
-    conn = get_connection()
-    monthly_data = []
-    
-    try:
-        with conn.cursor() as cur:
-            # Use updated_complex_query.sql "STATISTICS – MONTHLY LOAN TRENDS BY PATRON TYPE"
-            cur.execute("""
-                WITH MonthlyTypeLoans AS (
-                  SELECT
-                    DATE_FORMAT(l.loan_ts, '%%Y-%%m') AS loan_month,
-                    p.patron_type
-                  FROM Loan l
-                  JOIN Patron p ON l.patron_id = p.patron_id
-                  WHERE l.loan_ts IS NOT NULL
-                ),
-                MonthlyAgg AS (
-                  SELECT
-                    loan_month,
-                    SUM(CASE WHEN patron_type = 'Student' THEN 1 ELSE 0 END) AS student_loans,
-                    SUM(CASE WHEN patron_type = 'Faculty' THEN 1 ELSE 0 END) AS faculty_loans,
-                    SUM(CASE WHEN patron_type = 'Staff'   THEN 1 ELSE 0 END) AS staff_loans,
-                    SUM(CASE WHEN patron_type = 'Alumni'  THEN 1 ELSE 0 END) AS alumni_loans,
-                    SUM(CASE
-                          WHEN patron_type NOT IN ('Student','Faculty','Staff','Alumni')
-                          THEN 1 ELSE 0
-                        END) AS other_loans,
-                    COUNT(*) AS total_loans
-                  FROM MonthlyTypeLoans
-                  GROUP BY loan_month
-                )
-                SELECT
-                  loan_month,
-                  student_loans,
-                  faculty_loans,
-                  staff_loans,
-                  alumni_loans,
-                  other_loans,
-                  total_loans,
-                  SUM(total_loans) OVER (ORDER BY loan_month) AS running_total_loans
-                FROM MonthlyAgg
-                ORDER BY loan_month;
-            """)
-            monthly_data = cur.fetchall()
-    finally:
-        conn.close()
-    
-    return render_template("analytics_monthly_loans.html", monthly_data=monthly_data)
+    # updated_complex_query.sql "STATISTICS – MONTHLY LOAN TRENDS BY PATRON TYPE",
+    # pivoted here so any patron type gets its own column
+    # Months are closed into LoanMonthlyRollup by ev_loan_monthly_rollup_close
+    # or `flask close-loan-months`, never from a request
+    rows = cached_rows("monthly-loans", *QUERIES.bind("monthly-loans"))
+
+    patron_types, monthly_data = pivot_monthly_loans(rows)
+    return render_template("analytics_monthly_loans.html", monthly_data=monthly_data,
+                           patron_types=patron_types)
 
 # -----------------------------
 # Q30: Co-author relationships
 # -----------------------------
+
+def co_author_filters():
+    """(author_id or None, min_books) from the query string"""
+    # The page's min_books form submits an empty author_id when none is chosen
+    author_id = None
+    if request.args.get('author_id', '').strip():
+        author_id = request.args.get('author_id', type=int)
+        if author_id is None or author_id < 1:
+            abort(400)
+    min_books = max(1, request.args.get('min_books', 2 if not author_id else 1, type=int))
+    return author_id, min_books
+
 @app.route("/analytics/co-authors")
 def co_authors():
-    conn = get_connection()
-    coauthors = []
-    
+    author_id, min_books = co_author_filters()
+    if author_id:
+        coauthors = cached_rows("co-authors", *QUERIES.bind(
+            "co-author-collaborators", author_id=author_id, min_books=min_books))
+    else:
+        coauthors = cached_rows("co-authors", *QUERIES.bind("co-authors", min_books=min_books))
+
+    return render_template("analytics_co_authors.html", coauthors=coauthors,
+                           author_id=author_id, min_books=min_books)
+
+# -----------------------------
+# E-resource usage and licence utilization
+# -----------------------------
+
+ERESOURCE_USAGE_DAYS = (7, 30, 90, 365)
+
+def usage_days():
+    days = request.args.get('days', 30, type=int)
+    return days if days in ERESOURCE_USAGE_DAYS else 30
+
+@app.route("/analytics/eresource-usage")
+def eresource_usage_page():
+    days = usage_days()
+    resources = cached_rows("eresource-usage", *QUERIES.bind("eresource-usage", days=days))
+    providers = cached_rows("eresource-providers", *QUERIES.bind("eresource-providers", days=days))
+    return render_template("analytics_eresource_usage.html", days=days, days_options=ERESOURCE_USAGE_DAYS,
+                           resources=resources, providers=providers)
+
+@app.route("/eresources/<int:resource_id>/usage")
+def eresource_hourly_usage(resource_id):
+    """Hourly usage buckets of one resource (JSON), for the last ``?days=N`` days"""
+    days = usage_days()
+    with get_connection().cursor() as cur:
+        cur.execute("SELECT concurrent_limit FROM EResource r JOIN License l ON r.license_id = l.license_id"
+                    " WHERE r.resource_id = %s", (resource_id,))
+        resource = cur.fetchone()
+        if resource is None:
+            return jsonify(ok=False, error="unknown_resource",
+                           message="No e-resource with id %s" % resource_id), 404
+        cur.execute(*QUERIES.bind("eresource-hourly", resource_id=resource_id, days=days))
+        hours = cur.fetchall()
+    return jsonify(ok=True, resource_id=resource_id, days=days,
+                   concurrent_limit=resource['concurrent_limit'], hours=hours)
+
+# -----------------------------
+# Exports - streamed CSV / NDJSON
+# -----------------------------
+# Every loan (newest first, walking idx_loan_loants) with the columns of the
+# /loans page; {where} is one of LOAN_STATUS_PREDICATES
+LOANS_EXPORT_SQL = """
+    SELECT
+      l.loan_id,
+      l.patron_id,
+      CONCAT(p.first_name, ' ', p.last_name) AS patron_name,
+      c.barcode,
+      b.isbn,
+      b.title,
+      br.name AS branch_name,
+      l.loan_ts,
+      l.due_ts,
+      l.return_ts,
+      CASE
+        WHEN l.return_ts IS NOT NULL THEN 'RETURNED'
+        WHEN l.due_ts < CURDATE()    THEN 'OVERDUE'
+        ELSE 'CURRENT'
+      END AS status,
+      DATEDIFF(COALESCE(l.return_ts, CURDATE()), DATE(l.loan_ts)) AS duration_days
+    FROM Loan l
+    JOIN Patron p ON l.patron_id = p.patron_id
+    JOIN Copy   c ON l.copy_id   = c.copy_id
+    JOIN Book   b ON c.isbn      = b.isbn
+    JOIN Branch br ON c.branch_id = br.branch_id
+    WHERE {where}
+    ORDER BY l.loan_ts DESC, l.loan_id DESC
+"""
+
+ANALYTICS_EXPORTS = {
+    "patron-ranking": QUERIES["patron-ranking"].sql,
+    "multi-branch-patrons": QUERIES["multi-branch-patrons"].sql,
+    "book-popularity": QUERIES["book-popularity"].sql,
+    "reservations-no-loans": QUERIES["reservations-no-loans"].sql,
+    "repeat-borrowers": QUERIES["repeat-borrowers"].sql,
+    "fine-analysis": QUERIES["fine-analysis"].sql,
+    "subject-patterns": SUBJECT_PATTERNS_SQL.format(where="TRUE"),
+    "monthly-loans": QUERIES["monthly-loans"].sql,
+    "co-authors": QUERIES["co-authors"].sql,
+    "eresource-usage": QUERIES["eresource-usage"].sql,
+    "eresource-providers": QUERIES["eresource-providers"].sql,
+}
+
+def export_response(filename, fmt, sql, params=()):
+    """Stream the rows of ``sql`` as an attachment in the requested format"""
+    if fmt not in EXPORT_FORMATS:
+        abort(404)
+    chunks = stream_rows(pool, sql, params, fmt)
+    # Run the query before answering, so SQL errors still produce an error page
+    first = next(chunks, "")
+    return Response(itertools.chain([first], chunks), mimetype=EXPORT_FORMATS[fmt],
+                    headers={"Content-Disposition": 'attachment; filename="%s.%s"' % (filename, fmt),
+                             "X-Accel-Buffering": "no"})
+
+@app.route("/export/loans.<fmt>")
+def export_loans(fmt):
+    filter_type = request.args.get('filter', 'all')
+    if filter_type not in LOAN_STATUS_PREDICATES:
+        filter_type = 'all'
+    sql = LOANS_EXPORT_SQL.format(where=LOAN_STATUS_PREDICATES[filter_type])
+    return export_response("loans-%s" % filter_type, fmt, sql)
+
+@app.route("/export/fines.<fmt>")
+def export_fines(fmt):
+    return export_response("fines", fmt, *QUERIES.bind("fines"))
+
+@app.route("/export/analytics/<name>.<fmt>")
+def export_analytics(name, fmt):
+    if name not in ANALYTICS_EXPORTS:
+        abort(404)
+    patron_id = request.args.get('patron_id', '')
+    if name == "subject-patterns" and patron_id:
+        where, params = subject_patterns_where(patron_id)
+        return export_response(name, fmt, SUBJECT_PATTERNS_SQL.format(where=where), params)
+    if name == "co-authors":
+        author_id, min_books = co_author_filters()
+        if author_id:
+            return export_response(name, fmt, *QUERIES.bind(
+                "co-author-collaborators", author_id=author_id, min_books=min_books))
+        return export_response(name, fmt, *QUERIES.bind("co-authors", min_books=min_books))
+    if name in ("eresource-usage", "eresource-providers"):
+        return export_response(name, fmt, *QUERIES.bind(name, days=usage_days()))
+    return export_response(name, fmt, ANALYTICS_EXPORTS[name])
+
+# -----------------------------
+# CLI maintenance commands (flask --app app <command>)
+# -----------------------------
+@app.cli.command("reconcile-dashboard")
+def reconcile_dashboard_command():
+    """Recompute DashboardSummary from the base tables"""
+    with pool.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("CALL sp_dashboard_summary_reconcile()")
+    click.echo("DashboardSummary reconciled")
+
+@app.cli.command("rebuild-search-index")
+def rebuild_search_index_command():
+    """Rebuild the BookSearch catalog search documents"""
+    with pool.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("CALL sp_booksearch_rebuild()")
+    click.echo("BookSearch rebuilt")
+
+@app.cli.command("rebuild-circulation-stats")
+def rebuild_circulation_stats_command():
+    """Resync BookCirculationStats from Copy and Loan"""
+    with pool.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("CALL sp_bookcirc_rebuild()")
+    click.echo("BookCirculationStats rebuilt")
+
+@app.cli.command("rebuild-coauthors")
+def rebuild_coauthors_command():
+    """Resync the CoAuthorPair graph from BookAuthor"""
+    with pool.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("CALL sp_coauthor_rebuild()")
+    result_cache.invalidate("BookAuthor")
+    click.echo("CoAuthorPair rebuilt")
+
+@app.cli.command("rebuild-loan-rollup")
+def rebuild_loan_rollup_command():
+    """Recount every closed month of LoanMonthlyRollup from Loan"""
+    with pool.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("CALL sp_loan_monthly_rollup_rebuild()")
+    result_cache.invalidate("LoanMonthlyRollup")
+    click.echo("LoanMonthlyRollup rebuilt")
+
+@app.cli.command("close-loan-months")
+def close_loan_months_command():
+    """Write ended months to LoanMonthlyRollup (also run monthly by an event)"""
+    with pool.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("CALL sp_loan_monthly_rollup_close()")
+    result_cache.invalidate("LoanMonthlyRollup")
+    click.echo("LoanMonthlyRollup closed up to last month")
+
+@app.cli.command("rebuild-subject-patterns")
+def rebuild_subject_patterns_command():
+    """Resync PatronSubjectStats from Loan and BookSubject"""
+    with pool.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("CALL sp_patron_subject_rebuild()")
+    result_cache.invalidate("Loan")
+    click.echo("PatronSubjectStats rebuilt")
+
+@app.cli.command("rebuild-patron-activity")
+def rebuild_patron_activity_command():
+    """Resync PatronActivity from Loan and Fine"""
+    with pool.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("CALL sp_patron_activity_rebuild()")
+    click.echo("PatronActivity rebuilt")
+
+@app.cli.command("sweep-overdue")
+def sweep_overdue_command():
+    """Refresh PatronActivity overdue counts (also run nightly by an event)"""
+    with pool.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("CALL sp_patron_activity_overdue_sweep()")
+            changed = cur.fetchone()["patrons_updated"]
+    click.echo("PatronActivity overdue counts updated for %d patrons" % changed)
+
+@app.cli.command("rebuild-eresource-seats")
+def rebuild_eresource_seats_command():
+    """Recount EResourceSeat from the open AccessSession rows"""
+    with pool.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("CALL sp_eresource_seat_rebuild()")
+    click.echo("EResourceSeat rebuilt")
+
+@app.cli.command("reap-sessions")
+@click.option("--stale-after", default=eresource_sessions.STALE_AFTER_S, show_default=True,
+              help="End open sessions with no heartbeat for this many seconds")
+def reap_sessions_command(stale_after):
+    """End stale e-resource sessions (also run every 5 minutes by an event)"""
+    with pool.connection() as conn:
+        reaped = eresource_sessions.reap_stale(conn, stale_after)
+    click.echo("%d stale sessions ended" % reaped)
+
+@app.cli.command("dispatch-ill")
+@click.option("--transport", default="file:ill-outbox", show_default=True,
+              help="file:<directory> (local stand-in for partners) or http (POST to PartnerLibrary.endpoint)")
+@click.option("--batch-size", default=50, show_default=True, type=click.IntRange(min=1),
+              help="Requests per partner batch")
+@click.option("--workers", default=4, show_default=True, type=click.IntRange(min=1),
+              help="Partners sent to concurrently")
+@click.option("--max-attempts", default=5, show_default=True, type=click.IntRange(min=1),
+              help="Sends per batch before it is marked failed")
+@click.option("--backoff", default=1.0, show_default=True, help="First retry delay in seconds (doubles per retry)")
+@click.option("--timeout", default=10.0, show_default=True, help="HTTP transport timeout in seconds")
+def dispatch_ill_command(transport, batch_size, workers, max_attempts, backoff, timeout):
+    """Send pending ILL requests to their partner libraries in batches"""
     try:
+        sender = ill.make_transport(transport, timeout)
+    except ValueError as exc:
+        raise click.BadParameter(str(exc), param_hint="--transport")
+    stats = ill.dispatch(pool, sender, batch_size=batch_size, max_workers=workers,
+                         max_attempts=max_attempts, backoff_s=backoff)
+    s = stats.to_dict()
+    click.echo("%d requests sent in %d batches to %d partners (%d failed batches, %d retries) "
+               "in %.1fs (%.1f requests/s)" % (
+                   s["requests_sent"], s["batches_sent"], s["partners"], s["batches_failed"],
+                   s["retries"], s["elapsed_s"], s["requests_per_s"]))
+    if s["batches_failed"]:
+        sys.exit(1)
+
+@app.cli.command("expire-holds")
+@click.option("--pickup-days", default=circulation.HOLD_PICKUP_DAYS, show_default=True,
+              help="Days the next patron in each queue gets to collect a released copy")
+def expire_holds_command(pickup_days):
+    """Expire uncollected holds and pass their copies on (also run hourly by an event)"""
+    with pool.connection() as conn:
+        expired = holds.expire_holds(conn, pickup_days)
+    result_cache.invalidate("Reservation")
+    click.echo("%d uncollected holds expired" % expired)
+
+@app.cli.command("allocate-holds")
+def allocate_holds_command():
+    """Hold every available copy for the head of its queue (after bulk loads)"""
+    with pool.connection() as conn:
+        holds.allocate_available(conn)
+    result_cache.invalidate("Reservation")
+    click.echo("Available copies allocated to their hold queues")
+
+@app.cli.command("send-hold-notices")
+@click.option("--batch-size", default=500, show_default=True, help="Notices read per query")
+def send_hold_notices_command(batch_size):
+    """Send queued hold notices (one line per notice; pipe to the mailer)"""
+    def send(notice):
+        click.echo("%s\t%s\treservation %s\t%s at branch %s\t%s" % (
+            notice["email"], notice["kind"], notice["reservation_id"], notice["isbn"],
+            notice["branch_id"], notice["expires_at"] or ""))
+
+    with pool.connection() as conn:
+        sent = holds.send_notices(conn, send, batch_size)
+    click.echo("%d hold notices sent" % sent, err=True)
+
+@app.cli.command("rebuild-current-loans")
+def rebuild_current_loans_command():
+    """Re-point Copy.current_loan_id at each copy's open loan"""
+    with pool.connection() as conn:
         with conn.cursor() as cur:
-            cur.execute("""
-                SELECT
-                  a1.author_id AS author1_id,
-                  CONCAT(a1.first_name, ' ', a1.last_name) AS author1_name,
-                  a2.author_id AS author2_id,
-                  CONCAT(a2.first_name, ' ', a2.last_name) AS author2_name,
-                  COUNT(DISTINCT b.isbn) AS books_together
-                FROM Author a1
-                JOIN BookAuthor ba1 ON a1.author_id = ba1.author_id
-                JOIN BookAuthor ba2 ON ba1.isbn = ba2.isbn
-                JOIN Author a2 ON ba2.author_id = a2.author_id
-                JOIN Book b ON ba1.isbn = b.isbn
-                WHERE a1.author_id < a2.author_id
-                GROUP BY a1.author_id, author1_name, a2.author_id, author2_name
-                HAVING books_together >= 2
-                ORDER BY books_together DESC, author1_name, author2_name
-            """)
-            coauthors = cur.fetchall()
-    finally:
-        conn.close()
-    
-    return render_template("analytics_co_authors.html", coauthors=coauthors)
+            cur.execute("CALL sp_copy_current_loan_rebuild()")
+    click.echo("Copy.current_loan_id rebuilt")
+
+@app.cli.command("accrue-fines")
+@click.option("--chunk-size", default=1000, show_default=True, help="Loans per transaction")
+@click.option("--lookback-days", default=7, show_default=True,
+              help="Also settle loans returned late within this many days")
+@click.option("--daily-at", metavar="HH:MM",
+              help="Keep running and repeat the job every day at this local time")
+def accrue_fines_command(chunk_size, lookback_days, daily_at):
+    """Create/raise LATE fines for overdue loans and charge Patron.balance"""
+    def run():
+        def progress(stats):
+            if stats.chunks % 50 == 0:
+                click.echo("  %(loans_scanned)d loans, %(loans_per_s).0f loans/s" % stats.to_dict())
+
+        with pool.connection() as conn:
+            stats = accrue_fines(conn, chunk_size=chunk_size, lookback_days=lookback_days,
+                                 progress=progress)
+        result_cache.invalidate("Fine")
+        click.echo("%(loans_scanned)d overdue loans in %(chunks)d chunks: %(fines_created)d fines "
+                   "created, %(fines_updated)d raised, %(patrons_charged)d patrons charged "
+                   "(%(elapsed_s).1fs, %(loans_per_s).0f loans/s)" % stats.to_dict())
+
+    if not daily_at:
+        run()
+        return
+    hour, minute = (int(part) for part in daily_at.split(":"))
+    while True:
+        now = datetime.now()
+        next_run = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if next_run <= now:
+            next_run += timedelta(days=1)
+        click.echo("Next fine accrual at %s" % next_run.strftime("%Y-%m-%d %H:%M"))
+        time.sleep((next_run - now).total_seconds())
+        try:
+            run()
+        except Exception as exc:  # keep the scheduler alive; retry tomorrow
+            click.echo("Fine accrual failed: %s" % exc, err=True)
+
+@app.cli.command("rollup-eresource-usage")
+@click.option("--chunk-hours", default=24, show_default=True, help="Hours rolled up per transaction")
+@click.option("--rebuild", is_flag=True, help="Drop the rollups and rebuild them from the first session")
+def rollup_eresource_usage_command(chunk_hours, rebuild):
+    """Roll AccessSession up into hourly/daily usage buckets (run hourly, e.g. from cron)"""
+    def progress(stats):
+        if stats.chunks % 30 == 0:
+            click.echo("  rolled up to %s" % stats.rolled_up_to)
+
+    with pool.connection() as conn:
+        if rebuild:
+            eresource_usage.reset_usage(conn)
+        stats = eresource_usage.rollup_usage(conn, chunk_hours=chunk_hours, progress=progress)
+    result_cache.invalidate("EResourceUsageDaily")
+    click.echo("%(hours)d hours in %(chunks)d chunks: %(sessions_read)d sessions read, "
+               "%(buckets_written)d buckets written, rolled up to %(rolled_up_to)s "
+               "(%(elapsed_s).1fs)" % stats.to_dict())
+
+@app.cli.command("check-plans")
+@click.option("--max-rows", default=1000, show_default=True,
+              help="Flag scans and filesorts estimated above this many rows")
+def check_plans_command(max_rows):
+    """EXPLAIN every query the routes run and fail on full scans / large filesorts"""
+    # Tooling only: imported here so web workers never load it
+    from plan_check import check_plans
+
+    findings = check_plans(sys.modules[__name__], DB_CONFIG, max_rows=max_rows)
+    regressions = 0
+    for url, sql, problems, allowed in findings:
+        click.echo("%s %s" % ("ALLOWED" if allowed else "FAIL   ", url))
+        if sql:
+            click.echo("    " + " ".join(sql.split())[:200])
+        for problem in problems:
+            click.echo("    - " + problem)
+        if allowed:
+            click.echo("    (%s)" % allowed)
+        else:
+            regressions += 1
+    click.echo("%d plan regression(s)" % regressions)
+    if regressions:
+        sys.exit(1)
+
+@app.cli.command("bench")
+@click.option("--http", "base_url", help="Benchmark a running server at this URL (default: test client)")
+@click.option("--iterations", default=50, show_default=True, help="Timed requests per route")
+@click.option("--warmup", default=5, show_default=True, help="Untimed requests per route first")
+@click.option("--concurrency", default=8, show_default=True, help="Parallel clients with --http")
+@click.option("--cold", is_flag=True, help="Clear the result cache before every request (test client)")
+@click.option("--route", "routes", multiple=True, help="Route template to run (repeatable; default: all)")
+@click.option("--out", type=click.Path(dir_okay=False), help="Save the results as JSON")
+@click.option("--baseline", type=click.Path(exists=True, dir_okay=False),
+              help="Fail if p95 latency regressed against this saved run")
+@click.option("--tolerance", default=0.2, show_default=True, help="Allowed p95 growth vs --baseline")
+def bench_command(base_url, iterations, warmup, concurrency, cold, routes, out, baseline, tolerance):
+    """Measure p50/p95/p99 latency, throughput and DB vs render time per route"""
+    # Tooling only: imported here so web workers never load it
+    from benchmark import (bench_client, bench_http, compare_results, format_results,
+                           load_results, save_results)
+    from plan_check import sample_values
+
+    if base_url:
+        with pool.connection() as conn:
+            values = sample_values(conn)
+        results = bench_http(base_url, values, iterations=iterations, warmup=warmup,
+                             concurrency=concurrency, routes=routes or None)
+    else:
+        results = bench_client(sys.modules[__name__], DB_CONFIG, iterations=iterations,
+                               warmup=warmup, cold=cold, routes=routes or None)
+    click.echo(format_results(results))
+    if out:
+        save_results(out, results, mode="http" if base_url else "client", base_url=base_url,
+                     iterations=iterations, concurrency=concurrency if base_url else 1, cold=cold)
+        click.echo("Saved %s" % out)
+    if baseline:
+        regressions = compare_results(load_results(baseline), results, tolerance=tolerance)
+        for url, before, after in regressions:
+            click.echo("REGRESSION %s: p95 %.1fms -> %.1fms" % (url, before, after))
+        click.echo("%d latency regression(s) vs %s" % (len(regressions), baseline))
+        if regressions:
+            sys.exit(1)
+
+@app.cli.command("import-patrons")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--format", "fmt", type=click.Choice(IMPORT_FORMATS),
+              help="Input format (default: from the file extension)")
+@click.option("--batch-size", default=1000, show_default=True, help="Rows per INSERT transaction")
+def import_patrons_command(path, fmt, batch_size):
+    """Bulk-load patrons from a CSV (with header) or NDJSON file"""
+    fmt = fmt or ("ndjson" if path.lower().endswith((".ndjson", ".jsonl")) else "csv")
+    with open(path, encoding="utf-8-sig", newline="") as stream:
+        with pool.connection() as conn:
+            report = import_patrons(conn, read_rows(stream, fmt), batch_size=batch_size)
+    for err in report.errors:
+        click.echo("line %(line)d: %(error)s" % err, err=True)
+    click.echo("%d rows read, %d patrons imported, %d rejected"
+               % (report.rows, report.inserted, report.failed))
 
 if __name__ == "__main__":
     app.run(debug=True)
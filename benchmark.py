@@ -0,0 +1,231 @@
+"""
+Route-level benchmarks for UniLibPlus.
+
+Two drivers share one report format:
+
+  * bench_client drives each route through Flask's test client, one request
+    at a time, and splits every request into DB time (wall time inside
+    PyMySQL ``query()``, summed over the page's connections) and template
+    render time (between the before_render_template and template_rendered
+    signals).
+  * bench_http drives a running server over HTTP with a pool of concurrent
+    clients. DB/render time comes from the Server-Timing header when the
+    server sends one.
+
+Results are plain dicts ({url: {p50_ms, p95_ms, ...}}) saved as JSON, so two
+runs can be compared with compare_results.
+"""
+import json
+import math
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+
+import pymysql
+from flask import before_render_template, template_rendered
+
+from plan_check import PLAN_ROUTES, sample_values, swapped_pool
+
+
+class Stopwatch:
+    """Thread-safe accumulator of elapsed seconds"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.total = 0.0
+
+    def add(self, seconds):
+        with self._lock:
+            self.total += seconds
+
+    def reset(self):
+        with self._lock:
+            self.total = 0.0
+
+
+class TimedConnection(pymysql.connections.Connection):
+    """PyMySQL connection that adds the time spent in each query to ``clock``"""
+    clock = None
+
+    def query(self, sql, unbuffered=False):
+        started = time.perf_counter()
+        try:
+            return super().query(sql, unbuffered)
+        finally:
+            if self.clock is not None:
+                self.clock.add(time.perf_counter() - started)
+
+
+@contextmanager
+def render_timing(app, clock):
+    """Add the time spent rendering templates in ``app`` to ``clock``"""
+    local = threading.local()
+
+    def started(sender, template, context, **extra):
+        local.started = time.perf_counter()
+
+    def finished(sender, template, context, **extra):
+        clock.add(time.perf_counter() - local.started)
+
+    before_render_template.connect(started, app)
+    template_rendered.connect(finished, app)
+    try:
+        yield
+    finally:
+        before_render_template.disconnect(started, app)
+        template_rendered.disconnect(finished, app)
+
+
+def percentile(ordered, pct):
+    """Nearest-rank percentile of an ascending list"""
+    if not ordered:
+        return None
+    return ordered[max(0, math.ceil(pct / 100.0 * len(ordered)) - 1)]
+
+
+def summarize(latencies, errors, wall, db_total=None, render_total=None, timed=0):
+    """Per-route report; db/render are per-request means over ``timed`` requests"""
+    ordered = sorted(latencies)
+
+    def ms(seconds):
+        return round(seconds * 1000, 2) if seconds is not None else None
+
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "p50_ms": ms(percentile(ordered, 50)),
+        "p95_ms": ms(percentile(ordered, 95)),
+        "p99_ms": ms(percentile(ordered, 99)),
+        "mean_ms": ms(sum(ordered) / len(ordered)) if ordered else None,
+        "rps": round(len(ordered) / wall, 1) if wall > 0 else None,
+        "db_ms": ms(db_total / timed) if timed and db_total is not None else None,
+        "render_ms": ms(render_total / timed) if timed and render_total is not None else None,
+    }
+
+
+def bench_client(app_module, db_config, iterations=50, warmup=5, cold=False, routes=None):
+    """Benchmark routes in-process; returns {url: summary}"""
+    db_clock, render_clock = Stopwatch(), Stopwatch()
+
+    def connect():
+        conn = TimedConnection(**db_config)
+        conn.clock = db_clock
+        return conn
+
+    results = {}
+    with swapped_pool(app_module, connect) as pool, render_timing(app_module.app, render_clock):
+        with pool.connection() as conn:
+            values = sample_values(conn)
+        client = app_module.app.test_client()
+        for template in routes or PLAN_ROUTES:
+            url = template.format(**values)
+            for _ in range(warmup):
+                client.get(url)
+            latencies, errors, db_total, render_total = [], 0, 0.0, 0.0
+            route_started = time.perf_counter()
+            for _ in range(iterations):
+                if cold:
+                    app_module.result_cache.clear()
+                db_clock.reset()
+                render_clock.reset()
+                started = time.perf_counter()
+                response = client.get(url)
+                latencies.append(time.perf_counter() - started)
+                errors += response.status_code >= 400
+                db_total += db_clock.total
+                render_total += render_clock.total
+            results[url] = summarize(latencies, errors, time.perf_counter() - route_started,
+                                     db_total, render_total, iterations)
+    return results
+
+
+def parse_server_timing(header):
+    """{'db': 12.5, 'render': 3.1} from 'db;dur=12.5, render;dur=3.1'"""
+    timings = {}
+    for metric in (header or "").split(","):
+        name, _, params = metric.strip().partition(";")
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "dur":
+                try:
+                    timings[name] = float(value)
+                except ValueError:
+                    pass
+    return timings
+
+
+def fetch(url, timeout):
+    """GET ``url``; returns (seconds, status or None, Server-Timing dict)"""
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            response.read()
+            status, header = response.status, response.headers.get("Server-Timing")
+    except urllib.error.HTTPError as exc:
+        status, header = exc.code, exc.headers.get("Server-Timing")
+    except (urllib.error.URLError, OSError):
+        status, header = None, None
+    return time.perf_counter() - started, status, parse_server_timing(header)
+
+
+def bench_http(base_url, values, iterations=200, warmup=10, concurrency=8, routes=None,
+               timeout=30.0):
+    """Benchmark routes of a running server with ``concurrency`` parallel clients"""
+    results = {}
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for template in routes or PLAN_ROUTES:
+            path = template.format(**values)
+            url = base_url.rstrip("/") + path
+            list(executor.map(lambda u: fetch(u, timeout), [url] * warmup))
+            route_started = time.perf_counter()
+            samples = list(executor.map(lambda u: fetch(u, timeout), [url] * iterations))
+            wall = time.perf_counter() - route_started
+            timed = [timings for _, _, timings in samples if "db" in timings]
+            results[path] = summarize(
+                [elapsed for elapsed, _, _ in samples],
+                sum(1 for _, status, _ in samples if status is None or status >= 400),
+                wall,
+                sum(t["db"] for t in timed) / 1000.0 if timed else None,
+                sum(t.get("render", 0.0) for t in timed) / 1000.0 if timed else None,
+                len(timed))
+    return results
+
+
+def save_results(path, results, **meta):
+    meta.setdefault("recorded_at", datetime.now().isoformat(timespec="seconds"))
+    with open(path, "w", encoding="utf-8") as out:
+        json.dump({"meta": meta, "routes": results}, out, indent=2, sort_keys=True)
+
+
+def load_results(path):
+    with open(path, encoding="utf-8") as stream:
+        return json.load(stream)["routes"]
+
+
+def compare_results(baseline, current, tolerance=0.2, metric="p95_ms", min_delta_ms=5.0):
+    """Routes whose ``metric`` grew by more than ``tolerance`` (and min_delta_ms)"""
+    regressions = []
+    for url, result in current.items():
+        before, after = (baseline.get(url) or {}).get(metric), result.get(metric)
+        if before is None or after is None:
+            continue
+        if after > before * (1 + tolerance) and after - before > min_delta_ms:
+            regressions.append((url, before, after))
+    return regressions
+
+
+def format_results(results):
+    """Fixed-width report table"""
+    def cell(value):
+        return "-" if value is None else ("%.1f" % value if isinstance(value, float) else str(value))
+
+    columns = ("requests", "errors", "p50_ms", "p95_ms", "p99_ms", "rps", "db_ms", "render_ms")
+    width = max([len(url) for url in results] + [5])
+    lines = ["%-*s " % (width, "route") + " ".join("%9s" % c for c in columns)]
+    for url, result in results.items():
+        lines.append("%-*s " % (width, url) + " ".join("%9s" % cell(result[c]) for c in columns))
+    return "\n".join(lines)
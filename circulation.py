@@ -0,0 +1,203 @@
+"""
+Circulation writes for UniLibPlus: checkout, return and renew.
+
+Every operation is one short transaction that locks only the Copy row
+(``SELECT ... FOR UPDATE``). Copy.current_loan_id points at the copy's open
+loan and is maintained by the Loan triggers, so checking availability is a
+primary-key read instead of a scan of the copy's loan history. A returned
+copy goes straight to the head of its (isbn, branch) hold queue, if any, via
+sp_hold_allocate (see holds.py); Copy is always locked before Reservation,
+and a transaction picked as a deadlock victim is rerun. Batch helpers run one
+transaction per item, so a bad barcode never holds up the rest of a kiosk stack.
+"""
+from datetime import datetime, time, timedelta
+
+import pymysql
+
+from id_sequence import allocate_ids
+from transactions import ServiceError, run_transaction
+
+LOAN_PERIOD_DAYS = 14
+MAX_RENEWALS = 2
+# A renewal may not push the due date past this many days after checkout
+MAX_LOAN_DAYS = LOAN_PERIOD_DAYS * (MAX_RENEWALS + 1)
+# Reservation statuses that block renewing a book (patrons still queued)
+HOLD_STATUSES = ("Active", "Waiting")
+# Days a patron has to collect a copy put on the hold shelf for them (keep in
+# step with ev_hold_expire in summaries.sql)
+HOLD_PICKUP_DAYS = 3
+
+
+class CirculationError(ServiceError):
+    """A checkout/return/renew that the library's rules refuse"""
+
+
+def due_date(day):
+    """Loans fall due at the end of the day LOAN_PERIOD_DAYS after ``day``"""
+    return datetime.combine(day + timedelta(days=LOAN_PERIOD_DAYS), time(23, 59, 59))
+
+
+def _lock_copy(cur, barcode):
+    """Lock the Copy row and return it with the database clock"""
+    cur.execute("""
+        SELECT copy_id, isbn, branch_id, current_loan_id, hold_reservation_id,
+               NOW() AS now, CURDATE() AS today
+        FROM Copy
+        WHERE barcode = %s
+        FOR UPDATE
+    """, (barcode,))
+    copy = cur.fetchone()
+    if copy is None:
+        raise CirculationError("unknown_barcode", "No copy has barcode %s" % barcode, 404)
+    return copy
+
+
+def allocate_hold(cur, copy_id):
+    """Hand a free copy to the next patron queued for it; returns the hold or None"""
+    cur.execute("CALL sp_hold_allocate(%s, %s)", (copy_id, HOLD_PICKUP_DAYS))
+    cur.execute("""
+        SELECT r.reservation_id, r.patron_id, r.expires_at
+        FROM Copy c
+        JOIN Reservation r ON c.hold_reservation_id = r.reservation_id
+        WHERE c.copy_id = %s
+    """, (copy_id,))
+    return cur.fetchone()
+
+
+def check_patron(conn, patron_id):
+    with conn.cursor() as cur:
+        cur.execute("SELECT patron_id FROM Patron WHERE patron_id = %s", (patron_id,))
+        if cur.fetchone() is None:
+            raise CirculationError("unknown_patron", "No patron with id %s" % patron_id, 404)
+
+
+def checkout(conn, patron_id, barcode, loan_id=None):
+    """Lend the copy with ``barcode`` to a patron (an int id); returns the new loan"""
+    if loan_id is None:
+        loan_id = allocate_ids(conn, "loan")
+
+    def work(cur):
+        copy = _lock_copy(cur, barcode)
+        if copy["current_loan_id"] is not None:
+            raise CirculationError("on_loan", "Copy %s is already on loan" % barcode)
+        reservation_id = copy["hold_reservation_id"]
+        if reservation_id is not None:
+            cur.execute("SELECT patron_id FROM Reservation WHERE reservation_id = %s FOR UPDATE",
+                        (reservation_id,))
+            if cur.fetchone()["patron_id"] != patron_id:
+                raise CirculationError("on_hold", "Copy %s is on the hold shelf for another patron" % barcode)
+            # Collecting the hold; the Loan insert trigger takes the copy off the shelf
+        else:
+            # Borrowing a shelf copy also settles the patron's own queued hold
+            # for the book at this branch, so it does not claim the next return
+            cur.execute("""
+                SELECT reservation_id
+                FROM Reservation
+                WHERE isbn = %s
+                  AND branch_id = %s
+                  AND in_queue = 1
+                  AND patron_id = %s
+                LIMIT 1
+                FOR UPDATE
+            """, (copy["isbn"], copy["branch_id"], patron_id))
+            queued = cur.fetchone()
+            reservation_id = queued["reservation_id"] if queued else None
+        if reservation_id is not None:
+            cur.execute("UPDATE Reservation SET status = 'Fulfilled' WHERE reservation_id = %s",
+                        (reservation_id,))
+        due_ts = due_date(copy["today"])
+        cur.execute("""
+            INSERT INTO Loan (loan_id, copy_id, patron_id, loan_ts, due_ts, return_ts)
+            VALUES (%s, %s, %s, %s, %s, NULL)
+        """, (loan_id, copy["copy_id"], patron_id, copy["now"], due_ts))
+        return {"ok": True, "barcode": barcode, "loan_id": loan_id, "copy_id": copy["copy_id"],
+                "isbn": copy["isbn"], "loan_ts": copy["now"], "due_ts": due_ts,
+                "reservation_id": reservation_id}
+
+    return run_transaction(conn, work)
+
+
+def return_copy(conn, barcode):
+    """Close the open loan of the copy with ``barcode``"""
+    def work(cur):
+        copy = _lock_copy(cur, barcode)
+        if copy["current_loan_id"] is None:
+            raise CirculationError("not_on_loan", "Copy %s is not on loan" % barcode)
+        cur.execute("""
+            SELECT patron_id, due_ts
+            FROM Loan
+            WHERE loan_id = %s
+        """, (copy["current_loan_id"],))
+        loan = cur.fetchone()
+        cur.execute("UPDATE Loan SET return_ts = %s WHERE loan_id = %s",
+                    (copy["now"], copy["current_loan_id"]))
+        days_late = max(0, (copy["today"] - loan["due_ts"].date()).days)
+        return {"ok": True, "barcode": barcode, "loan_id": copy["current_loan_id"],
+                "patron_id": loan["patron_id"], "return_ts": copy["now"], "days_late": days_late,
+                "hold": allocate_hold(cur, copy["copy_id"])}
+
+    return run_transaction(conn, work)
+
+
+def renew(conn, barcode):
+    """Extend the open loan of the copy with ``barcode`` by another loan period"""
+    def work(cur):
+        copy = _lock_copy(cur, barcode)
+        if copy["current_loan_id"] is None:
+            raise CirculationError("not_on_loan", "Copy %s is not on loan" % barcode)
+        cur.execute("""
+            SELECT loan_ts, due_ts
+            FROM Loan
+            WHERE loan_id = %s
+        """, (copy["current_loan_id"],))
+        loan = cur.fetchone()
+        cur.execute("""
+            SELECT 1
+            FROM Reservation
+            WHERE isbn = %s
+              AND status IN %s
+            LIMIT 1
+        """, (copy["isbn"], HOLD_STATUSES))
+        if cur.fetchone() is not None:
+            raise CirculationError("on_hold", "Copy %s has holds waiting and cannot be renewed" % barcode)
+
+        due_ts = due_date(copy["today"])
+        if due_ts <= loan["due_ts"]:
+            raise CirculationError("not_due", "Copy %s is already due %s" % (barcode, loan["due_ts"]))
+        if (due_ts.date() - loan["loan_ts"].date()).days > MAX_LOAN_DAYS:
+            raise CirculationError("renewal_limit", "Copy %s has reached the renewal limit" % barcode)
+        cur.execute("UPDATE Loan SET due_ts = %s WHERE loan_id = %s",
+                    (due_ts, copy["current_loan_id"]))
+        return {"ok": True, "barcode": barcode, "loan_id": copy["current_loan_id"], "due_ts": due_ts}
+
+    return run_transaction(conn, work)
+
+
+def _each(barcodes, operation):
+    """Apply ``operation`` to every barcode, collecting per-item results"""
+    results = []
+    for barcode in barcodes:
+        try:
+            results.append(operation(barcode))
+        except CirculationError as exc:
+            results.append(dict(exc.to_dict(), barcode=barcode))
+        except pymysql.MySQLError as exc:
+            results.append({"ok": False, "barcode": barcode, "error": "rejected",
+                            "message": exc.args[-1] if exc.args else str(exc)})
+    return results
+
+
+def checkout_many(conn, patron_id, barcodes):
+    """Self-check kiosk: lend a stack of copies to one patron"""
+    check_patron(conn, patron_id)
+    first_id = allocate_ids(conn, "loan", len(barcodes)) if barcodes else 0
+    loan_ids = iter(range(first_id, first_id + len(barcodes)))
+    return _each(barcodes, lambda barcode: checkout(conn, patron_id, barcode, next(loan_ids)))
+
+
+def return_many(conn, barcodes):
+    return _each(barcodes, lambda barcode: return_copy(conn, barcode))
+
+
+def renew_many(conn, barcodes):
+    return _each(barcodes, lambda barcode: renew(conn, barcode))
@@ -18,6 +18,30 @@ CREATE INDEX idx_book_title
 CREATE INDEX idx_book_pub_year
   ON Book (pub_year);
 
+-- Catalog search: FULLTEXT over the denormalized search document, plus a
+-- title-only FULLTEXT so title matches can be weighted higher in ranking
+CREATE FULLTEXT INDEX ft_booksearch_all
+  ON BookSearch (title, authors, subjects, publisher_name);
+
+CREATE FULLTEXT INDEX ft_booksearch_title
+  ON BookSearch (title);
+
+-- Catalog search: filter by primary subject
+CREATE INDEX idx_booksearch_subject
+  ON BookSearch (primary_subject_id);
+
+-- Circulation counters: most-borrowed listings walk this index in order
+CREATE INDEX idx_bookcirc_popularity
+  ON BookCirculationStats (times_loaned DESC, isbn);
+
+-- CoAuthorPair: "pairs with >= N books" walks books_together; an author's
+-- collaborators are the PK prefix (author1_id) plus this (author2_id) index
+CREATE INDEX idx_coauthorpair_books
+  ON CoAuthorPair (books_together);
+
+CREATE INDEX idx_coauthorpair_author2
+  ON CoAuthorPair (author2_id, books_together);
+
 -- =========================================================
 -- 2. Term indexes
 -- =========================================================
@@ -36,6 +60,15 @@ CREATE INDEX idx_term_year_name
 CREATE INDEX idx_copy_branch_isbn
   ON Copy (branch_id, isbn);
 
+-- Copies of one book and where they are (book detail, holds), covering
+--   the per-book join to Branch
+CREATE INDEX idx_copy_isbn_branch
+  ON Copy (isbn, branch_id);
+
+-- Availability lookups: available copies of a book, per branch
+CREATE INDEX idx_copy_isbn_status_branch
+  ON Copy (isbn, status, branch_id);
+
 -- =========================================================
 -- 4. Patron indexes
 -- =========================================================
@@ -44,6 +77,23 @@ CREATE INDEX idx_copy_branch_isbn
 CREATE INDEX idx_patron_name
   ON Patron (last_name, first_name);
 
+-- PatronActivity: patron list ordered by risk, paginated on (risk_rank, patron_id)
+CREATE INDEX idx_patronactivity_risk
+  ON PatronActivity (risk_rank, patron_id);
+
+-- PatronActivity: fines page (unpaid_fines > 0, largest first) and the
+--   statistics page's most active borrowers
+CREATE INDEX idx_patronactivity_unpaid
+  ON PatronActivity (unpaid_fines);
+
+CREATE INDEX idx_patronactivity_loans
+  ON PatronActivity (total_loans);
+
+-- PatronSubjectStats: subject-pattern listing, each patron's subjects most
+--   borrowed first, keyset-paginated on (patron_id, loan_count, subject_id)
+CREATE INDEX idx_patronsubject_order
+  ON PatronSubjectStats (patron_id, loan_count DESC, subject_id);
+
 -- =========================================================
 -- 5. Circulation: Loan, Fine, Reservation
 -- =========================================================
@@ -56,14 +106,49 @@ CREATE INDEX idx_loan_patron_due
 CREATE INDEX idx_loan_copy_loants
   ON Loan (copy_id, loan_ts);
 
+-- Loan: keyset pagination of the loans listing on (loan_ts, loan_id)
+--   (InnoDB appends the primary key, so loan_id is part of the index)
+CREATE INDEX idx_loan_loants
+  ON Loan (loan_ts);
+
+-- Loan: overdue scans (return_ts IS NULL AND due_ts < ...) and recent
+--   late returns (return_ts >= ...), e.g. the fine accrual job
+CREATE INDEX idx_loan_return_due
+  ON Loan (return_ts, due_ts);
+
 -- Fine: list fines per patron and group by status (Paid / Unpaid / Pending)
 CREATE INDEX idx_fine_patron_status
   ON Fine (patron_id, status);
 
+-- Fine: per-reason totals by status (fine analysis) read only this index
+CREATE INDEX idx_fine_reason_status_amount
+  ON Fine (reason_id, status, amount);
+
 -- Reservation: typical query is "what active reservations does this patron have?"
 CREATE INDEX idx_reservation_patron_status
   ON Reservation (patron_id, status);
 
+-- Reservation: patrons with open reservations (status IN ('Active','Waiting'))
+CREATE INDEX idx_reservation_status_patron
+  ON Reservation (status, patron_id);
+
+-- Reservation: open holds on a book (renewal check, hold queue)
+CREATE INDEX idx_reservation_isbn_status
+  ON Reservation (isbn, status);
+
+-- Reservation: per-(isbn, branch) hold queue in FIFO order; the head of the
+-- queue is one index probe and a queue position counts only the holds ahead
+CREATE INDEX idx_reservation_queue
+  ON Reservation (isbn, branch_id, in_queue, created_at, reservation_id);
+
+-- Reservation: uncollected 'Ready' holds by expiry (bulk expiry)
+CREATE INDEX idx_reservation_status_expires
+  ON Reservation (status, expires_at);
+
+-- HoldNotification: unsent notices in order (outbox drain)
+CREATE INDEX idx_holdnotification_unsent
+  ON HoldNotification (sent_at, notification_id);
+
 -- =========================================================
 -- 6. E-resources and access sessions
 -- =========================================================
@@ -76,6 +161,25 @@ CREATE INDEX idx_eresource_type_license
 CREATE INDEX idx_accesssession_patron_start
   ON AccessSession (patron_id, start_time);
 
+-- AccessSession: open sessions per resource (seat rebuild, usage views)
+CREATE INDEX idx_accesssession_resource_end
+  ON AccessSession (resource_id, end_time);
+
+-- AccessSession: the reaper's open sessions by last heartbeat
+CREATE INDEX idx_accesssession_end_seen
+  ON AccessSession (end_time, last_seen);
+
+-- AccessSession: sessions started in a usage rollup window
+CREATE INDEX idx_accesssession_start
+  ON AccessSession (start_time);
+
+-- Usage rollups: utilization over the last N days across all resources
+CREATE INDEX idx_eresourceusagedaily_date
+  ON EResourceUsageDaily (usage_date, resource_id);
+
+CREATE INDEX idx_eresourceusagehourly_hour
+  ON EResourceUsageHourly (hour_start, resource_id);
+
 -- =========================================================
 -- 7. Inter-library loan
 -- =========================================================
@@ -86,6 +190,11 @@ CREATE INDEX idx_accesssession_patron_start
 CREATE INDEX idx_illrequest_patron_status
   ON ILLRequest (patron_id, status);
 
+-- ILLRequest: unbatched 'Requested' requests per partner in id order
+-- (dispatcher claim)
+CREATE INDEX idx_illrequest_dispatch
+  ON ILLRequest (status, batch_id, partner_id, request_id);
+
 -- =========================================================
 -- End of 03_constraints_indexes.sql
 -- =========================================================
@@ -0,0 +1,261 @@
+"""
+Bounded, thread-safe connection pool for UniLibPlus.
+
+Connections are created lazily up to ``max_size``, health-checked on checkout,
+recycled after ``max_lifetime`` seconds and evicted after ``max_idle`` seconds
+of inactivity (never dropping below ``min_size`` idle connections).
+"""
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from pymysql.constants import SERVER_STATUS
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes available within the wait timeout"""
+
+
+class _Slot:
+    __slots__ = ("conn", "created_at", "last_used")
+
+    def __init__(self, conn):
+        now = time.monotonic()
+        self.conn = conn
+        self.created_at = now
+        self.last_used = now
+
+
+class ConnectionPool:
+    def __init__(self, connect, min_size=2, max_size=10, timeout=5.0,
+                 max_idle=300.0, max_lifetime=3600.0, ping_after=30.0):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("pool sizes must satisfy 0 <= min_size <= max_size, max_size >= 1")
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.ping_after = ping_after
+
+        self._cond = threading.Condition()
+        self._idle = deque()   # most recently released on the right
+        self._in_use = {}      # id(conn) -> _Slot
+        self._size = 0         # idle + in use + being created
+        self._waiting = 0
+        self._closed = False
+
+        self._counters = {
+            "acquired": 0,
+            "released": 0,
+            "created": 0,
+            "discarded": 0,
+            "health_check_failures": 0,
+            "waits": 0,
+            "timeouts": 0,
+            "wait_time_total_ms": 0.0,
+            "wait_time_max_ms": 0.0,
+            "peak_in_use": 0,
+        }
+
+    # -----------------------------
+    # Checkout / return
+    # -----------------------------
+    def acquire(self, timeout=None):
+        """Borrow a healthy connection, waiting up to ``timeout`` seconds"""
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        waited = False
+
+        while True:
+            with self._cond:
+                if self._closed:
+                    raise PoolTimeout("connection pool is closed")
+                slot = None
+                create = False
+                while slot is None and not create:
+                    if self._idle:
+                        slot = self._idle.pop()
+                    elif self._size < self.max_size:
+                        self._size += 1
+                        create = True
+                    else:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            if timeout > 0:  # timeout=0 is a non-blocking try
+                                self._counters["timeouts"] += 1
+                            raise PoolTimeout(
+                                "no database connection available after %.1fs "
+                                "(max_size=%d)" % (timeout, self.max_size))
+                        waited = True
+                        self._waiting += 1
+                        try:
+                            self._cond.wait(remaining)
+                        finally:
+                            self._waiting -= 1
+
+            if create:
+                try:
+                    slot = _Slot(self._connect())
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._counters["created"] += 1
+            elif not self._is_usable(slot):
+                self._discard(slot)
+                continue
+
+            with self._cond:
+                slot.last_used = time.monotonic()
+                self._in_use[id(slot.conn)] = slot
+                self._counters["acquired"] += 1
+                self._counters["peak_in_use"] = max(self._counters["peak_in_use"], len(self._in_use))
+                if waited:
+                    waited_ms = (time.monotonic() - started) * 1000.0
+                    self._counters["waits"] += 1
+                    self._counters["wait_time_total_ms"] += waited_ms
+                    self._counters["wait_time_max_ms"] = max(self._counters["wait_time_max_ms"], waited_ms)
+            return slot.conn
+
+    def release(self, conn, discard=False):
+        """Return a borrowed connection; ``discard`` closes it instead of reusing it"""
+        with self._cond:
+            slot = self._in_use.pop(id(conn), None)
+        if slot is None:
+            return
+
+        if not discard:
+            try:
+                if conn.server_status & SERVER_STATUS.SERVER_STATUS_IN_TRANS:
+                    conn.rollback()
+            except Exception:
+                discard = True
+
+        now = time.monotonic()
+        if discard or self._closed or now - slot.created_at >= self.max_lifetime:
+            self._discard(slot)
+            return
+
+        with self._cond:
+            slot.last_used = now
+            self._idle.append(slot)
+            self._counters["released"] += 1
+            self._cond.notify()
+        self.evict_idle()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """Context manager that borrows a connection and always returns it"""
+        conn = self.acquire(timeout)
+        failed = False
+        try:
+            yield conn
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self.release(conn, discard=failed and not conn.open)
+
+    # -----------------------------
+    # Maintenance
+    # -----------------------------
+    def evict_idle(self):
+        """Close idle connections past max_idle/max_lifetime, keeping min_size"""
+        now = time.monotonic()
+        expired = []
+        with self._cond:
+            kept = deque()
+            # Oldest idle connections sit on the left of the deque
+            while self._idle:
+                slot = self._idle.popleft()
+                too_old = now - slot.created_at >= self.max_lifetime
+                too_idle = (now - slot.last_used >= self.max_idle
+                            and len(self._idle) + len(kept) >= self.min_size)
+                if too_old or too_idle:
+                    expired.append(slot)
+                else:
+                    kept.append(slot)
+            self._idle = kept
+        for slot in expired:
+            self._discard(slot)
+
+    def fill(self):
+        """Pre-open connections until min_size are idle"""
+        while True:
+            with self._cond:
+                if self._size >= self.max_size or len(self._idle) >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                slot = _Slot(self._connect())
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                raise
+            with self._cond:
+                self._counters["created"] += 1
+                self._idle.appendleft(slot)
+                self._cond.notify()
+
+    def close(self):
+        """Close idle connections and refuse new checkouts"""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = list(self._idle), deque()
+            self._cond.notify_all()
+        for slot in idle:
+            self._discard(slot)
+
+    def stats(self):
+        """Snapshot of pool sizes, wait times and saturation for monitoring"""
+        with self._cond:
+            in_use = len(self._in_use)
+            stats = dict(self._counters)
+            stats.update({
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": in_use,
+                "waiting": self._waiting,
+                "saturation": round(in_use / self.max_size, 4),
+                "wait_time_avg_ms": round(stats["wait_time_total_ms"] / stats["waits"], 3)
+                                    if stats["waits"] else 0.0,
+            })
+        stats["wait_time_total_ms"] = round(stats["wait_time_total_ms"], 3)
+        stats["wait_time_max_ms"] = round(stats["wait_time_max_ms"], 3)
+        return stats
+
+    # -----------------------------
+    # Internal helpers
+    # -----------------------------
+    def _is_usable(self, slot):
+        now = time.monotonic()
+        if now - slot.created_at >= self.max_lifetime:
+            return False
+        if not slot.conn.open:
+            return False
+        if now - slot.last_used >= self.ping_after:
+            try:
+                slot.conn.ping(reconnect=False)
+            except Exception:
+                with self._cond:
+                    self._counters["health_check_failures"] += 1
+                return False
+        return True
+
+    def _discard(self, slot):
+        try:
+            slot.conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._counters["discarded"] += 1
+            self._cond.notify()
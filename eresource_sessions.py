@@ -0,0 +1,160 @@
+"""
+E-resource access sessions for UniLibPlus: start, heartbeat and end.
+
+Every e-resource has an EResourceSeat row counting its open sessions. The
+AccessSession insert trigger takes a seat with one conditional UPDATE of that
+row (``seats_in_use < License.concurrent_limit``), so concurrent logins only
+queue on their own resource's row lock and can never be over-admitted; ending
+a session gives the seat back. Clients heartbeat while the patron is active,
+and sessions silent for longer than STALE_AFTER_S are ended by the reaper
+(sp_accesssession_reap, run by an event and by ``flask reap-sessions``).
+"""
+import threading
+import time
+
+import pymysql
+
+from id_sequence import allocate_ids
+from transactions import ServiceError
+
+# Sessions with no heartbeat for this long are reaped (keep in step with
+# ev_accesssession_reap in summaries.sql)
+STALE_AFTER_S = 900
+# MySQL error raised by SIGNAL in a trigger
+ER_SIGNAL_EXCEPTION = 1644
+
+
+class SessionError(ServiceError):
+    """A session start/heartbeat/end that the licence rules refuse"""
+
+
+class SessionMetrics:
+    """Thread-safe seat-wait and denial counters for monitoring"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {
+            "started": 0,
+            "denied": 0,
+            "heartbeats": 0,
+            "ended": 0,
+            "seat_waits": 0,
+            "seat_wait_total_ms": 0.0,
+            "seat_wait_max_ms": 0.0,
+        }
+        self._denied_by_resource = {}
+
+    def seat_wait(self, waited_ms, admitted, resource_id):
+        with self._lock:
+            self._counters["seat_waits"] += 1
+            self._counters["seat_wait_total_ms"] += waited_ms
+            self._counters["seat_wait_max_ms"] = max(self._counters["seat_wait_max_ms"], waited_ms)
+            if admitted:
+                self._counters["started"] += 1
+            else:
+                self._counters["denied"] += 1
+                self._denied_by_resource[resource_id] = self._denied_by_resource.get(resource_id, 0) + 1
+
+    def count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["denied_by_resource"] = dict(self._denied_by_resource)
+        stats["seat_wait_avg_ms"] = (round(stats["seat_wait_total_ms"] / stats["seat_waits"], 3)
+                                     if stats["seat_waits"] else 0.0)
+        stats["seat_wait_total_ms"] = round(stats["seat_wait_total_ms"], 3)
+        stats["seat_wait_max_ms"] = round(stats["seat_wait_max_ms"], 3)
+        stats["denial_ratio"] = (round(stats["denied"] / stats["seat_waits"], 4)
+                                 if stats["seat_waits"] else 0.0)
+        return stats
+
+
+def check_access(conn, patron_id, resource_id):
+    with conn.cursor() as cur:
+        cur.execute("SELECT patron_id FROM Patron WHERE patron_id = %s", (patron_id,))
+        if cur.fetchone() is None:
+            raise SessionError("unknown_patron", "No patron with id %s" % patron_id, 404)
+        cur.execute("SELECT resource_id FROM EResource WHERE resource_id = %s", (resource_id,))
+        if cur.fetchone() is None:
+            raise SessionError("unknown_resource", "No e-resource with id %s" % resource_id, 404)
+
+
+def start_session(conn, patron_id, resource_id, metrics=None):
+    """Open a session if the resource has a free seat; returns the new session"""
+    check_access(conn, patron_id, resource_id)
+    session_id = allocate_ids(conn, "session")
+    started = time.perf_counter()
+    admitted = False
+    try:
+        with conn.cursor() as cur:
+            # Autocommit: the seat row lock is held only for this statement
+            cur.execute("""
+                INSERT INTO AccessSession (session_id, patron_id, resource_id, start_time, end_time)
+                VALUES (%s, %s, %s, NOW(), NULL)
+            """, (session_id, patron_id, resource_id))
+            cur.execute("SELECT start_time FROM AccessSession WHERE session_id = %s", (session_id,))
+            start_time = cur.fetchone()["start_time"]
+        admitted = True
+    except pymysql.MySQLError as exc:
+        if exc.args and exc.args[0] == ER_SIGNAL_EXCEPTION:
+            raise SessionError("seat_limit", exc.args[-1])
+        raise
+    finally:
+        if metrics is not None:
+            metrics.seat_wait((time.perf_counter() - started) * 1000.0, admitted, resource_id)
+    return {"ok": True, "session_id": session_id, "patron_id": patron_id,
+            "resource_id": resource_id, "start_time": start_time,
+            "heartbeat_within_s": STALE_AFTER_S}
+
+
+def _check_open(cur, session_id):
+    """Raise for a session that does not exist or has already ended"""
+    cur.execute("SELECT end_time FROM AccessSession WHERE session_id = %s", (session_id,))
+    session = cur.fetchone()
+    if session is None:
+        raise SessionError("unknown_session", "No session with id %s" % session_id, 404)
+    if session["end_time"] is not None:
+        raise SessionError("session_ended", "Session %s ended at %s" % (session_id, session["end_time"]))
+
+
+def heartbeat(conn, session_id, metrics=None):
+    """Mark an open session as still in use"""
+    with conn.cursor() as cur:
+        cur.execute("""
+            UPDATE AccessSession
+            SET last_seen = NOW()
+            WHERE session_id = %s
+              AND end_time IS NULL
+        """, (session_id,))
+        if cur.rowcount == 0:
+            # Also 0 for a second heartbeat within the same second
+            _check_open(cur, session_id)
+    if metrics is not None:
+        metrics.count("heartbeats")
+    return {"ok": True, "session_id": session_id}
+
+
+def end_session(conn, session_id, metrics=None):
+    """Close an open session; the AccessSession triggers release its seat"""
+    with conn.cursor() as cur:
+        cur.execute("""
+            UPDATE AccessSession
+            SET end_time = GREATEST(NOW(), start_time)
+            WHERE session_id = %s
+              AND end_time IS NULL
+        """, (session_id,))
+        if cur.rowcount == 0:
+            _check_open(cur, session_id)
+    if metrics is not None:
+        metrics.count("ended")
+    return {"ok": True, "session_id": session_id}
+
+
+def reap_stale(conn, stale_after_s=STALE_AFTER_S):
+    """End sessions with no heartbeat for ``stale_after_s`` seconds; returns how many"""
+    with conn.cursor() as cur:
+        cur.execute("CALL sp_accesssession_reap(%s)", (stale_after_s,))
+        return cur.rowcount
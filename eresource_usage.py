@@ -0,0 +1,210 @@
+"""
+E-resource usage rollups for UniLibPlus.
+
+Turns AccessSession rows into hourly and daily buckets per resource
+(EResourceUsageHourly / EResourceUsageDaily): sessions started, seconds of
+use and peak concurrent sessions. Each run rolls up the whole hours between
+the EResourceUsageState watermark and the current hour, a chunk of hours per
+transaction together with the watermark move, so every hour is counted
+exactly once and an interrupted run resumes where it stopped.
+
+Peak concurrency comes from one sweep over the sessions' start/end events in
+time order (a running +1/-1 count), not from self-joining overlapping
+sessions. The utilization pages then read only the rollups.
+"""
+import time
+from datetime import timedelta
+
+from transactions import run_transaction
+
+HOUR = timedelta(hours=1)
+
+# Sessions overlapping [window start, window end): those started inside it
+# (idx_accesssession_start) plus those still running at its start
+# (idx_accesssession_end_seen on end_time)
+WINDOW_SESSIONS_SQL = """
+    SELECT resource_id, start_time, end_time
+    FROM AccessSession
+    WHERE start_time >= %s
+      AND start_time < %s
+    UNION ALL
+    SELECT resource_id, start_time, end_time
+    FROM AccessSession
+    WHERE start_time < %s
+      AND (end_time IS NULL OR end_time > %s)
+"""
+
+UPSERT_HOURLY_SQL = """
+    INSERT INTO EResourceUsageHourly
+      (resource_id, hour_start, sessions_started, usage_seconds, peak_concurrent)
+    VALUES (%s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+      sessions_started = sessions_started + VALUES(sessions_started),
+      usage_seconds    = usage_seconds + VALUES(usage_seconds),
+      peak_concurrent  = GREATEST(peak_concurrent, VALUES(peak_concurrent))
+"""
+
+UPSERT_DAILY_SQL = """
+    INSERT INTO EResourceUsageDaily
+      (resource_id, usage_date, sessions_started, usage_seconds, peak_concurrent)
+    VALUES (%s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+      sessions_started = sessions_started + VALUES(sessions_started),
+      usage_seconds    = usage_seconds + VALUES(usage_seconds),
+      peak_concurrent  = GREATEST(peak_concurrent, VALUES(peak_concurrent))
+"""
+
+
+class RollupStats:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.chunks = 0
+        self.hours = 0
+        self.sessions_read = 0
+        self.buckets_written = 0
+        self.rolled_up_to = None
+
+    def to_dict(self):
+        return {
+            "chunks": self.chunks,
+            "hours": self.hours,
+            "sessions_read": self.sessions_read,
+            "buckets_written": self.buckets_written,
+            "rolled_up_to": self.rolled_up_to,
+            "elapsed_s": round(time.monotonic() - self.started, 3),
+        }
+
+
+def floor_hour(ts):
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+
+def sweep_buckets(sessions, start, end):
+    """Hourly [sessions_started, usage_seconds, peak_concurrent] per (resource_id, hour)
+
+    ``sessions`` are (resource_id, start_time, end_time) rows overlapping
+    [start, end); open sessions (end_time None) count as running until ``end``.
+    """
+    buckets = {}
+    events = {}
+
+    def bucket(resource_id, hour):
+        key = (resource_id, hour)
+        if key not in buckets:
+            buckets[key] = [0, 0, 0]
+        return buckets[key]
+
+    def peak(resource_id, hour, running):
+        b = bucket(resource_id, hour)
+        b[2] = max(b[2], running)
+
+    for resource_id, s_start, s_end in sessions:
+        if start <= s_start < end:
+            bucket(resource_id, floor_hour(s_start))[0] += 1
+        s_start = max(s_start, start)
+        s_end = min(s_end or end, end)
+        if s_end <= s_start:
+            continue
+        t = s_start
+        while t < s_end:
+            hour = floor_hour(t)
+            nxt = min(hour + HOUR, s_end)
+            bucket(resource_id, hour)[1] += int((nxt - t).total_seconds())
+            t = nxt
+        events.setdefault(resource_id, []).extend(((s_start, 1), (s_end, -1)))
+
+    for resource_id, resource_events in events.items():
+        # Ends sort before starts at the same instant: back-to-back sessions
+        # do not overlap
+        resource_events.sort()
+        running = 0
+        hour = None
+        for t, delta in resource_events:
+            event_hour = floor_hour(t)
+            if running and event_hour != hour:
+                # Sessions still running carry through every hour up to this
+                # event, and into its hour unless it falls on the hour
+                h = hour + HOUR
+                while h < event_hour:
+                    peak(resource_id, h, running)
+                    h += HOUR
+                if t > event_hour:
+                    peak(resource_id, event_hour, running)
+            hour = event_hour
+            running += delta
+            if running:
+                peak(resource_id, hour, running)
+    return buckets
+
+
+def daily_buckets(hourly):
+    """Fold hourly buckets into per-day ones (peak = max over the day's hours)"""
+    daily = {}
+    for (resource_id, hour), (started, seconds, peak) in hourly.items():
+        key = (resource_id, hour.date())
+        d = daily.setdefault(key, [0, 0, 0])
+        d[0] += started
+        d[1] += seconds
+        d[2] = max(d[2], peak)
+    return daily
+
+
+def rollup_usage(conn, chunk_hours=24, progress=None):
+    """Roll AccessSession up to the current hour; returns RollupStats"""
+    stats = RollupStats()
+
+    def chunk(cur):
+        # The state row lock keeps concurrent runs from rolling up an hour twice
+        cur.execute("""
+            SELECT rolled_up_to, NOW() AS now
+            FROM EResourceUsageState
+            WHERE state_id = 1
+            FOR UPDATE
+        """)
+        state = cur.fetchone()
+        if state is None:
+            raise LookupError("EResourceUsageState has no row (run summaries.sql)")
+        start = state["rolled_up_to"]
+        if start is None:
+            cur.execute("SELECT MIN(start_time) AS first FROM AccessSession")
+            first = cur.fetchone()["first"]
+            if first is None:
+                return None
+            start = floor_hour(first)
+        end = min(start + chunk_hours * HOUR, floor_hour(state["now"]))
+        if end <= start:
+            return None
+
+        cur.execute(WINDOW_SESSIONS_SQL, (start, end, start, start))
+        sessions = [(r["resource_id"], r["start_time"], r["end_time"]) for r in cur.fetchall()]
+        hourly = sweep_buckets(sessions, start, end)
+        daily = daily_buckets(hourly)
+        if hourly:
+            cur.executemany(UPSERT_HOURLY_SQL, [key + tuple(v) for key, v in sorted(hourly.items())])
+            cur.executemany(UPSERT_DAILY_SQL, [key + tuple(v) for key, v in sorted(daily.items())])
+        cur.execute("UPDATE EResourceUsageState SET rolled_up_to = %s WHERE state_id = 1", (end,))
+        return start, end, len(sessions), len(hourly) + len(daily)
+
+    while True:
+        # Counted only once the chunk has committed (run_transaction may rerun it)
+        done = run_transaction(conn, chunk)
+        if done is None:
+            return stats
+        start, end, sessions_read, buckets_written = done
+        stats.chunks += 1
+        stats.hours += int((end - start) / HOUR)
+        stats.sessions_read += sessions_read
+        stats.buckets_written += buckets_written
+        stats.rolled_up_to = end
+        if progress is not None:
+            progress(stats)
+
+
+def reset_usage(conn):
+    """Drop every rollup so the next run rebuilds them from the first session"""
+    def work(cur):
+        cur.execute("DELETE FROM EResourceUsageHourly")
+        cur.execute("DELETE FROM EResourceUsageDaily")
+        cur.execute("UPDATE EResourceUsageState SET rolled_up_to = NULL WHERE state_id = 1")
+
+    run_transaction(conn, work)
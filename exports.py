@@ -0,0 +1,78 @@
+"""
+Streaming CSV / NDJSON exports for UniLibPlus.
+
+Rows are read with an unbuffered server-side cursor (``SSDictCursor``) on a
+dedicated pooled connection and written out in small chunks, so an export of
+any size runs in constant memory and the header goes out before the first row
+is fetched.
+"""
+import csv
+import io
+import json
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from pymysql.cursors import SSDictCursor
+
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def export_value(value):
+    """Plain, spreadsheet-friendly representation of a column value"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat(sep=" ") if isinstance(value, datetime) else value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, timedelta):
+        return str(value)
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode("utf-8", "replace")
+    return value
+
+
+def _csv_chunks(cur, batch_size):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    columns = [d[0] for d in cur.description or ()]
+    writer.writerow(columns)
+    yield buf.getvalue()
+    while True:
+        rows = cur.fetchmany(batch_size)
+        if not rows:
+            return
+        buf.seek(0)
+        buf.truncate()
+        for row in rows:
+            writer.writerow([export_value(row[c]) for c in columns])
+        yield buf.getvalue()
+
+
+def _ndjson_chunks(cur, batch_size):
+    while True:
+        rows = cur.fetchmany(batch_size)
+        if not rows:
+            return
+        yield "".join(
+            json.dumps({k: export_value(v) for k, v in row.items()}, default=str) + "\n"
+            for row in rows)
+
+
+def stream_rows(pool, sql, params, fmt, batch_size=500):
+    """Generator of CSV or NDJSON text chunks for the rows of ``sql``"""
+    chunks = _csv_chunks if fmt == "csv" else _ndjson_chunks
+    conn = pool.acquire()
+    finished = False
+    try:
+        cur = conn.cursor(SSDictCursor)
+        cur.execute(sql, params)
+        for chunk in chunks(cur, batch_size):
+            yield chunk
+        cur.close()
+        finished = True
+    finally:
+        # An abandoned unbuffered result would have to be drained before the
+        # connection could run another query; closing it is cheaper.
+        pool.release(conn, discard=not finished)
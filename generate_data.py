@@ -0,0 +1,612 @@
+"""
+Synthetic data generator for UniLibPlus.
+
+Produces referentially valid rows for every base table in schema_tables.sql
+at a chosen scale factor (SF 1 is 10k patrons and ~100k loan attempts, SF 10
+is 100k patrons and ~1M), with:
+
+  * Zipf-skewed book popularity (and more copies of the popular books),
+  * seasonal loan timestamps: academic-year months, quiet weekends, daytime
+    hours, and slow growth over the period,
+  * per-copy loan histories that never overlap, so at most one open loan per
+    copy; demand for a book with no copy on the shelf becomes a reservation,
+  * a return mix of on-time, renewed, late, very late and lost loans, with
+    LATE fines priced like the accrual job (fine_accrual.py) and occasional
+    LOST/DAMAGED fines.
+
+Output is deterministic for the same --seed, --scale and --as-of. Each table
+goes to its own file, numbered in foreign-key order: multi-row INSERT chunks
+(--format sql), or tab-separated files plus a load.sql of LOAD DATA LOCAL
+INFILE statements (--format tsv). Load them in place of data.sql:
+
+    python generate_data.py --scale 10 --out data_sf10
+    cat data_sf10/*.sql | mysql UniLibPlus
+
+Loans are numbered in time order and each copy's open loan is its last, so
+the files also load with the triggers installed. Derived summary tables and
+Copy.current_loan_id are not generated: for the fastest load, run the files
+before triggers.sql and summaries.sql, whose seed CALLs rebuild them.
+"""
+import argparse
+import bisect
+import itertools
+import math
+import os
+import random
+import time as timer
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+from circulation import LOAN_PERIOD_DAYS, MAX_RENEWALS
+from fine_accrual import FINE_DAILY_RATE, FINE_LATE_MAX
+
+DAY = 86400
+HOUR = 3600
+
+# Rows per entity at scale factor 1
+BASE_ROWS = {
+    "patrons": 10000,
+    "books": 20000,
+    "copies": 50000,
+    "authors": 6000,
+    "loans": 100000,
+    "sessions": 50000,
+    "ill_requests": 1000,
+    "eresources": 300,
+}
+
+# Loan return behaviour: (share, kind)
+RETURN_MIX = [
+    (0.58, "on_time"),
+    (0.12, "renewed"),
+    (0.20, "late"),        # 1-10 days past due
+    (0.08, "very_late"),   # 10-90 days past due
+    (0.02, "lost"),        # never returned
+]
+DAMAGED_RATE = 0.005
+LOST_FINE = Decimal("45.00")
+DAMAGED_FINE = Decimal("20.00")
+RESERVE_RATE = 0.5     # share of unmet demand that places a hold
+
+MONTH_WEIGHTS = [0.9, 1.1, 1.2, 1.25, 0.8, 0.45, 0.4, 0.7, 1.2, 1.3, 1.25, 0.75]
+WEEKDAY_WEIGHTS = [1.0, 1.0, 1.0, 1.0, 0.8, 0.45, 0.55]
+HOUR_WEIGHTS = {8: 2, 9: 5, 10: 8, 11: 9, 12: 8, 13: 9, 14: 10, 15: 10, 16: 9,
+                17: 7, 18: 5, 19: 4, 20: 3, 21: 2}
+
+PATRON_TYPES = [("Student", 0.70, 1.0), ("Faculty", 0.10, 1.8),
+                ("Staff", 0.10, 0.6), ("Alumni", 0.10, 0.3)]
+
+BRANCHES = ["Main Library", "Science Library", "Downtown Branch", "Health Sciences Library",
+            "Engineering Library", "Arts & Humanities Library", "Business Library", "Law Library"]
+BRANCH_WEIGHTS = [5, 3, 2, 1.5, 2, 1.5, 1, 1]
+
+SUBJECT_TOPICS = {
+    "Computer Science": ["Databases", "Operating Systems", "Compilers", "Networks", "Algorithms"],
+    "Data Science": ["Data Analysis", "Statistical Learning", "Data Visualization", "Big Data"],
+    "Literature": ["the Novel", "Poetry", "Drama", "Short Fiction", "Literary Theory"],
+    "History": ["the Ancient World", "Modern Europe", "the Americas", "East Asia", "Empires"],
+    "Biology": ["Molecular Biology", "Genetics", "Ecology", "Cell Biology", "Evolution"],
+    "Economics": ["Microeconomics", "Macroeconomics", "Econometrics", "Public Finance"],
+    "Mathematics": ["Linear Algebra", "Calculus", "Topology", "Number Theory", "Probability"],
+    "Philosophy": ["Ethics", "Logic", "Metaphysics", "Epistemology", "Political Philosophy"],
+    "Artificial Intelligence": ["Machine Learning", "Deep Learning", "Reinforcement Learning",
+                                "Natural Language Processing", "Computer Vision"],
+    "Sociology": ["Social Theory", "Urban Sociology", "Social Networks", "Inequality"],
+    "Law": ["Contract Law", "Constitutional Law", "Criminal Law", "International Law"],
+    "Business & Management": ["Strategy", "Marketing", "Accounting", "Operations", "Leadership"],
+    "Environmental Studies": ["Climate Change", "Sustainability", "Environmental Policy"],
+    "Psychology": ["Cognitive Psychology", "Social Psychology", "Developmental Psychology"],
+    "Physics": ["Quantum Mechanics", "Thermodynamics", "Electromagnetism", "Relativity"],
+    "Chemistry": ["Organic Chemistry", "Physical Chemistry", "Biochemistry", "Spectroscopy"],
+    "Medicine": ["Anatomy", "Pharmacology", "Epidemiology", "Clinical Medicine"],
+    "Engineering": ["Control Systems", "Signal Processing", "Materials", "Structural Design"],
+    "Art History": ["Renaissance Art", "Modern Art", "Architecture", "Photography"],
+    "Music": ["Music Theory", "Composition", "Ethnomusicology", "Jazz"],
+    "Political Science": ["Comparative Politics", "International Relations", "Public Policy"],
+    "Education": ["Curriculum Design", "Educational Psychology", "Higher Education"],
+    "Linguistics": ["Syntax", "Phonology", "Semantics", "Sociolinguistics"],
+    "Statistics": ["Bayesian Statistics", "Regression", "Time Series", "Sampling"],
+}
+TITLE_PREFIXES = ["Introduction to", "Advanced", "Foundations of", "Principles of", "Applied",
+                  "Essentials of", "Handbook of", "Topics in", "A History of", "Readings in",
+                  "Perspectives on", "Modern"]
+EDITIONS = ["", "", "", "", ", 2nd Edition", ", 3rd Edition", ", 4th Edition"]
+
+FIRST_NAMES = ["Liam", "Olivia", "Noah", "Emma", "Ethan", "Sophia", "Mason", "Ava", "Lucas",
+               "Mia", "Aiden", "Isabella", "Wei", "Mei", "Hiroshi", "Yuki", "Arjun", "Priya",
+               "Mateo", "Lucia", "Omar", "Fatima", "Jakub", "Anna", "Kwame", "Amara", "Sean",
+               "Siobhan", "Lars", "Ingrid", "Diego", "Camila", "Min-jun", "Seo-yeon", "Ivan",
+               "Elena", "Tariq", "Leila", "Samuel", "Grace"]
+LAST_NAMES = ["Smith", "Johnson", "Brown", "Garcia", "Martinez", "Lee", "Wang", "Zhang", "Chen",
+              "Kim", "Park", "Nguyen", "Patel", "Singh", "Khan", "Ali", "Novak", "Svoboda",
+              "Müller", "Schmidt", "Rossi", "Bianchi", "Silva", "Santos", "O'Brien", "O'Connor",
+              "Murphy", "Kowalski", "Nowak", "Ivanova", "Tanaka", "Sato", "Mensah", "Okafor",
+              "Andersson", "Johansson", "Dubois", "Moreau", "Cohen", "Levi"]
+CITIES = [("Durham", "NC", "USA"), ("Raleigh", "NC", "USA"), ("Chapel Hill", "NC", "USA"),
+          ("Boston", "MA", "USA"), ("New York", "NY", "USA"), ("Seattle", "WA", "USA"),
+          ("Austin", "TX", "USA"), ("Madison", "WI", "USA"), ("Toronto", None, "Canada"),
+          ("London", None, "UK"), ("Edinburgh", None, "UK"), ("Shanghai", None, "China"),
+          ("Beijing", None, "China"), ("Singapore", None, "Singapore"),
+          ("Melbourne", None, "Australia"), ("Prague", None, "Czech Republic")]
+STREETS = ["Main St", "Campus Dr", "Elm St", "Oak Ave", "Maple Ct", "River Rd", "College Way",
+           "Library Ave", "Scholar Ln", "Park Pl", "Hill St", "Lake Dr"]
+NAME_WORDS = ["Acorn", "Northbridge", "Harbor", "Summit", "Riverside", "Lantern", "Granite",
+              "Meridian", "Cedar", "Beacon", "Pioneer", "Atlas", "Orchard", "Keystone",
+              "Evergreen", "Horizon", "Sterling", "Compass", "Heritage", "Aurora"]
+PUBLISHER_KINDS = ["Press", "Publishing", "Academic", "Books", "University Press", "House"]
+PROVIDER_KINDS = ["Digital", "eResources", "Online", "Scholarly Networks", "Data Services"]
+RESOURCE_TYPES = ["Ebook", "Ejournal", "Database"]
+FINE_REASONS = [("LATE", "Overdue return"), ("LOST", "Item reported lost"),
+                ("DAMAGED", "Item returned damaged")]
+
+# Tables in foreign-key order with their columns
+TABLES = [
+    ("Address", ("address_id", "street", "city", "state", "postal_code", "country")),
+    ("Publisher", ("publisher_id", "name", "address_id")),
+    ("Author", ("author_id", "first_name", "last_name")),
+    ("Subject", ("subject_id", "name")),
+    ("Term", ("term_id", "name", "year", "start_date", "end_date")),
+    ("FineReason", ("reason_id", "code", "description")),
+    ("Provider", ("provider_id", "name", "contact_email", "address_id")),
+    ("License", ("license_id", "provider_id", "start_date", "end_date", "concurrent_limit")),
+    ("ResourceType", ("resource_type_id", "name")),
+    ("PartnerLibrary", ("partner_id", "name", "address_id")),
+    ("Branch", ("branch_id", "name", "address_id")),
+    ("Book", ("isbn", "title", "publisher_id", "pub_year")),
+    ("BookSubject", ("isbn", "subject_id")),
+    ("BookAuthor", ("isbn", "author_id")),
+    ("Copy", ("copy_id", "isbn", "branch_id", "checkin_term_id", "barcode")),
+    ("Patron", ("patron_id", "first_name", "last_name", "email", "patron_type", "address_id",
+                "balance")),
+    ("Loan", ("loan_id", "copy_id", "patron_id", "loan_ts", "due_ts", "return_ts")),
+    ("Fine", ("fine_id", "loan_id", "patron_id", "reason_id", "amount", "status", "created_at")),
+    ("Reservation", ("reservation_id", "patron_id", "isbn", "branch_id", "created_at", "status")),
+    ("EResource", ("resource_id", "title", "resource_type_id", "license_id")),
+    ("AccessSession", ("session_id", "patron_id", "resource_id", "start_time", "end_time")),
+    ("ILLRequest", ("request_id", "patron_id", "partner_id", "isbn", "status", "requested_at")),
+]
+OUTPUT_FORMATS = ("sql", "tsv")
+
+# The generated rows are valid by construction, so skip per-row key checks
+LOAD_PREAMBLE = ("USE UniLibPlus;\nSET NAMES utf8mb4;\n"
+                 "SET foreign_key_checks = 0;\nSET unique_checks = 0;\n")
+LOAD_POSTAMBLE = "SET unique_checks = 1;\nSET foreign_key_checks = 1;\n"
+
+
+def sql_value(value):
+    if value is None:
+        return "NULL"
+    if isinstance(value, str):
+        return "'" + value.replace("\\", "\\\\").replace("'", "''") + "'"
+    if isinstance(value, datetime):
+        return "'" + value.isoformat(" ") + "'"
+    if isinstance(value, date):
+        return "'" + value.isoformat() + "'"
+    return str(value)
+
+
+def tsv_value(value):
+    if value is None:
+        return "\\N"
+    if isinstance(value, str):
+        return value.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n")
+    if isinstance(value, datetime):
+        return value.isoformat(" ")
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value)
+
+
+class TableWriter:
+    """Streams one table's rows to its own numbered file"""
+
+    def __init__(self, out_dir, position, table, columns, fmt, rows_per_insert):
+        self.table = table
+        self.columns = columns
+        self.fmt = fmt
+        self.rows_per_insert = rows_per_insert
+        self.filename = "%02d_%s.%s" % (position, table, fmt)
+        self.rows = 0
+        self._pending = []
+        self._file = open(os.path.join(out_dir, self.filename), "w", encoding="utf-8", newline="\n")
+        if fmt == "sql":
+            self._file.write(LOAD_PREAMBLE)
+            self._insert = "INSERT INTO %s (%s) VALUES\n" % (table, ", ".join(columns))
+
+    def add(self, *row):
+        self.rows += 1
+        if self.fmt == "tsv":
+            self._file.write("\t".join(map(tsv_value, row)) + "\n")
+            return
+        self._pending.append("(" + ", ".join(map(sql_value, row)) + ")")
+        if len(self._pending) >= self.rows_per_insert:
+            self._flush()
+
+    def _flush(self):
+        if self._pending:
+            self._file.write(self._insert + ",\n".join(self._pending) + ";\n")
+            self._pending = []
+
+    def close(self):
+        if self.fmt == "sql":
+            self._flush()
+            self._file.write(LOAD_POSTAMBLE)
+        self._file.close()
+
+    def load_statement(self):
+        return ("LOAD DATA LOCAL INFILE '%s' INTO TABLE %s CHARACTER SET utf8mb4\n"
+                "  FIELDS TERMINATED BY '\\t' LINES TERMINATED BY '\\n'\n  (%s);\n"
+                % (self.filename, self.table, ", ".join(self.columns)))
+
+
+def cumulative(weights):
+    return list(itertools.accumulate(weights))
+
+
+def zipf_weights(n, s):
+    return [1.0 / (rank ** s) for rank in range(1, n + 1)]
+
+
+def money(amount):
+    return Decimal("%.2f" % amount)
+
+
+class Generator:
+    def __init__(self, scale, seed, as_of, years, out_dir, fmt, rows_per_insert):
+        self.rng = random.Random(seed)
+        self.counts = {name: max(10, int(round(rows * scale))) for name, rows in BASE_ROWS.items()}
+        self.as_of = as_of
+        self.days = int(round(years * 365))
+        self.start = as_of - timedelta(days=self.days)
+        self.epoch = datetime.combine(self.start, time())
+        self.now_s = self.days * DAY  # as_of 00:00, in seconds since epoch
+        self.out_dir = out_dir
+        self.fmt = fmt
+        self.rows_per_insert = rows_per_insert
+        self.writers = {}
+
+    # -- helpers -------------------------------------------------------
+
+    def ts(self, seconds):
+        return self.epoch + timedelta(seconds=int(seconds))
+
+    def writer(self, table):
+        if table not in self.writers:
+            position = [name for name, _ in TABLES].index(table) + 1
+            self.writers[table] = TableWriter(self.out_dir, position, table, dict(TABLES)[table],
+                                              self.fmt, self.rows_per_insert)
+        return self.writers[table]
+
+    def day_weights(self):
+        weights = []
+        for d in range(self.days):
+            day = self.start + timedelta(days=d)
+            growth = 0.8 + 0.4 * d / self.days
+            weights.append(MONTH_WEIGHTS[day.month - 1] * WEEKDAY_WEIGHTS[day.weekday()] * growth)
+        return cumulative(weights)
+
+    def timestamps(self, n):
+        """``n`` sorted seasonal timestamps (seconds since epoch) before as_of"""
+        rng = self.rng
+        days = rng.choices(range(self.days), cum_weights=self.day_weights(), k=n)
+        hours = rng.choices(list(HOUR_WEIGHTS), weights=list(HOUR_WEIGHTS.values()), k=n)
+        return sorted(d * DAY + h * HOUR + rng.randrange(HOUR) for d, h in zip(days, hours))
+
+    def person(self):
+        return self.rng.choice(FIRST_NAMES), self.rng.choice(LAST_NAMES)
+
+    # -- lookup and catalog tables --------------------------------------
+
+    def addresses(self):
+        rng = self.rng
+        self.n_addresses = 100 + self.counts["patrons"] // 2
+        out = self.writer("Address")
+        for address_id in range(1, self.n_addresses + 1):
+            city, state, country = rng.choice(CITIES)
+            out.add(address_id, "%d %s" % (rng.randint(1, 999), rng.choice(STREETS)), city, state,
+                    "%05d" % rng.randint(1000, 99999), country)
+
+    def institution(self, kinds, count):
+        """Unique institution names, each with one of the first 100 addresses"""
+        names = ["%s %s" % pair for pair in itertools.product(NAME_WORDS, kinds)]
+        self.rng.shuffle(names)
+        for i in range(count):
+            suffix = "" if i < len(names) else " %d" % (i // len(names) + 1)
+            yield i + 1, names[i % len(names)] + suffix, self.rng.randint(1, 100)
+
+    def lookups(self):
+        rng = self.rng
+        self.subjects = list(SUBJECT_TOPICS)
+        for subject_id, name in enumerate(self.subjects, 1):
+            self.writer("Subject").add(subject_id, name)
+        for reason_id, (code, description) in enumerate(FINE_REASONS, 1):
+            self.writer("FineReason").add(reason_id, code, description)
+        self.reason_ids = {code: reason_id for reason_id, (code, _) in enumerate(FINE_REASONS, 1)}
+        for type_id, name in enumerate(RESOURCE_TYPES, 1):
+            self.writer("ResourceType").add(type_id, name)
+
+        self.n_terms = 0
+        for year in range(self.start.year, self.as_of.year + 1):
+            for name, start, end in (("Spring", (1, 10), (5, 10)), ("Summer", (5, 20), (8, 1)),
+                                     ("Fall", (8, 25), (12, 15))):
+                self.n_terms += 1
+                self.writer("Term").add(self.n_terms, name, year, date(year, *start), date(year, *end))
+
+        self.n_publishers = 100 + self.counts["books"] // 400
+        for row in self.institution(PUBLISHER_KINDS, self.n_publishers):
+            self.writer("Publisher").add(*row)
+        n_providers = 5 + self.counts["eresources"] // 20
+        for provider_id, name, address_id in self.institution(PROVIDER_KINDS, n_providers):
+            self.writer("Provider").add(provider_id, name,
+                                        "support@%s.example.com" % name.lower().replace(" ", ""),
+                                        address_id)
+        self.licenses = []
+        for license_id in range(1, 2 * n_providers + 1):
+            start = self.start + timedelta(days=rng.randrange(0, 365))
+            limit = rng.choice([5, 10, 25, 50, 100, 150])
+            self.licenses.append(limit)
+            self.writer("License").add(license_id, rng.randint(1, n_providers), start,
+                                       start + timedelta(days=365 * rng.randint(2, 5)), limit)
+        for partner_id, (city, _, _) in enumerate(CITIES, 1):
+            self.writer("PartnerLibrary").add(partner_id, "%s Public Library" % city,
+                                              rng.randint(1, 100))
+        self.n_partners = len(CITIES)
+        for branch_id, name in enumerate(BRANCHES, 1):
+            self.writer("Branch").add(branch_id, name, branch_id)
+
+    def catalog(self):
+        rng = self.rng
+        n_books, n_authors = self.counts["books"], self.counts["authors"]
+        for author_id in range(1, n_authors + 1):
+            self.writer("Author").add(author_id, *self.person())
+        author_cum = cumulative(zipf_weights(n_authors, 0.8))
+
+        self.isbns = []
+        for i in range(1, n_books + 1):
+            isbn = "978%010d" % i
+            self.isbns.append(isbn)
+            subjects = rng.sample(range(len(self.subjects)), rng.choices([1, 2, 3], [50, 35, 15])[0])
+            title = "%s %s%s" % (rng.choice(TITLE_PREFIXES),
+                                 rng.choice(SUBJECT_TOPICS[self.subjects[subjects[0]]]),
+                                 rng.choice(EDITIONS))
+            self.writer("Book").add(isbn, title, rng.randint(1, self.n_publishers),
+                                    rng.randint(self.as_of.year - 40, self.as_of.year))
+            for subject in sorted(subjects):
+                self.writer("BookSubject").add(isbn, subject + 1)
+            authors = set()
+            for _ in range(rng.choices([1, 2, 3], [60, 30, 10])[0]):
+                authors.add(bisect.bisect_left(author_cum, rng.random() * author_cum[-1]) + 1)
+            for author_id in sorted(authors):
+                self.writer("BookAuthor").add(isbn, author_id)
+
+        # Popularity rank is independent of isbn order
+        ranks = list(range(n_books))
+        rng.shuffle(ranks)
+        popularity = [0.0] * n_books
+        for book, weight in zip(ranks, zipf_weights(n_books, 1.0)):
+            popularity[book] = weight
+        self.book_cum = cumulative(popularity)
+
+        # One copy per book, the rest spread by (damped) popularity
+        self.copies_by_book = [[] for _ in range(n_books)]
+        extra = rng.choices(range(n_books), weights=[math.sqrt(w) for w in popularity],
+                            k=max(0, self.counts["copies"] - n_books))
+        owners = list(range(n_books)) + sorted(extra)
+        branch_cum = cumulative(BRANCH_WEIGHTS)
+        self.copy_rows = []
+        for copy_id, book in enumerate(owners, 1):
+            self.copies_by_book[book].append(copy_id)
+            branch_id = bisect.bisect_left(branch_cum, rng.random() * branch_cum[-1]) + 1
+            self.copy_rows.append((copy_id, self.isbns[book], branch_id,
+                                   rng.randint(1, self.n_terms), "BC%08d" % copy_id))
+
+    def patrons(self):
+        rng = self.rng
+        types = [t for t, _, _ in PATRON_TYPES]
+        type_cum = cumulative([share for _, share, _ in PATRON_TYPES])
+        activity = {t: scale for t, _, scale in PATRON_TYPES}
+        self.patron_rows = []
+        weights = []
+        for patron_id in range(1, self.counts["patrons"] + 1):
+            patron_type = types[bisect.bisect_left(type_cum, rng.random() * type_cum[-1])]
+            first, last = self.person()
+            email = "%s.%s.%d@example.edu" % (first.lower(), last.lower().replace("'", ""), patron_id)
+            address_id = rng.randint(101, self.n_addresses) if rng.random() < 0.9 else None
+            self.patron_rows.append([patron_id, first, last, email, patron_type, address_id])
+            weights.append(rng.gammavariate(0.8, 1.0) * activity[patron_type])
+        self.patron_cum = cumulative(weights)
+
+    # -- circulation -----------------------------------------------------
+
+    def due_s(self, loan_s, periods=1):
+        """Due at the end of the day, like circulation.due_date"""
+        return (loan_s // DAY + LOAN_PERIOD_DAYS * periods) * DAY + DAY - 1
+
+    def circulation(self):
+        rng = self.rng
+        n = self.counts["loans"]
+        books = [bisect.bisect_left(self.book_cum, x) for x in
+                 (rng.random() * self.book_cum[-1] for _ in range(n))]
+        patrons = [bisect.bisect_left(self.patron_cum, x) + 1 for x in
+                   (rng.random() * self.patron_cum[-1] for _ in range(n))]
+        kinds = [kind for _, kind in RETURN_MIX]
+        kind_cum = cumulative([share for share, _ in RETURN_MIX])
+        busy_until = [0] * (len(self.copy_rows) + 1)
+        branch_of = {row[0]: row[2] for row in self.copy_rows}
+        unpaid = {}
+        active_holds = set()
+        loans, fines, holds = self.writer("Loan"), self.writer("Fine"), self.writer("Reservation")
+
+        for loan_s, book, patron_id in zip(self.timestamps(n), books, patrons):
+            copy_id = next((c for c in self.copies_by_book[book] if busy_until[c] <= loan_s), None)
+            if copy_id is None:
+                if rng.random() < RESERVE_RATE:
+                    self.reservation(holds, patron_id, book, loan_s, branch_of, active_holds)
+                continue
+
+            kind = kinds[bisect.bisect_left(kind_cum, rng.random() * kind_cum[-1])]
+            due = self.due_s(loan_s)
+            if kind == "on_time":
+                returned = loan_s + rng.randint(2 * HOUR, due - loan_s)
+            elif kind == "renewed":
+                due = self.due_s(loan_s, 1 + rng.randint(1, MAX_RENEWALS))
+                returned = loan_s + rng.randint(LOAN_PERIOD_DAYS * DAY, due - loan_s)
+            elif kind == "late":
+                returned = due + rng.randint(1, 10) * DAY - rng.randint(HOUR, 12 * HOUR)
+            elif kind == "very_late":
+                returned = due + rng.randint(10, 90) * DAY - rng.randint(HOUR, 12 * HOUR)
+            else:
+                returned = None
+            if returned is not None and returned >= self.now_s:
+                returned = None  # still out as of as_of
+
+            loan_id = loans.rows + 1
+            loans.add(loan_id, copy_id, patron_id, self.ts(loan_s), self.ts(due),
+                      self.ts(returned) if returned is not None else None)
+            busy_until[copy_id] = returned if returned is not None else float("inf")
+            self.loan_fines(fines, unpaid, loan_id, patron_id, due, returned, kind == "lost")
+
+        self.unpaid = unpaid
+
+    def fine_status(self, created_s):
+        """Older fines have mostly been settled"""
+        age_days = (self.now_s - created_s) / DAY
+        if age_days > 60:
+            return self.rng.choices(["Paid", "Waived", "Unpaid"], [75, 10, 15])[0]
+        return self.rng.choices(["Unpaid", "Paid", "Pending"], [70, 25, 5])[0]
+
+    def add_fine(self, fines, unpaid, loan_id, patron_id, reason, amount, created_s, status=None):
+        status = status or self.fine_status(created_s)
+        fines.add(fines.rows + 1, loan_id, patron_id, self.reason_ids[reason], amount, status,
+                  self.ts(created_s))
+        if status == "Unpaid":
+            unpaid[patron_id] = unpaid.get(patron_id, 0) + amount
+
+    def loan_fines(self, fines, unpaid, loan_id, patron_id, due, returned, lost):
+        due_day = due // DAY
+        end_day = (returned if returned is not None else self.now_s) // DAY
+        days_late = end_day - due_day
+        # The accrual job first charges a loan the night after it falls due
+        accrued_s = (due_day + 1) * DAY + HOUR
+        if days_late > 0:
+            amount = money(min(FINE_LATE_MAX, days_late * FINE_DAILY_RATE))
+            # Open loans are still accruing, so their LATE fine is unpaid
+            status = None if returned is not None else "Unpaid"
+            self.add_fine(fines, unpaid, loan_id, patron_id, "LATE", amount, accrued_s, status)
+        if lost and days_late > 30:
+            self.add_fine(fines, unpaid, loan_id, patron_id, "LOST", LOST_FINE,
+                          (due_day + 31) * DAY + HOUR)
+        elif returned is not None and self.rng.random() < DAMAGED_RATE:
+            self.add_fine(fines, unpaid, loan_id, patron_id, "DAMAGED", DAMAGED_FINE, returned)
+
+    def reservation(self, holds, patron_id, book, created_s, branch_of, active_holds):
+        rng = self.rng
+        isbn = self.isbns[book]
+        branch_id = branch_of[rng.choice(self.copies_by_book[book])]
+        if self.now_s - created_s < LOAN_PERIOD_DAYS * DAY:
+            key = (patron_id, isbn, branch_id)
+            if key in active_holds:
+                return
+            active_holds.add(key)
+            status = rng.choices(["Active", "Waiting"], [70, 30])[0]
+        else:
+            status = rng.choices(["Fulfilled", "Cancelled"], [75, 25])[0]
+        holds.add(holds.rows + 1, patron_id, isbn, branch_id, self.ts(created_s), status)
+
+    def write_copies_and_patrons(self):
+        for row in self.copy_rows:
+            self.writer("Copy").add(*row)
+        for row in self.patron_rows:
+            self.writer("Patron").add(*row, money(self.unpaid.get(row[0], 0)))
+
+    # -- e-resources and inter-library loan ------------------------------
+
+    def eresources(self):
+        rng = self.rng
+        n_resources = self.counts["eresources"]
+        limits = []
+        for resource_id in range(1, n_resources + 1):
+            license_id = rng.randint(1, len(self.licenses))
+            limits.append(self.licenses[license_id - 1])
+            title = "%s %s (Online)" % (rng.choice(TITLE_PREFIXES),
+                                        rng.choice(SUBJECT_TOPICS[rng.choice(self.subjects)]))
+            self.writer("EResource").add(resource_id, title, rng.randint(1, len(RESOURCE_TYPES)),
+                                         license_id)
+
+        n = self.counts["sessions"]
+        resource_cum = cumulative(zipf_weights(n_resources, 1.0))
+        open_sessions = [0] * n_resources
+        sessions = self.writer("AccessSession")
+        for start_s in self.timestamps(n):
+            resource = bisect.bisect_left(resource_cum, rng.random() * resource_cum[-1])
+            patron_id = bisect.bisect_left(self.patron_cum, rng.random() * self.patron_cum[-1]) + 1
+            end_s = start_s + int(min(4 * HOUR, rng.lognormvariate(7.3, 0.8)))
+            # Sessions running at as_of stay open, within the license's seat limit
+            if end_s >= self.now_s and open_sessions[resource] < limits[resource]:
+                open_sessions[resource] += 1
+                end = None
+            else:
+                end = self.ts(min(end_s, self.now_s - 1))
+            sessions.add(sessions.rows + 1, patron_id, resource + 1, self.ts(start_s), end)
+
+        ill = self.writer("ILLRequest")
+        for requested_s in self.timestamps(self.counts["ill_requests"]):
+            age_days = (self.now_s - requested_s) / DAY
+            if age_days < 7:
+                status = "Requested"
+            elif age_days < 14:
+                status = "Shipped"
+            elif age_days < 30:
+                status = "Received"
+            else:
+                status = rng.choices(["Completed", "Cancelled"], [85, 15])[0]
+            patron_id = bisect.bisect_left(self.patron_cum, rng.random() * self.patron_cum[-1]) + 1
+            ill.add(ill.rows + 1, patron_id, rng.randint(1, self.n_partners),
+                    rng.choice(self.isbns), status, self.ts(requested_s))
+
+    def run(self):
+        self.addresses()
+        self.lookups()
+        self.catalog()
+        self.patrons()
+        self.circulation()
+        self.write_copies_and_patrons()
+        self.eresources()
+        writers = [self.writers[name] for name, _ in TABLES]
+        for writer in writers:
+            writer.close()
+        if self.fmt == "tsv":
+            with open(os.path.join(self.out_dir, "load.sql"), "w", encoding="utf-8") as load:
+                load.write(LOAD_PREAMBLE)
+                load.writelines(writer.load_statement() for writer in writers)
+                load.write(LOAD_POSTAMBLE)
+        return writers
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic UniLibPlus data")
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="Scale factor: 1 = 10k patrons / ~100k loans (default 1)")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed (default 42)")
+    parser.add_argument("--as-of", type=date.fromisoformat, default=date.today(),
+                        help="Date the data ends at, YYYY-MM-DD (default today)")
+    parser.add_argument("--years", type=float, default=3.0,
+                        help="Years of circulation history (default 3)")
+    parser.add_argument("--format", dest="fmt", choices=OUTPUT_FORMATS, default="sql",
+                        help="Multi-row INSERT files (sql) or LOAD DATA files (tsv)")
+    parser.add_argument("--rows-per-insert", type=int, default=1000,
+                        help="Rows per INSERT statement with --format sql (default 1000)")
+    parser.add_argument("--out", default="generated_data", help="Output directory")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.out, exist_ok=True)
+    started = timer.monotonic()
+    writers = Generator(args.scale, args.seed, args.as_of, args.years, args.out, args.fmt,
+                        args.rows_per_insert).run()
+    for writer in writers:
+        print("%-16s %10d rows  %s" % (writer.table, writer.rows, writer.filename))
+    print("Done in %.1fs (as of %s, seed %d)" % (timer.monotonic() - started, args.as_of, args.seed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""
+Hold queue for UniLibPlus: place, cancel, queue position and expiry.
+
+Reservations queue per (isbn, branch) in created_at order while 'Active' or
+'Waiting' (the stored Reservation.in_queue flag), and idx_reservation_queue
+keeps each queue in that order. The head of a queue is one index probe, so
+when a copy comes back (circulation.return_copy) or a hold is given up,
+sp_hold_allocate puts the copy on the hold shelf for the next patron, marks
+the reservation 'Ready' and queues a notice in HoldNotification. A queue
+position counts only the holds ahead in the same index range, never the rest
+of Reservation. 'Ready' holds not collected within HOLD_PICKUP_DAYS are
+expired in bulk by sp_hold_expire (hourly event and ``flask expire-holds``).
+
+Every path that touches both a copy and a reservation locks the Copy row
+first, as checkouts and returns do, so hold changes do not deadlock against
+circulation; a transaction that still loses a deadlock is rerun.
+"""
+import heapq
+from datetime import timedelta
+
+import pymysql
+
+from circulation import HOLD_PICKUP_DAYS, LOAN_PERIOD_DAYS
+from id_sequence import allocate_ids
+from transactions import ServiceError, run_transaction
+
+# MySQL error raised by SIGNAL in a trigger (duplicate reservation)
+ER_SIGNAL_EXCEPTION = 1644
+
+# Queued holds ahead of a reservation: the prefix of its queue in
+# idx_reservation_queue
+QUEUE_AHEAD_SQL = """
+    SELECT COUNT(*) AS ahead
+    FROM Reservation
+    WHERE isbn = %s
+      AND branch_id = %s
+      AND in_queue = 1
+      AND (created_at < %s OR (created_at = %s AND reservation_id < %s))
+"""
+
+QUEUE_LENGTH_SQL = """
+    SELECT COUNT(*) AS queue_length
+    FROM Reservation
+    WHERE isbn = %s
+      AND branch_id = %s
+      AND in_queue = 1
+"""
+
+# When each copy of the book at the branch is next free to go to the queue
+BRANCH_COPIES_SQL = """
+    SELECT c.copy_id, c.status, l.due_ts
+    FROM Copy c
+    LEFT JOIN Loan l ON c.current_loan_id = l.loan_id
+    WHERE c.isbn = %s
+      AND c.branch_id = %s
+"""
+
+UNSENT_NOTICES_SQL = """
+    SELECT n.notification_id, n.reservation_id, n.patron_id, n.kind, n.created_at,
+           p.email, r.isbn, r.branch_id, r.expires_at
+    FROM HoldNotification n
+    JOIN Patron p      ON n.patron_id = p.patron_id
+    JOIN Reservation r ON n.reservation_id = r.reservation_id
+    WHERE n.sent_at IS NULL
+    ORDER BY n.notification_id
+    LIMIT %s
+"""
+
+
+class HoldError(ServiceError):
+    """A hold request or change that the library's rules refuse"""
+
+
+def estimate_ready(now, free_at, position):
+    """When the patron at ``position`` (1-based) in the queue should get a copy
+
+    ``free_at`` holds, per copy at the branch, when it is next free to go to
+    the queue. Each copy serves the queue in turn and comes back one loan
+    period after it is handed on.
+    """
+    if not free_at:
+        return None
+    heap = [max(t, now) for t in free_at]
+    heapq.heapify(heap)
+    for _ in range(position - 1):
+        heapq.heapreplace(heap, heap[0] + timedelta(days=LOAN_PERIOD_DAYS))
+    return heap[0]
+
+
+def place_hold(conn, patron_id, isbn, branch_id):
+    """Queue a patron for a book at a branch; a free copy there is held at once"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT patron_id FROM Patron WHERE patron_id = %s", (patron_id,))
+        if cur.fetchone() is None:
+            raise HoldError("unknown_patron", "No patron with id %s" % patron_id, 404)
+        cur.execute("SELECT copy_id FROM Copy WHERE isbn = %s AND branch_id = %s LIMIT 1",
+                    (isbn, branch_id))
+        if cur.fetchone() is None:
+            raise HoldError("no_copies", "Branch %s has no copy of %s" % (branch_id, isbn), 404)
+    reservation_id = allocate_ids(conn, "reservation")
+
+    def work(cur):
+        # Lock a free copy before queueing: Copy rows are locked before Reservation
+        cur.execute("""
+            SELECT copy_id
+            FROM Copy
+            WHERE isbn = %s
+              AND status = 'AVAILABLE'
+              AND branch_id = %s
+            LIMIT 1
+            FOR UPDATE
+        """, (isbn, branch_id))
+        free = cur.fetchone()
+        cur.execute("""
+            INSERT INTO Reservation (reservation_id, patron_id, isbn, branch_id, created_at, status)
+            VALUES (%s, %s, %s, %s, NOW(), 'Waiting')
+        """, (reservation_id, patron_id, isbn, branch_id))
+        if free is not None:
+            cur.execute("CALL sp_hold_allocate(%s, %s)", (free["copy_id"], HOLD_PICKUP_DAYS))
+
+    try:
+        run_transaction(conn, work)
+    except pymysql.MySQLError as exc:
+        if exc.args and exc.args[0] == ER_SIGNAL_EXCEPTION:
+            raise HoldError("duplicate_hold", exc.args[-1])
+        raise
+    return hold_status(conn, reservation_id)
+
+
+def hold_status(conn, reservation_id):
+    """A hold's state; queued holds get their position and an estimated wait"""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT r.reservation_id, r.patron_id, r.isbn, r.branch_id, r.created_at, r.status,
+                   r.in_queue, r.ready_at, r.expires_at, c.barcode, NOW() AS now
+            FROM Reservation r
+            LEFT JOIN Copy c ON r.copy_id = c.copy_id
+            WHERE r.reservation_id = %s
+        """, (reservation_id,))
+        hold = cur.fetchone()
+        if hold is None:
+            raise HoldError("unknown_hold", "No reservation with id %s" % reservation_id, 404)
+        now = hold.pop("now")
+        in_queue = hold.pop("in_queue")
+        result = dict(hold, ok=True)
+        if not in_queue:
+            return result
+
+        key = (hold["isbn"], hold["branch_id"])
+        cur.execute(QUEUE_AHEAD_SQL, key + (hold["created_at"], hold["created_at"], reservation_id))
+        position = cur.fetchone()["ahead"] + 1
+        cur.execute(QUEUE_LENGTH_SQL, key)
+        queue_length = cur.fetchone()["queue_length"]
+        cur.execute(BRANCH_COPIES_SQL, key)
+        free_at = []
+        for copy in cur.fetchall():
+            if copy["status"] == "ON_LOAN":
+                free_at.append(copy["due_ts"])
+            elif copy["status"] == "RESERVED":
+                # Its holder collects it and keeps it for a loan period
+                free_at.append(now + timedelta(days=LOAN_PERIOD_DAYS))
+            else:
+                free_at.append(now)
+    ready = estimate_ready(now, free_at, position)
+    result.update(position=position, queue_length=queue_length, copies=len(free_at),
+                  estimated_ready=ready,
+                  estimated_wait_days=(ready - now).days if ready is not None else None)
+    return result
+
+
+def cancel_hold(conn, reservation_id):
+    """Withdraw a queued or ready hold; a held copy goes to the next patron"""
+    def work(cur):
+        # A 'Ready' hold's copy is locked before the reservation itself
+        cur.execute("SELECT copy_id FROM Reservation WHERE reservation_id = %s", (reservation_id,))
+        hold = cur.fetchone()
+        if hold is None:
+            raise HoldError("unknown_hold", "No reservation with id %s" % reservation_id, 404)
+        if hold["copy_id"] is not None:
+            cur.execute("SELECT copy_id FROM Copy WHERE copy_id = %s FOR UPDATE", (hold["copy_id"],))
+        cur.execute("""
+            SELECT status, copy_id
+            FROM Reservation
+            WHERE reservation_id = %s
+            FOR UPDATE
+        """, (reservation_id,))
+        hold = cur.fetchone()
+        if hold["status"] not in ("Active", "Waiting", "Ready"):
+            raise HoldError("hold_closed", "Reservation %s is already %s" % (reservation_id, hold["status"]))
+        cur.execute("UPDATE Reservation SET status = 'Cancelled' WHERE reservation_id = %s",
+                    (reservation_id,))
+        if hold["status"] == "Ready":
+            cur.execute("""
+                UPDATE Copy
+                SET hold_reservation_id = NULL
+                WHERE copy_id = %s
+                  AND hold_reservation_id = %s
+            """, (hold["copy_id"], reservation_id))
+            cur.execute("CALL sp_hold_allocate(%s, %s)", (hold["copy_id"], HOLD_PICKUP_DAYS))
+        return {"ok": True, "reservation_id": reservation_id, "status": "Cancelled"}
+
+    return run_transaction(conn, work)
+
+
+def expire_holds(conn, pickup_days=HOLD_PICKUP_DAYS):
+    """Expire uncollected 'Ready' holds and pass their copies on; returns how many"""
+    with conn.cursor() as cur:
+        cur.execute("CALL sp_hold_expire(%s)", (pickup_days,))
+        return cur.fetchone()["expired_holds"]
+
+
+def allocate_available(conn, pickup_days=HOLD_PICKUP_DAYS):
+    """Hold every free copy that has a queue for the head of that queue"""
+    with conn.cursor() as cur:
+        cur.execute("CALL sp_hold_allocate_available(%s)", (pickup_days,))
+
+
+def send_notices(conn, send, batch_size=500):
+    """Pass unsent hold notices to ``send(notice)`` in order; returns how many were sent
+
+    A notice is marked sent only after ``send`` returns, so a failed run
+    resends from the first unsent notice.
+    """
+    sent = 0
+    while True:
+        with conn.cursor() as cur:
+            cur.execute(UNSENT_NOTICES_SQL, (batch_size,))
+            notices = cur.fetchall()
+        if not notices:
+            return sent
+        for notice in notices:
+            send(notice)
+            with conn.cursor() as cur:
+                cur.execute("UPDATE HoldNotification SET sent_at = NOW() WHERE notification_id = %s",
+                            (notice["notification_id"],))
+            sent += 1
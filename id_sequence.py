@@ -0,0 +1,42 @@
+"""
+Block allocation of application-assigned primary keys for UniLibPlus.
+
+Tables such as Patron have plain INT primary keys (no AUTO_INCREMENT), so new
+ids come from the IdSequence table. One single-row UPDATE reserves a whole
+block of ids. The block is also bumped past the table's MAX(id), so rows
+loaded or inserted by hand do not collide; that floor is a plain snapshot
+read (one primary key index dive) taken before the UPDATE, because as a
+subquery of the UPDATE it would be a locking read of the index tail and
+wait on every open transaction inserting there.
+"""
+
+# sequence name -> (table, id column)
+ID_SEQUENCES = {
+    "patron": ("Patron", "patron_id"),
+    "loan": ("Loan", "loan_id"),
+    "fine": ("Fine", "fine_id"),
+    "session": ("AccessSession", "session_id"),
+    "reservation": ("Reservation", "reservation_id"),
+    "ill_request": ("ILLRequest", "request_id"),
+    "ill_batch": ("ILLBatch", "batch_id"),
+}
+
+
+def allocate_ids(conn, seq_name, count=1):
+    """Reserve ``count`` consecutive ids and return the first one"""
+    # Call outside a transaction (autocommit) so the IdSequence row lock is
+    # released as soon as the UPDATE finishes
+    table, column = ID_SEQUENCES[seq_name]
+    with conn.cursor() as cur:
+        cur.execute("SELECT COALESCE(MAX({column}), 0) + 1 AS floor_id FROM {table}"
+                    .format(table=table, column=column))
+        floor_id = cur.fetchone()["floor_id"]
+        cur.execute("""
+            UPDATE IdSequence
+            SET next_id = LAST_INSERT_ID(GREATEST(next_id, %s) + %s)
+            WHERE seq_name = %s
+        """, (floor_id, count, seq_name))
+        if cur.rowcount == 0:
+            raise LookupError("IdSequence has no row for %r (run summaries.sql)" % seq_name)
+        cur.execute("SELECT LAST_INSERT_ID() AS next_id")
+        return cur.fetchone()["next_id"] - count
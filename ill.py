@@ -0,0 +1,383 @@
+"""
+Inter-library loan workflow for UniLibPlus: requests, status changes and
+batched dispatch to partner libraries.
+
+A new ILLRequest is 'Requested'. The dispatcher claims the unbatched
+'Requested' requests of each partner into ILLBatch rows of up to
+``batch_size`` (one short transaction per batch over idx_illrequest_dispatch,
+``FOR UPDATE SKIP LOCKED`` so concurrent dispatchers never claim the same
+request) and hands each batch to a transport. Partners are served by a
+bounded thread pool, one worker per partner at a time, and a failed send is
+retried with exponential backoff; after the last attempt the batch is marked
+'Failed' and its requests are released for the next run. Transports are
+pluggable: FileTransport writes batches to a local directory as a stand-in
+for partners, HttpTransport POSTs them to PartnerLibrary.endpoint.
+
+Per-partner throughput (batches, requests, transport time) and turnaround
+(requested to received) accumulate in ILLPartnerStats.
+"""
+import json
+import os
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+
+from id_sequence import allocate_ids
+from transactions import ServiceError, run_transaction
+
+# status -> statuses it may move to; 'Sent' is set only by the dispatcher
+ILL_TRANSITIONS = {
+    "Requested": ("Sent", "Cancelled"),
+    "Sent": ("Shipped", "Cancelled"),
+    "Shipped": ("Received",),
+    "Received": ("Completed",),
+}
+
+PENDING_PARTNERS_SQL = """
+    SELECT DISTINCT partner_id
+    FROM ILLRequest
+    WHERE status = 'Requested'
+      AND batch_id IS NULL
+"""
+
+CLAIM_SQL = """
+    SELECT request_id, patron_id, isbn, requested_at
+    FROM ILLRequest
+    WHERE status = 'Requested'
+      AND batch_id IS NULL
+      AND partner_id = %s
+    ORDER BY request_id
+    LIMIT %s
+    FOR UPDATE SKIP LOCKED
+"""
+
+PARTNER_STATS_SQL = """
+    SELECT
+      pl.partner_id,
+      pl.name AS partner_name,
+      s.batches_sent,
+      s.batches_failed,
+      s.requests_sent,
+      s.send_attempts,
+      ROUND(s.requests_sent / NULLIF(s.send_ms, 0) * 1000, 2) AS requests_per_send_s,
+      s.requests_received,
+      ROUND(s.turnaround_seconds / NULLIF(s.requests_received, 0) / 86400, 2) AS avg_turnaround_days,
+      s.last_dispatch_at
+    FROM ILLPartnerStats s
+    JOIN PartnerLibrary pl ON s.partner_id = pl.partner_id
+    ORDER BY pl.partner_id
+"""
+
+
+class IllError(ServiceError):
+    """An ILL request or status change that the workflow refuses"""
+
+
+class TransportError(Exception):
+    """A batch the partner did not accept; the dispatcher retries it"""
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError("%r is not JSON serializable" % (value,))
+
+
+def batch_document(partner, batch_id, requests):
+    """The JSON body sent to a partner (batch_id lets the partner drop resends)"""
+    return json.dumps({"batch_id": batch_id, "partner_id": partner["partner_id"],
+                       "requests": requests}, default=_json_default)
+
+
+class FileTransport:
+    """Write each batch to ``directory/partner_<id>/batch_<id>.json``"""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def send(self, partner, batch_id, requests):
+        folder = os.path.join(self.directory, "partner_%s" % partner["partner_id"])
+        path = os.path.join(folder, "batch_%s.json" % batch_id)
+        try:
+            os.makedirs(folder, exist_ok=True)
+            # Write then rename, so a partner polling the folder never sees half a batch
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                f.write(batch_document(partner, batch_id, requests))
+            os.replace(path + ".tmp", path)
+        except OSError as exc:
+            raise TransportError(str(exc))
+
+
+class HttpTransport:
+    """POST each batch as JSON to the partner's PartnerLibrary.endpoint"""
+
+    def __init__(self, timeout=10.0):
+        self.timeout = timeout
+
+    def send(self, partner, batch_id, requests):
+        if not partner.get("endpoint"):
+            raise TransportError("Partner %s has no endpoint" % partner["partner_id"])
+        req = urllib.request.Request(
+            partner["endpoint"], data=batch_document(partner, batch_id, requests).encode("utf-8"),
+            headers={"Content-Type": "application/json"}, method="POST")
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as response:
+                response.read()
+        except (urllib.error.URLError, OSError) as exc:
+            raise TransportError(str(exc))
+
+
+def make_transport(spec, timeout=10.0):
+    """``file:<directory>`` or ``http``"""
+    kind, _, arg = spec.partition(":")
+    if kind == "file":
+        return FileTransport(arg or "ill-outbox")
+    if kind == "http":
+        return HttpTransport(timeout)
+    raise ValueError("Unknown ILL transport %r (use file:<dir> or http)" % spec)
+
+
+class DispatchStats:
+    """Counters for one dispatcher run, shared by its worker threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.monotonic()
+        self.batches_sent = 0
+        self.batches_failed = 0
+        self.requests_sent = 0
+        self.retries = 0
+        self.by_partner = {}
+
+    def record(self, partner_id, requests, attempts, sent):
+        with self._lock:
+            self.retries += attempts - 1
+            partner = self.by_partner.setdefault(partner_id, {"batches": 0, "requests": 0, "failed": 0})
+            if sent:
+                self.batches_sent += 1
+                self.requests_sent += requests
+                partner["batches"] += 1
+                partner["requests"] += requests
+            else:
+                self.batches_failed += 1
+                partner["failed"] += 1
+
+    def to_dict(self):
+        elapsed = time.monotonic() - self.started
+        with self._lock:
+            return {
+                "batches_sent": self.batches_sent,
+                "batches_failed": self.batches_failed,
+                "requests_sent": self.requests_sent,
+                "retries": self.retries,
+                "partners": len(self.by_partner),
+                "elapsed_s": round(elapsed, 3),
+                "requests_per_s": round(self.requests_sent / elapsed, 1) if elapsed > 0 else 0.0,
+                "by_partner": {pid: dict(p) for pid, p in self.by_partner.items()},
+            }
+
+
+def create_request(conn, patron_id, partner_id, isbn):
+    """Record a new 'Requested' ILL request; returns it"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT patron_id FROM Patron WHERE patron_id = %s", (patron_id,))
+        if cur.fetchone() is None:
+            raise IllError("unknown_patron", "No patron with id %s" % patron_id, 404)
+        cur.execute("SELECT partner_id FROM PartnerLibrary WHERE partner_id = %s", (partner_id,))
+        if cur.fetchone() is None:
+            raise IllError("unknown_partner", "No partner library with id %s" % partner_id, 404)
+        cur.execute("SELECT isbn FROM Book WHERE isbn = %s", (isbn,))
+        if cur.fetchone() is None:
+            raise IllError("unknown_book", "No book with ISBN %s" % isbn, 404)
+    request_id = allocate_ids(conn, "ill_request")
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO ILLRequest (request_id, patron_id, partner_id, isbn, status, requested_at)
+            VALUES (%s, %s, %s, %s, 'Requested', NOW())
+        """, (request_id, patron_id, partner_id, isbn))
+    return get_request(conn, request_id)
+
+
+def get_request(conn, request_id):
+    with conn.cursor() as cur:
+        cur.execute("SELECT * FROM vw_illrequest_detail WHERE request_id = %s", (request_id,))
+        row = cur.fetchone()
+    if row is None:
+        raise IllError("unknown_request", "No ILL request with id %s" % request_id, 404)
+    return dict(row, ok=True)
+
+
+def set_status(conn, request_id, status):
+    """Move a request along ILL_TRANSITIONS; receiving it records the turnaround"""
+    def work(cur):
+        cur.execute("""
+            SELECT partner_id, status, requested_at, NOW() AS now
+            FROM ILLRequest
+            WHERE request_id = %s
+            FOR UPDATE
+        """, (request_id,))
+        req = cur.fetchone()
+        if req is None:
+            raise IllError("unknown_request", "No ILL request with id %s" % request_id, 404)
+        if status == "Sent" or status not in ILL_TRANSITIONS.get(req["status"], ()):
+            raise IllError("bad_transition", "ILL request %s cannot go from %s to %s"
+                           % (request_id, req["status"], status))
+        if status == "Received":
+            cur.execute("UPDATE ILLRequest SET status = %s, received_at = %s WHERE request_id = %s",
+                        (status, req["now"], request_id))
+            cur.execute("""
+                INSERT INTO ILLPartnerStats (partner_id, requests_received, turnaround_seconds)
+                VALUES (%s, 1, %s)
+                ON DUPLICATE KEY UPDATE
+                  requests_received  = requests_received + 1,
+                  turnaround_seconds = turnaround_seconds + VALUES(turnaround_seconds)
+            """, (req["partner_id"], int((req["now"] - req["requested_at"]).total_seconds())))
+        else:
+            cur.execute("UPDATE ILLRequest SET status = %s WHERE request_id = %s", (status, request_id))
+
+    run_transaction(conn, work)
+    return get_request(conn, request_id)
+
+
+def claim_batch(conn, partner_id, batch_size):
+    """Claim up to ``batch_size`` unbatched requests of a partner; returns (batch_id, requests)"""
+    batch_id = allocate_ids(conn, "ill_batch")
+
+    def work(cur):
+        cur.execute(CLAIM_SQL, (partner_id, batch_size))
+        requests = cur.fetchall()
+        if not requests:
+            return None
+        cur.execute("""
+            INSERT INTO ILLBatch (batch_id, partner_id, status, request_count, created_at)
+            VALUES (%s, %s, 'Pending', %s, NOW())
+        """, (batch_id, partner_id, len(requests)))
+        cur.execute("UPDATE ILLRequest SET batch_id = %s WHERE request_id IN %s",
+                    (batch_id, [r["request_id"] for r in requests]))
+        return batch_id, requests
+
+    return run_transaction(conn, work)
+
+
+def _finish_batch(conn, partner_id, batch_id, requests, attempts, send_ms, error):
+    def work(cur):
+        if error is None:
+            cur.execute("""
+                UPDATE ILLBatch
+                SET status = 'Sent', attempts = %s, sent_at = NOW()
+                WHERE batch_id = %s
+            """, (attempts, batch_id))
+            # A request cancelled while its batch was in flight stays cancelled
+            cur.execute("""
+                UPDATE ILLRequest
+                SET status = 'Sent', dispatched_at = NOW()
+                WHERE batch_id = %s
+                  AND status = 'Requested'
+            """, (batch_id,))
+            cur.execute("""
+                INSERT INTO ILLPartnerStats
+                  (partner_id, batches_sent, requests_sent, send_attempts, send_ms, last_dispatch_at)
+                VALUES (%s, 1, %s, %s, %s, NOW())
+                ON DUPLICATE KEY UPDATE
+                  batches_sent     = batches_sent + 1,
+                  requests_sent    = requests_sent + VALUES(requests_sent),
+                  send_attempts    = send_attempts + VALUES(send_attempts),
+                  send_ms          = send_ms + VALUES(send_ms),
+                  last_dispatch_at = VALUES(last_dispatch_at)
+            """, (partner_id, len(requests), attempts, int(send_ms)))
+        else:
+            cur.execute("""
+                UPDATE ILLBatch
+                SET status = 'Failed', attempts = %s, last_error = %s
+                WHERE batch_id = %s
+            """, (attempts, error[:255], batch_id))
+            cur.execute("""
+                UPDATE ILLRequest
+                SET batch_id = NULL
+                WHERE batch_id = %s
+                  AND status = 'Requested'
+            """, (batch_id,))
+            cur.execute("""
+                INSERT INTO ILLPartnerStats (partner_id, batches_failed, send_attempts)
+                VALUES (%s, 1, %s)
+                ON DUPLICATE KEY UPDATE
+                  batches_failed = batches_failed + 1,
+                  send_attempts  = send_attempts + VALUES(send_attempts)
+            """, (partner_id, attempts))
+
+    run_transaction(conn, work)
+
+
+def send_with_retry(transport, partner, batch_id, requests, max_attempts, backoff_s, sleep=time.sleep):
+    """Send one batch; returns (attempts, send_ms, last error or None)"""
+    send_ms = 0.0
+    for attempt in range(1, max_attempts + 1):
+        started = time.perf_counter()
+        try:
+            transport.send(partner, batch_id, requests)
+            return attempt, send_ms + (time.perf_counter() - started) * 1000.0, None
+        except TransportError as exc:
+            send_ms += (time.perf_counter() - started) * 1000.0
+            error = str(exc) or exc.__class__.__name__
+        if attempt < max_attempts:
+            # Exponential backoff with jitter, so retries to one partner spread out
+            sleep(backoff_s * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+    return max_attempts, send_ms, error
+
+
+def dispatch_partner(pool, transport, partner, batch_size, max_attempts, backoff_s, stats):
+    """Claim and send a partner's pending requests batch by batch"""
+    with pool.connection() as conn:
+        while True:
+            claimed = claim_batch(conn, partner["partner_id"], batch_size)
+            if claimed is None:
+                return
+            batch_id, requests = claimed
+            try:
+                attempts, send_ms, error = send_with_retry(
+                    transport, partner, batch_id, requests, max_attempts, backoff_s)
+            except BaseException as exc:
+                # Release the claimed requests before giving up on the run
+                _finish_batch(conn, partner["partner_id"], batch_id, requests, 1, 0,
+                              "%s: %s" % (exc.__class__.__name__, exc))
+                raise
+            _finish_batch(conn, partner["partner_id"], batch_id, requests, attempts, send_ms, error)
+            stats.record(partner["partner_id"], len(requests), attempts, error is None)
+            if error is not None:
+                # Leave the rest of this partner for the next run
+                return
+
+
+def dispatch(pool, transport, batch_size=50, max_workers=4, max_attempts=5, backoff_s=1.0):
+    """Send every pending ILL request to its partner in batches; returns DispatchStats"""
+    stats = DispatchStats()
+    with pool.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(PENDING_PARTNERS_SQL)
+            partner_ids = [r["partner_id"] for r in cur.fetchall()]
+            if not partner_ids:
+                return stats
+            cur.execute("""
+                SELECT partner_id, name, endpoint
+                FROM PartnerLibrary
+                WHERE partner_id IN %s
+            """, (partner_ids,))
+            partners = cur.fetchall()
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ill-dispatch") as executor:
+        futures = [executor.submit(dispatch_partner, pool, transport, partner, batch_size,
+                                   max_attempts, backoff_s, stats)
+                   for partner in partners]
+        for future in futures:
+            future.result()
+    return stats
+
+
+def partner_stats(conn):
+    with conn.cursor() as cur:
+        cur.execute(PARTNER_STATS_SQL)
+        return cur.fetchall()
@@ -0,0 +1,105 @@
+"""
+Concurrent execution of the independent queries behind a single page.
+
+A page that needs several unrelated result sets hands them to
+``PageExecutor.run`` as named ``Query`` objects. The first query runs on the
+caller's connection in the calling thread; the rest are dispatched to a shared
+thread pool, each on its own pooled connection, so the page waits for its
+slowest query instead of the sum of all of them.
+
+A request that already holds a connection never waits for a second one:
+workers only take a connection that is free right away, and a query that
+finds the pool exhausted is run afterwards on the caller's connection. Under
+load a page degrades to running its queries one after another instead of
+every request holding one connection while it waits for another.
+"""
+import contextvars
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from db_pool import PoolTimeout
+
+# Worker result for a query that found no free connection
+_DEFERRED = object()
+
+
+class Query(namedtuple("Query", ("sql", "params", "one"))):
+    """One statement of a page: ``one=True`` returns fetchone() instead of fetchall()"""
+    __slots__ = ()
+
+    def __new__(cls, sql, params=(), one=False):
+        return super().__new__(cls, sql, params, one)
+
+
+def _execute(conn, query):
+    with conn.cursor() as cur:
+        cur.execute(query.sql, query.params)
+        return cur.fetchone() if query.one else cur.fetchall()
+
+
+class PageExecutor:
+    def __init__(self, pool, max_workers=8, timeout=None):
+        self.pool = pool
+        self.timeout = timeout  # checkout timeout for worker queries when run() gets no conn
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix="page-query")
+
+    def run(self, queries, conn=None):
+        """Run independent ``{name: Query}`` statements concurrently, return ``{name: rows}``"""
+        items = list(queries.items())
+        if not items:
+            return {}
+        if conn is not None:
+            (local_name, local_query), items = items[0], items[1:]
+
+        # Each worker runs in a copy of the caller's context, so per-request
+        # state in context variables (sql_metrics) covers its query too
+        # the caller's connection (when given) must not wait on the pool
+        timeout = 0 if conn is not None else self.timeout
+        futures = [(name, self._executor.submit(contextvars.copy_context().run,
+                                                self._run_pooled, query, timeout))
+                   for name, query in items]
+
+        results = {}
+        error = None
+        if conn is not None:
+            try:
+                results[local_name] = _execute(conn, local_query)
+            except Exception as exc:
+                error = exc
+        # Always wait for every worker so no pooled connection outlives the request
+        deferred = []
+        for name, future in futures:
+            try:
+                rows = future.result()
+            except Exception as exc:
+                error = error or exc
+                continue
+            if rows is _DEFERRED:
+                deferred.append(name)
+            else:
+                results[name] = rows
+        if error is not None:
+            raise error
+        for name in deferred:
+            results[name] = _execute(conn, queries[name])
+        return results
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+    def _run_pooled(self, query, timeout):
+        try:
+            conn = self.pool.acquire(timeout)
+        except PoolTimeout:
+            if timeout == 0:
+                return _DEFERRED
+            raise
+        failed = False
+        try:
+            return _execute(conn, query)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self.pool.release(conn, discard=failed and not conn.open)
@@ -0,0 +1,183 @@
+"""
+Bulk patron import for UniLibPlus.
+
+Reads patrons from CSV (header row) or NDJSON, validates every row, reserves
+patron ids in blocks from IdSequence and inserts each batch with one
+``executemany`` in its own short transaction. Rows that fail are reported by
+line number; a batch the database rejects is retried row by row so only the
+offending rows are lost.
+"""
+import csv
+import io
+import json
+import re
+
+import pymysql
+
+from id_sequence import allocate_ids
+
+PATRON_TYPES = ("Student", "Faculty", "Staff", "Alumni")
+IMPORT_FORMATS = ("csv", "ndjson")
+EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+MAX_REPORTED_ERRORS = 1000
+
+INSERT_PATRON_SQL = """
+    INSERT INTO Patron (patron_id, first_name, last_name, email, patron_type, address_id, balance)
+    VALUES (%s, %s, %s, %s, %s, %s, 0.00)
+"""
+
+
+class ImportReport:
+    def __init__(self):
+        self.rows = 0
+        self.inserted = 0
+        self.failed = 0
+        self.errors = []  # first MAX_REPORTED_ERRORS {line, error} entries
+
+    def error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "error": message})
+
+    def to_dict(self):
+        return {
+            "rows": self.rows,
+            "inserted": self.inserted,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors),
+        }
+
+
+def read_rows(stream, fmt):
+    """Yield (line number, dict) for each record of a text stream"""
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == "ndjson":
+        for line_no, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as exc:
+                row = exc
+            yield line_no, row
+    else:
+        raise ValueError("unsupported import format %r" % fmt)
+
+
+def text_stream(binary):
+    """Wrap an uploaded binary stream for reading as UTF-8 text"""
+    return io.TextIOWrapper(binary, encoding="utf-8-sig", newline="")
+
+
+def clean_row(row):
+    """Return (first_name, last_name, email, patron_type, address_id) or raise ValueError"""
+    if isinstance(row, Exception):
+        raise ValueError("invalid JSON: %s" % row)
+    if not isinstance(row, dict):
+        raise ValueError("record is not a JSON object")
+
+    def text(key, limit, required):
+        value = row.get(key)
+        value = str(value).strip() if value is not None else ""
+        if required and not value:
+            raise ValueError("%s is required" % key)
+        if len(value) > limit:
+            raise ValueError("%s is longer than %d characters" % (key, limit))
+        return value or None
+
+    first_name = text("first_name", 80, True)
+    last_name = text("last_name", 80, True)
+    email = text("email", 120, False)
+    if email is not None:
+        email = email.lower()
+        if not EMAIL_RE.match(email):
+            raise ValueError("email %r is not valid" % email)
+    patron_type = text("patron_type", 20, True).capitalize()
+    if patron_type not in PATRON_TYPES:
+        raise ValueError("patron_type must be one of %s" % ", ".join(PATRON_TYPES))
+    address_id = text("address_id", 11, False)
+    if address_id is not None:
+        try:
+            address_id = int(address_id)
+        except ValueError:
+            raise ValueError("address_id must be an integer")
+    return first_name, last_name, email, patron_type, address_id
+
+
+def _existing(cur, sql, values):
+    if not values:
+        return set()
+    placeholders = ", ".join(["%s"] * len(values))
+    cur.execute(sql % placeholders, list(values))
+    return {next(iter(row.values())) for row in cur.fetchall()}
+
+
+def _load_batch(conn, batch, report):
+    """Insert one batch of (line, values) rows that passed validation"""
+    with conn.cursor() as cur:
+        # Reject rows that would trip the UNIQUE(email) / Address FK up front,
+        # so the whole batch normally goes in with a single statement
+        taken = {e.lower() for e in _existing(cur, "SELECT email FROM Patron WHERE email IN (%s)",
+                                              {v[2] for _, v in batch if v[2]})}
+        addresses = _existing(cur, "SELECT address_id FROM Address WHERE address_id IN (%s)",
+                              {v[4] for _, v in batch if v[4] is not None})
+    rows = []
+    for line, values in batch:
+        if values[2] in taken:
+            report.error(line, "email %s is already registered" % values[2])
+        elif values[4] is not None and values[4] not in addresses:
+            report.error(line, "address_id %d does not exist" % values[4])
+        else:
+            rows.append((line, values))
+    if not rows:
+        return
+
+    first_id = allocate_ids(conn, "patron", len(rows))
+    params = [(first_id + i,) + values for i, (_, values) in enumerate(rows)]
+    try:
+        conn.begin()
+        with conn.cursor() as cur:
+            cur.executemany(INSERT_PATRON_SQL, params)
+        conn.commit()
+        report.inserted += len(rows)
+    except pymysql.MySQLError:
+        conn.rollback()
+        # Something slipped past the pre-checks (e.g. a concurrent insert of
+        # the same email): retry row by row to isolate the bad rows
+        with conn.cursor() as cur:
+            for (line, _), row_params in zip(rows, params):
+                try:
+                    cur.execute(INSERT_PATRON_SQL, row_params)
+                    report.inserted += 1
+                except pymysql.MySQLError as exc:
+                    report.error(line, exc.args[-1] if exc.args else str(exc))
+
+
+def import_patrons(conn, records, batch_size=1000):
+    """Validate and insert (line, record) pairs; returns an ImportReport"""
+    report = ImportReport()
+    batch = []
+    seen_emails = set()
+    for line, record in records:
+        report.rows += 1
+        try:
+            values = clean_row(record)
+        except ValueError as exc:
+            report.error(line, str(exc))
+            continue
+        if values[2] is not None:
+            if values[2] in seen_emails:
+                report.error(line, "email %s appears more than once in the file" % values[2])
+                continue
+            seen_emails.add(values[2])
+        batch.append((line, values))
+        if len(batch) >= batch_size:
+            _load_batch(conn, batch, report)
+            batch = []
+    if batch:
+        _load_batch(conn, batch, report)
+    return report
@@ -0,0 +1,183 @@
+"""
+Query-plan regression checks for UniLibPlus routes.
+
+Each route in PLAN_ROUTES is requested through the Flask test client against
+a real (seeded) database while every statement sent to MySQL is recorded.
+Every recorded SELECT is then run through ``EXPLAIN FORMAT=JSON`` and the plan
+is flagged if it reads a table or a whole index, or sorts with a filesort,
+over more than ``max_rows`` estimated rows. Routes that aggregate whole tables
+on purpose are listed in ALLOWED_SCANS with the reason.
+
+Run with ``flask --app app check-plans``; it exits non-zero on a regression.
+"""
+import json
+import re
+from contextlib import contextmanager
+
+import pymysql
+
+# Route URLs to exercise; {patron_id}, {isbn}, {branch_id}, {author_id} and
+# {reservation_id} are filled from the database
+PLAN_ROUTES = [
+    "/",
+    "/books",
+    "/books?search=data",
+    "/books?search=978",
+    "/books?search=db",
+    "/book/{isbn}",
+    "/availability/{isbn}?branch_id={branch_id}",
+    "/availability/{isbn}/nearest?branch_id={branch_id}",
+    "/holds/{reservation_id}",
+    "/patrons",
+    "/patron/{patron_id}",
+    "/loans",
+    "/loans?filter=current",
+    "/loans?filter=overdue",
+    "/loans?filter=returned",
+    "/fines",
+    "/statistics",
+    "/analytics/patron-ranking",
+    "/analytics/multi-branch-patrons",
+    "/analytics/book-popularity",
+    "/analytics/reservations-no-loans",
+    "/analytics/repeat-borrowers",
+    "/analytics/fine-analysis",
+    "/analytics/subject-patterns",
+    "/analytics/subject-patterns?patron_id={patron_id}",
+    "/analytics/monthly-loans",
+    "/analytics/co-authors",
+    "/analytics/co-authors?author_id={author_id}",
+    "/analytics/eresource-usage",
+]
+
+# Routes whose plans may scan whole tables, and why
+ALLOWED_SCANS = {
+    "/analytics/patron-ranking": "ranks every fined patron; served from the result cache",
+    "/analytics/multi-branch-patrons": "aggregates every loan; served from the result cache",
+    "/analytics/book-popularity": "buckets every book; served from the result cache",
+    "/analytics/repeat-borrowers": "aggregates every loan; served from the result cache",
+    "/analytics/fine-analysis": "aggregates every fine; served from the result cache",
+}
+
+EXPLAINABLE = re.compile(r"^\s*(SELECT|WITH)\b", re.I)
+IGNORED = re.compile(r"^\s*SELECT\s+(LAST_INSERT_ID|@@|1\s*$)", re.I)
+
+
+class RecordingConnection(pymysql.connections.Connection):
+    """PyMySQL connection that appends every statement it sends to ``sink``"""
+    sink = None
+
+    def query(self, sql, unbuffered=False):
+        if self.sink is not None:
+            self.sink.append(sql if isinstance(sql, str) else sql.decode("utf-8", "replace"))
+        return super().query(sql, unbuffered)
+
+
+def _rows(node):
+    return int(node.get("rows_examined_per_scan") or node.get("rows_produced_per_join") or 0)
+
+
+def plan_problems(plan, max_rows):
+    """Full scans and large filesorts in an EXPLAIN FORMAT=JSON plan"""
+    problems = []
+
+    def walk(node):
+        """Return the largest per-scan row estimate below ``node``"""
+        if isinstance(node, list):
+            return max([walk(item) for item in node] or [0])
+        if not isinstance(node, dict):
+            return 0
+        largest = 0
+        table = node.get("table")
+        if isinstance(table, dict):
+            rows = _rows(table)
+            largest = rows
+            access = table.get("access_type")
+            if access in ("ALL", "index") and rows > max_rows:
+                problems.append("%s of %s (~%d rows)" % (
+                    "full table scan" if access == "ALL" else "full index scan",
+                    table.get("table_name"), rows))
+        for key, value in node.items():
+            if isinstance(value, (dict, list)):
+                largest = max(largest, walk(value))
+        if node.get("using_filesort") and largest > max_rows:
+            problems.append("filesort over ~%d rows" % largest)
+        return largest
+
+    walk(plan)
+    return problems
+
+
+def explain(conn, sql):
+    with conn.cursor() as cur:
+        cur.execute("EXPLAIN FORMAT=JSON " + sql)
+        row = cur.fetchone()
+    return json.loads(row["EXPLAIN"] if isinstance(row, dict) else row[0])
+
+
+def sample_values(conn):
+    """Busiest patron, book (and a branch holding it), co-author and a queued hold, so detail routes hit real rows"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT patron_id FROM PatronActivity ORDER BY total_loans DESC LIMIT 1")
+        patron = cur.fetchone()
+        cur.execute("SELECT isbn FROM BookCirculationStats ORDER BY times_loaned DESC LIMIT 1")
+        book = cur.fetchone()
+        cur.execute("SELECT branch_id FROM Copy WHERE isbn = %s LIMIT 1",
+                    (book["isbn"] if book else None,))
+        branch = cur.fetchone()
+        cur.execute("SELECT author1_id FROM CoAuthorPair ORDER BY books_together DESC LIMIT 1")
+        author = cur.fetchone()
+        cur.execute("SELECT reservation_id FROM Reservation WHERE in_queue = 1 LIMIT 1")
+        hold = cur.fetchone()
+    return {"patron_id": patron["patron_id"] if patron else 1,
+            "isbn": book["isbn"] if book else "0000000000000",
+            "branch_id": branch["branch_id"] if branch else 1,
+            "author_id": author["author1_id"] if author else 1,
+            "reservation_id": hold["reservation_id"] if hold else 1}
+
+
+@contextmanager
+def swapped_pool(app_module, connect):
+    """Point the app and its page executor at a fresh pool of ``connect()`` connections"""
+    original_pool = app_module.pool
+    pool = type(original_pool)(connect, min_size=0, max_size=original_pool.max_size)
+    app_module.pool = app_module.page_executor.pool = pool
+    app_module.result_cache.clear()
+    try:
+        yield pool
+    finally:
+        app_module.pool = app_module.page_executor.pool = original_pool
+        pool.close()
+
+
+def check_plans(app_module, db_config, max_rows=1000, routes=None):
+    """Return [(url, statement, problems, allowed_reason)] for every flagged plan"""
+    sink = []
+
+    def connect():
+        conn = RecordingConnection(**db_config)
+        conn.sink = sink
+        return conn
+
+    findings = []
+    with swapped_pool(app_module, connect) as pool:
+        with pool.connection() as conn:
+            conn.sink = None
+            values = sample_values(conn)
+            client = app_module.app.test_client()
+            for template in routes or PLAN_ROUTES:
+                url = template.format(**values)
+                del sink[:]
+                response = client.get(url)
+                if response.status_code >= 400:
+                    findings.append((url, None, ["HTTP %d" % response.status_code], None))
+                    continue
+                seen = set()
+                for sql in list(sink):
+                    if not EXPLAINABLE.match(sql) or IGNORED.match(sql) or sql in seen:
+                        continue
+                    seen.add(sql)
+                    problems = plan_problems(explain(conn, sql), max_rows)
+                    if problems:
+                        findings.append((url, sql, problems, ALLOWED_SCANS.get(template)))
+    return findings
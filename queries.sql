@@ -0,0 +1,393 @@
+-- =========================================================
+-- queries.sql
+-- Named statements used by app.py, loaded once at startup by
+-- query_registry.py. Each follows a "-- name:" line and takes
+-- :named parameters; {{name}} pastes in another statement.
+-- =========================================================
+
+-- Materialized "DASHBOARD MEGA SUMMARY" counters: the sum of the 32
+-- DashboardSummary slot rows (is_stale once the date-relative counters need a
+-- reconcile); total_subjects is a loose index scan of BookSubject(subject_id)
+-- name: dashboard-summary
+SELECT
+  CAST(SUM(total_books) AS SIGNED) AS total_books,
+  CAST(SUM(total_copies) AS SIGNED) AS total_copies,
+  (SELECT COUNT(DISTINCT subject_id) FROM BookSubject) AS total_subjects,
+  CAST(SUM(total_patrons) AS SIGNED) AS total_patrons,
+  CAST(SUM(active_patrons_90d) AS SIGNED) AS active_patrons_90d,
+  CAST(SUM(total_loans) AS SIGNED) AS total_loans,
+  CAST(SUM(current_loans) AS SIGNED) AS current_loans,
+  CAST(SUM(overdue_loans) AS SIGNED) AS overdue_loans,
+  ROUND(
+    (SUM(closed_duration_days) + SUM(current_loans) * TO_DAYS(CURDATE()) - SUM(open_loan_day_sum))
+    / NULLIF(SUM(total_loans), 0),
+    2
+  ) AS avg_duration_days,
+  CAST(SUM(loans_last_7d) AS SIGNED) AS loans_last_7d,
+  CAST(SUM(returns_last_7d) AS SIGNED) AS returns_last_7d,
+  SUM(total_unpaid_fines) AS total_unpaid_fines,
+  MIN(as_of_date) AS as_of_date,
+  COALESCE(MIN(as_of_date) < CURDATE(), 1) AS is_stale
+FROM DashboardSummary;
+
+-- updated_complex_query.sql "DASHBOARD OVERDUE ALERT WITH RISK SCORE",
+-- with patron history and fines read from PatronActivity
+-- name: dashboard-overdue-risk
+WITH OverdueLoans AS (
+  SELECT
+    l.loan_id,
+    l.patron_id,
+    l.copy_id,
+    l.loan_ts,
+    l.due_ts,
+    l.return_ts,
+    DATEDIFF(CURDATE(), DATE(l.due_ts)) AS days_overdue
+  FROM Loan l
+  WHERE l.return_ts IS NULL
+    AND l.due_ts < CURDATE()
+)
+SELECT
+  o.loan_id,
+  o.patron_id,
+  CONCAT(p.first_name, ' ', p.last_name) AS patron_name,
+  b.title AS book_title,
+  DATE(o.due_ts) AS due_date,
+  o.days_overdue,
+  pa.total_loans AS all_loans,
+  pa.overdue_loans + pa.late_returns AS overdue_or_late_loans,
+  pa.unpaid_fines,
+  (
+    o.days_overdue * 1.0
+    + (pa.overdue_loans + pa.late_returns) * 2.0
+    + (pa.unpaid_fines / 10.0)
+  ) AS risk_score
+FROM OverdueLoans o
+JOIN Patron p ON o.patron_id = p.patron_id
+JOIN Copy   c ON o.copy_id   = c.copy_id
+JOIN Book   b ON c.isbn      = b.isbn
+LEFT JOIN PatronActivity pa ON p.patron_id = pa.patron_id
+ORDER BY risk_score DESC, o.days_overdue DESC
+LIMIT 10;
+
+-- Branches holding an available copy, nearest to branch :branch_id first.
+-- Branches have no coordinates, so "nearest" ranks the same branch, then
+-- the same city, state and country of the branch address.
+-- name: nearest-available
+SELECT
+  br.branch_id,
+  br.name AS branch_name,
+  ac.available_copies,
+  CASE
+    WHEN br.branch_id = o.branch_id THEN 0
+    WHEN a.country = o.country AND a.city = o.city THEN 1
+    WHEN a.country = o.country AND a.state = o.state THEN 2
+    WHEN a.country = o.country THEN 3
+    ELSE 4
+  END AS distance_rank
+FROM (
+  SELECT branch_id, COUNT(*) AS available_copies
+  FROM Copy
+  WHERE isbn = :isbn
+    AND status = 'AVAILABLE'
+  GROUP BY branch_id
+) ac
+JOIN Branch br ON ac.branch_id = br.branch_id
+JOIN Address a ON br.address_id = a.address_id
+JOIN (
+  SELECT b.branch_id, a.city, a.state, a.country
+  FROM Branch b
+  JOIN Address a ON b.address_id = a.address_id
+  WHERE b.branch_id = :branch_id
+) o
+ORDER BY distance_rank, ac.available_copies DESC, br.branch_id
+LIMIT 1;
+
+-- Fine totals come from PatronActivity (kept current by the Fine triggers), so
+-- this is a range scan of idx_patronactivity_unpaid instead of aggregating
+-- every fine through vw_patron_fines_summary
+-- name: fines
+SELECT p.patron_id, p.first_name, p.last_name, p.email, pa.total_fines, pa.unpaid_fines
+FROM PatronActivity pa
+JOIN Patron p ON pa.patron_id = p.patron_id
+WHERE pa.unpaid_fines > 0
+ORDER BY pa.unpaid_fines DESC;
+
+-- Q12: Window Functions - Rank patrons by fines within each type
+-- name: patron-ranking
+SELECT
+  patron_id,
+  first_name,
+  last_name,
+  patron_type,
+  total_fines,
+  unpaid_fines,
+  ROW_NUMBER() OVER (PARTITION BY patron_type ORDER BY total_fines DESC) AS row_num,
+  RANK() OVER (PARTITION BY patron_type ORDER BY total_fines DESC) AS rank_fines,
+  DENSE_RANK() OVER (PARTITION BY patron_type ORDER BY total_fines DESC) AS dense_rank_fines
+FROM vw_patron_fines_summary
+JOIN Patron p USING (patron_id)
+WHERE total_fines > 0
+ORDER BY patron_type, total_fines DESC;
+
+-- Q14: CTE - Patrons with loans in multiple branches
+-- name: multi-branch-patrons
+WITH PatronBranchLoans AS (
+  SELECT DISTINCT
+    l.patron_id,
+    c.branch_id,
+    br.name AS branch_name,
+    COUNT(DISTINCT l.loan_id) AS loans_at_branch
+  FROM Loan l
+  JOIN Copy c ON l.copy_id = c.copy_id
+  JOIN Branch br ON c.branch_id = br.branch_id
+  GROUP BY l.patron_id, c.branch_id, br.name
+),
+MultiBranchPatrons AS (
+  SELECT
+    patron_id,
+    COUNT(DISTINCT branch_id) AS num_branches,
+    SUM(loans_at_branch) AS total_loans
+  FROM PatronBranchLoans
+  GROUP BY patron_id
+  HAVING num_branches > 1
+)
+SELECT
+  p.patron_id,
+  CONCAT(p.first_name, ' ', p.last_name) AS patron_name,
+  mbp.num_branches,
+  mbp.total_loans,
+  GROUP_CONCAT(DISTINCT pbl.branch_name ORDER BY pbl.branch_name SEPARATOR ', ') AS branches_used
+FROM MultiBranchPatrons mbp
+JOIN Patron p ON mbp.patron_id = p.patron_id
+JOIN PatronBranchLoans pbl ON mbp.patron_id = pbl.patron_id
+GROUP BY p.patron_id, patron_name, mbp.num_branches, mbp.total_loans
+ORDER BY mbp.num_branches DESC, mbp.total_loans DESC;
+
+-- Q15: Complex CASE - Book popularity categories
+-- name: book-popularity
+SELECT
+  CASE
+    WHEN loan_count = 0 THEN 'Never Loaned'
+    WHEN loan_count BETWEEN 1 AND 5 THEN 'Low Popularity (1-5 loans)'
+    WHEN loan_count BETWEEN 6 AND 15 THEN 'Medium Popularity (6-15 loans)'
+    WHEN loan_count BETWEEN 16 AND 30 THEN 'High Popularity (16-30 loans)'
+    ELSE 'Very High Popularity (30+ loans)'
+  END AS popularity_category,
+  COUNT(*) AS num_books,
+  AVG(loan_count) AS avg_loans_per_book,
+  MIN(loan_count) AS min_loans,
+  MAX(loan_count) AS max_loans,
+  SUM(loan_count) AS total_loans
+FROM (
+  SELECT
+    isbn,
+    times_loaned AS loan_count
+  FROM BookCirculationStats
+) AS book_loans
+GROUP BY popularity_category
+ORDER BY 
+  CASE popularity_category
+    WHEN 'Never Loaned' THEN 1
+    WHEN 'Low Popularity (1-5 loans)' THEN 2
+    WHEN 'Medium Popularity (6-15 loans)' THEN 3
+    WHEN 'High Popularity (16-30 loans)' THEN 4
+    ELSE 5
+  END;
+
+-- Q16: EXISTS - Patrons with reservations but no loans
+-- name: reservations-no-loans
+SELECT
+  p.patron_id,
+  CONCAT(p.first_name, ' ', p.last_name) AS patron_name,
+  p.email,
+  p.patron_type,
+  COUNT(r.reservation_id) AS active_reservations
+FROM Patron p
+JOIN Reservation r ON p.patron_id = r.patron_id
+WHERE r.status IN ('Active', 'Waiting', 'Ready')
+  AND NOT EXISTS (
+    SELECT 1
+    FROM Loan l
+    WHERE l.patron_id = p.patron_id
+  )
+GROUP BY p.patron_id, patron_name, p.email, p.patron_type
+ORDER BY active_reservations DESC, patron_name;
+
+-- Q19: Self-Join - Repeat borrowers of same book
+-- name: repeat-borrowers
+SELECT
+  p.patron_id,
+  CONCAT(p.first_name, ' ', p.last_name) AS patron_name,
+  b.isbn,
+  b.title,
+  COUNT(DISTINCT l1.loan_id) AS times_borrowed,
+  MIN(l1.loan_ts) AS first_loan,
+  MAX(l1.loan_ts) AS last_loan,
+  DATEDIFF(MAX(l1.loan_ts), MIN(l1.loan_ts)) AS days_between_first_last
+FROM Patron p
+JOIN Loan l1 ON p.patron_id = l1.patron_id
+JOIN Copy c1 ON l1.copy_id = c1.copy_id
+JOIN Book b ON c1.isbn = b.isbn
+GROUP BY p.patron_id, patron_name, b.isbn, b.title
+HAVING times_borrowed > 1
+ORDER BY times_borrowed DESC, patron_name, b.title;
+
+-- Q23: Fine analysis by reason
+-- name: fine-analysis
+SELECT
+  fr.code AS fine_reason_code,
+  fr.description AS fine_reason,
+  COUNT(f.fine_id) AS total_fines,
+  SUM(f.amount) AS total_amount,
+  AVG(f.amount) AS avg_amount,
+  MIN(f.amount) AS min_amount,
+  MAX(f.amount) AS max_amount,
+  SUM(CASE WHEN f.status = 'Paid' THEN f.amount ELSE 0 END) AS paid_amount,
+  SUM(CASE WHEN f.status = 'Unpaid' THEN f.amount ELSE 0 END) AS unpaid_amount,
+  COUNT(CASE WHEN f.status = 'Paid' THEN 1 END) AS paid_count,
+  COUNT(CASE WHEN f.status = 'Unpaid' THEN 1 END) AS unpaid_count,
+  ROUND(
+    100.0 * COUNT(CASE WHEN f.status = 'Paid' THEN 1 END) / COUNT(f.fine_id),
+    2
+  ) AS payment_rate_pct
+FROM FineReason fr
+LEFT JOIN Fine f ON fr.reason_id = f.reason_id
+GROUP BY fr.reason_id, fr.code, fr.description
+ORDER BY total_amount DESC;
+
+-- Closed months come from LoanMonthlyRollup; only loans after the newest
+-- closed month are counted live (a range of idx_loan_loants), so the cost
+-- follows the number of months rather than the number of loans
+-- name: monthly-loans
+SELECT
+  DATE_FORMAT(r.month, '%Y-%m') AS loan_month,
+  r.patron_type,
+  r.loan_count,
+  0 AS is_live
+FROM LoanMonthlyRollup r
+UNION ALL
+SELECT
+  DATE_FORMAT(l.loan_ts, '%Y-%m') AS loan_month,
+  p.patron_type,
+  COUNT(*) AS loan_count,
+  1 AS is_live
+FROM Loan l
+JOIN Patron p ON l.patron_id = p.patron_id
+WHERE l.loan_ts >= COALESCE(
+        (SELECT MAX(month) + INTERVAL 1 MONTH FROM LoanMonthlyRollup), '1000-01-01')
+GROUP BY loan_month, p.patron_type
+ORDER BY loan_month, patron_type;
+
+-- Author pairs come from the trigger-maintained CoAuthorPair graph, so this
+-- is a range scan of idx_coauthorpair_books instead of a BookAuthor self-join
+-- name: co-authors
+SELECT
+  cp.author1_id,
+  CONCAT(a1.first_name, ' ', a1.last_name) AS author1_name,
+  cp.author2_id,
+  CONCAT(a2.first_name, ' ', a2.last_name) AS author2_name,
+  cp.books_together
+FROM CoAuthorPair cp
+JOIN Author a1 ON cp.author1_id = a1.author_id
+JOIN Author a2 ON cp.author2_id = a2.author_id
+WHERE cp.books_together >= :min_books
+ORDER BY cp.books_together DESC, author1_name, author2_name;
+
+-- Top collaborators of one author: the PK prefix (author1_id) plus
+-- idx_coauthorpair_author2, with that author always in the author1 columns
+-- name: co-author-collaborators
+SELECT
+  a1.author_id AS author1_id,
+  CONCAT(a1.first_name, ' ', a1.last_name) AS author1_name,
+  a2.author_id AS author2_id,
+  CONCAT(a2.first_name, ' ', a2.last_name) AS author2_name,
+  p.books_together
+FROM (
+  SELECT author2_id AS collaborator_id, books_together
+  FROM CoAuthorPair
+  WHERE author1_id = :author_id
+  UNION ALL
+  SELECT author1_id, books_together
+  FROM CoAuthorPair
+  WHERE author2_id = :author_id
+) p
+JOIN Author a1 ON a1.author_id = :author_id
+JOIN Author a2 ON a2.author_id = p.collaborator_id
+WHERE p.books_together >= :min_books
+ORDER BY p.books_together DESC, author2_name
+LIMIT 100;
+
+-- Reads only the EResourceUsageDaily / EResourceUsageHourly rollups (see
+-- eresource_usage.py) for the last :days days; hours_at_limit counts the hours
+-- whose peak concurrency reached the licence's concurrent_limit
+-- name: eresource-utilization
+SELECT
+  r.resource_id,
+  r.title,
+  rt.name AS resource_type,
+  pv.provider_id,
+  pv.name AS provider_name,
+  l.concurrent_limit,
+  COALESCE(d.sessions_started, 0) AS sessions_started,
+  ROUND(COALESCE(d.usage_seconds, 0) / 3600, 1) AS usage_hours,
+  COALESCE(d.peak_concurrent, 0) AS peak_concurrent,
+  ROUND(100.0 * COALESCE(d.peak_concurrent, 0) / l.concurrent_limit, 1) AS peak_pct_of_limit,
+  ROUND(100.0 * COALESCE(d.usage_seconds, 0) / (l.concurrent_limit * :days * 86400), 2)
+    AS seat_utilization_pct,
+  COALESCE(h.hours_at_limit, 0) AS hours_at_limit
+FROM EResource r
+JOIN ResourceType rt ON r.resource_type_id = rt.resource_type_id
+JOIN License l       ON r.license_id = l.license_id
+JOIN Provider pv     ON l.provider_id = pv.provider_id
+LEFT JOIN (
+  SELECT
+    resource_id,
+    SUM(sessions_started) AS sessions_started,
+    SUM(usage_seconds) AS usage_seconds,
+    MAX(peak_concurrent) AS peak_concurrent
+  FROM EResourceUsageDaily
+  WHERE usage_date >= CURDATE() - INTERVAL :days DAY
+  GROUP BY resource_id
+) d ON r.resource_id = d.resource_id
+LEFT JOIN (
+  SELECT uh.resource_id, COUNT(*) AS hours_at_limit
+  FROM EResourceUsageHourly uh
+  JOIN EResource er ON uh.resource_id = er.resource_id
+  JOIN License el   ON er.license_id = el.license_id
+  WHERE uh.hour_start >= CURDATE() - INTERVAL :days DAY
+    AND uh.peak_concurrent >= el.concurrent_limit
+  GROUP BY uh.resource_id
+) h ON r.resource_id = h.resource_id;
+
+-- Per resource, busiest first
+-- name: eresource-usage
+{{eresource-utilization}}
+ORDER BY peak_pct_of_limit DESC, usage_hours DESC, r.resource_id;
+
+-- Per provider: seats are summed over its licences' resources; the peak is
+-- the busiest resource's, since concurrency is only tracked per resource
+-- name: eresource-providers
+SELECT
+  u.provider_id,
+  u.provider_name,
+  COUNT(*) AS resources,
+  SUM(u.concurrent_limit) AS seats,
+  SUM(u.sessions_started) AS sessions_started,
+  SUM(u.usage_hours) AS usage_hours,
+  MAX(u.peak_pct_of_limit) AS max_peak_pct_of_limit,
+  SUM(u.hours_at_limit) AS hours_at_limit
+FROM ({{eresource-utilization}}) u
+GROUP BY u.provider_id, u.provider_name
+ORDER BY usage_hours DESC, u.provider_id;
+
+-- Hourly buckets of one resource over the last :days days
+-- name: eresource-hourly
+SELECT hour_start, sessions_started, usage_seconds, peak_concurrent
+FROM EResourceUsageHourly
+WHERE resource_id = :resource_id
+  AND hour_start >= NOW() - INTERVAL :days DAY
+ORDER BY hour_start;
+
+-- =========================================================
+-- End of queries.sql
+-- =========================================================
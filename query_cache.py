@@ -0,0 +1,180 @@
+"""
+Tiered query-result cache for UniLibPlus.
+
+Results are cached in an in-process LRU tier and, optionally, a shared
+Redis-compatible tier. Every cache key embeds the current version of each
+table the query reads; ``invalidate("Loan")`` bumps the Loan version, so
+every cached result that depends on Loan becomes unreachable at once and
+simply ages out of both tiers.
+"""
+import hashlib
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:  # the shared tier is optional
+    redis = None
+
+
+class LRUTier:
+    """Thread-safe in-process LRU with per-entry TTL"""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            return True, entry[1]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisTier:
+    """Shared tier on any Redis-compatible server (values are pickled)"""
+
+    def __init__(self, url):
+        if redis is None:
+            raise RuntimeError("the 'redis' package is required for a shared cache tier")
+        self.client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        raw = self.client.get(key)
+        if raw is None:
+            return False, None
+        return True, pickle.loads(raw)
+
+    def set(self, key, value, ttl):
+        self.client.setex(key, max(1, int(ttl)), pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def get_versions(self, keys):
+        return [int(v or 0) for v in self.client.mget(keys)]
+
+    def bump_versions(self, keys):
+        pipe = self.client.pipeline()
+        for key in keys:
+            pipe.incr(key)
+        pipe.execute()
+
+
+class ResultCache:
+    def __init__(self, local_size=256, shared=None, prefix="unilib:qc:"):
+        self.local = LRUTier(local_size)
+        self.shared = shared
+        self.prefix = prefix
+        self._versions = {}  # table -> version, used when there is no shared tier
+        self._lock = threading.Lock()
+        self._counters = {
+            "local_hits": 0,
+            "shared_hits": 0,
+            "misses": 0,
+            "invalidations": 0,
+            "shared_errors": 0,
+        }
+
+    def get_or_load(self, name, params, tables, ttl, loader):
+        """Return the cached result of ``loader()`` for (name, params)"""
+        key = self._key(name, params, tables)
+
+        hit, value = self.local.get(key)
+        if hit:
+            self._count("local_hits")
+            return value
+
+        if self.shared is not None:
+            try:
+                hit, value = self.shared.get(key)
+            except Exception:
+                hit = False
+                self._count("shared_errors")
+            if hit:
+                self._count("shared_hits")
+                self.local.set(key, value, ttl)
+                return value
+
+        self._count("misses")
+        value = loader()
+        self.local.set(key, value, ttl)
+        if self.shared is not None:
+            try:
+                self.shared.set(key, value, ttl)
+            except Exception:
+                self._count("shared_errors")
+        return value
+
+    def invalidate(self, *tables):
+        """Drop every cached result that reads any of ``tables``"""
+        with self._lock:
+            for table in tables:
+                self._versions[table] = self._versions.get(table, 0) + 1
+            self._counters["invalidations"] += len(tables)
+        if self.shared is not None:
+            try:
+                self.shared.bump_versions([self._version_key(t) for t in tables])
+            except Exception:
+                self._count("shared_errors")
+
+    def clear(self):
+        self.local.clear()
+        with self._lock:
+            self._versions = {t: v + 1 for t, v in self._versions.items()}
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+        lookups = stats["local_hits"] + stats["shared_hits"] + stats["misses"]
+        stats["hit_ratio"] = round((lookups - stats["misses"]) / lookups, 4) if lookups else 0.0
+        stats["local_entries"] = len(self.local)
+        stats["shared_tier"] = self.shared is not None
+        return stats
+
+    # -----------------------------
+    # Internal helpers
+    # -----------------------------
+    def _key(self, name, params, tables):
+        tables = sorted(tables)
+        if self.shared is not None:
+            try:
+                versions = self.shared.get_versions([self._version_key(t) for t in tables])
+            except Exception:
+                self._count("shared_errors")
+                versions = self._local_versions(tables)
+        else:
+            versions = self._local_versions(tables)
+        tag = ",".join("%s=%d" % tv for tv in zip(tables, versions))
+        digest = hashlib.sha1(repr((tuple(params), tag)).encode("utf-8")).hexdigest()
+        return "%s%s:%s" % (self.prefix, name, digest)
+
+    def _local_versions(self, tables):
+        with self._lock:
+            return [self._versions.get(t, 0) for t in tables]
+
+    def _version_key(self, table):
+        return "%sv:%s" % (self.prefix, table)
+
+    def _count(self, counter):
+        with self._lock:
+            self._counters[counter] += 1
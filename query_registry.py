@@ -0,0 +1,123 @@
+"""
+Named SQL statements for UniLibPlus, loaded once at import time.
+
+queries.sql holds the app's fixed statements. Each one follows a
+``-- name: <query-name>`` line, ends with ``;`` and takes named ``:param``
+placeholders; ``{{other-name}}`` pastes in another statement of the file (so
+a shared subquery is written once). Comment lines are dropped.
+
+Loading compiles every statement to PyMySQL's positional ``%s`` form (literal
+``%`` doubled) and records its parameter order, so serving a request only
+builds an argument tuple. ``bind`` checks the parameters by name, so a
+missing or misspelt one fails in Python before anything is sent to MySQL.
+"""
+import os
+import re
+from collections import namedtuple
+
+NAME_LINE = re.compile(r"^--\s*name:\s*([\w-]+)\s*$", re.M)
+INCLUDE = re.compile(r"\{\{\s*([\w-]+)\s*\}\}")
+# String literals are copied as they are; outside them, :name is a parameter
+# and % is escaped for PyMySQL's formatting
+TOKEN = re.compile(r"('(?:[^'\\]|\\.|'')*')|(?<![:\w]):([A-Za-z_]\w*)|(%)")
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "queries.sql")
+
+
+class QueryParamError(TypeError):
+    """Parameters that do not match a named statement's placeholders"""
+
+
+def compile_sql(text):
+    """(positional SQL, parameter names in placeholder order) for ``text``"""
+    params = []
+
+    def replace(match):
+        literal, param = match.group(1), match.group(2)
+        if literal is not None:
+            return literal.replace("%", "%%")
+        if param is not None:
+            params.append(param)
+            return "%s"
+        return "%%"
+
+    return TOKEN.sub(replace, text), tuple(params)
+
+
+class NamedQuery(namedtuple("NamedQuery", ("name", "sql", "params"))):
+    """A compiled statement: ``sql`` with ``%s`` placeholders for ``params`` in order"""
+    __slots__ = ()
+
+    def args(self, **values):
+        """Positional argument tuple for ``values`` given by parameter name"""
+        expected = set(self.params)
+        missing = expected.difference(values)
+        unknown = set(values).difference(expected)
+        if missing or unknown:
+            raise QueryParamError("query %r: missing %s, unexpected %s" % (
+                self.name, sorted(missing) or "none", sorted(unknown) or "none"))
+        return tuple(values[p] for p in self.params)
+
+
+def parse(text):
+    """{name: statement text} from a queries file, comments and ``;`` removed"""
+    parts = NAME_LINE.split(text)
+    statements = {}
+    for name, body in zip(parts[1::2], parts[2::2]):
+        if name in statements:
+            raise ValueError("query %r is defined twice" % name)
+        lines = [line for line in body.splitlines() if not line.lstrip().startswith("--")]
+        sql = "\n".join(lines).strip()
+        if sql.endswith(";"):
+            sql = sql[:-1].rstrip()
+        if not sql:
+            raise ValueError("query %r is empty" % name)
+        statements[name] = sql
+    return statements
+
+
+class QueryRegistry:
+    def __init__(self, statements):
+        self._queries = {}
+        for name in statements:
+            text = self._expand(statements, name, ())
+            sql, params = compile_sql(text)
+            self._queries[name] = NamedQuery(name, sql, params)
+
+    @classmethod
+    def load(cls, *paths):
+        statements = {}
+        for path in paths or (DEFAULT_PATH,):
+            with open(path, encoding="utf-8") as f:
+                for name, sql in parse(f.read()).items():
+                    if name in statements:
+                        raise ValueError("query %r is defined in more than one file" % name)
+                    statements[name] = sql
+        return cls(statements)
+
+    @classmethod
+    def _expand(cls, statements, name, seen):
+        if name in seen:
+            raise ValueError("query %r includes itself" % name)
+
+        def include(match):
+            other = match.group(1)
+            if other not in statements:
+                raise ValueError("query %r includes unknown query %r" % (name, other))
+            return cls._expand(statements, other, seen + (name,))
+
+        return INCLUDE.sub(include, statements[name])
+
+    def __getitem__(self, name):
+        return self._queries[name]
+
+    def __contains__(self, name):
+        return name in self._queries
+
+    def names(self):
+        return sorted(self._queries)
+
+    def bind(self, name, **values):
+        """(sql, args) for a named statement, ready for ``cursor.execute``"""
+        query = self._queries[name]
+        return query.sql, query.args(**values)
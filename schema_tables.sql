@@ -82,11 +82,14 @@ CREATE TABLE ResourceType (
   name             VARCHAR(20)  NOT NULL UNIQUE
 );
 
--- PartnerLibrary: external libraries for inter-library loans
+-- PartnerLibrary: external libraries for inter-library loans. endpoint is
+--   where the ILL dispatcher sends request batches (an http(s) URL for the
+--   HTTP transport; unused by the file transport).
 CREATE TABLE PartnerLibrary (
   partner_id INT           PRIMARY KEY,
   name       VARCHAR(150)  NOT NULL UNIQUE,
   address_id INT,
+  endpoint   VARCHAR(255)  NULL,
   FOREIGN KEY (address_id) REFERENCES Address(address_id)
 );
 
@@ -131,12 +134,24 @@ CREATE TABLE BookAuthor (
 );
 
 -- Copy: individual physical copies of a book in branches
+--   current_loan_id points at the copy's open loan (NULL when on the shelf);
+--   it is maintained by the Loan triggers (see 05_triggers.sql).
+--   hold_reservation_id is the reservation a returned copy is set aside for.
+--   status follows from both, so it is current as soon as either changes.
 CREATE TABLE Copy (
-  copy_id         INT          PRIMARY KEY,
-  isbn            CHAR(13)     NOT NULL,
-  branch_id       INT          NOT NULL,
-  checkin_term_id INT,
-  barcode         VARCHAR(40)  UNIQUE,
+  copy_id             INT          PRIMARY KEY,
+  isbn                CHAR(13)     NOT NULL,
+  branch_id           INT          NOT NULL,
+  checkin_term_id     INT,
+  barcode             VARCHAR(40)  UNIQUE,
+  current_loan_id     INT          NULL,
+  hold_reservation_id INT          NULL,
+  status              VARCHAR(9) AS (
+                        CASE
+                          WHEN current_loan_id IS NOT NULL THEN 'ON_LOAN'
+                          WHEN hold_reservation_id IS NOT NULL THEN 'RESERVED'
+                          ELSE 'AVAILABLE'
+                        END) STORED,
   FOREIGN KEY (isbn)            REFERENCES Book(isbn),
   FOREIGN KEY (branch_id)       REFERENCES Branch(branch_id),
   FOREIGN KEY (checkin_term_id) REFERENCES Term(term_id)
@@ -184,7 +199,10 @@ CREATE TABLE Fine (
   FOREIGN KEY (reason_id) REFERENCES FineReason(reason_id)
 );
 
--- Reservation: holds on books at specific branches
+-- Reservation: a hold on a book at a branch. Holds queue per (isbn, branch)
+--   in created_at order while 'Active'/'Waiting' (in_queue = 1); when a copy
+--   comes back the head of the queue becomes 'Ready' with that copy on the
+--   hold shelf until expires_at, then 'Fulfilled' on checkout or 'Expired'.
 CREATE TABLE Reservation (
   reservation_id INT         PRIMARY KEY,
   patron_id      INT         NOT NULL,
@@ -192,9 +210,27 @@ CREATE TABLE Reservation (
   branch_id      INT         NOT NULL,
   created_at     TIMESTAMP   NOT NULL DEFAULT CURRENT_TIMESTAMP,
   status         VARCHAR(20) NOT NULL,
+  copy_id        INT         NULL,       -- copy held for the patron while 'Ready'
+  ready_at       TIMESTAMP   NULL,
+  expires_at     TIMESTAMP   NULL,
+  in_queue       TINYINT AS (status IN ('Active', 'Waiting')) STORED,
   FOREIGN KEY (patron_id) REFERENCES Patron(patron_id),
   FOREIGN KEY (isbn)      REFERENCES Book(isbn),
-  FOREIGN KEY (branch_id) REFERENCES Branch(branch_id)
+  FOREIGN KEY (branch_id) REFERENCES Branch(branch_id),
+  FOREIGN KEY (copy_id)   REFERENCES Copy(copy_id)
+);
+
+-- HoldNotification: outbox of hold notices ('Ready', 'Expired') written by
+--   the hold procedures and drained by ``flask send-hold-notices``
+CREATE TABLE HoldNotification (
+  notification_id INT          AUTO_INCREMENT PRIMARY KEY,
+  reservation_id  INT          NOT NULL,
+  patron_id       INT          NOT NULL,
+  kind            VARCHAR(20)  NOT NULL,
+  created_at      TIMESTAMP    NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  sent_at         TIMESTAMP    NULL,
+  FOREIGN KEY (reservation_id) REFERENCES Reservation(reservation_id) ON DELETE CASCADE,
+  FOREIGN KEY (patron_id)      REFERENCES Patron(patron_id)
 );
 
 -- =========================================================
@@ -212,31 +248,258 @@ CREATE TABLE EResource (
 );
 
 -- AccessSession: patron access sessions to e-resources
+--   last_seen is the latest heartbeat (start_time until the first one);
+--   open sessions silent for too long are ended by sp_accesssession_reap
 CREATE TABLE AccessSession (
   session_id INT         PRIMARY KEY,
   patron_id  INT         NOT NULL,
   resource_id INT        NOT NULL,
   start_time TIMESTAMP   NOT NULL,
   end_time   TIMESTAMP,
+  last_seen  TIMESTAMP   NULL,
   FOREIGN KEY (patron_id)  REFERENCES Patron(patron_id),
   FOREIGN KEY (resource_id) REFERENCES EResource(resource_id)
 );
 
 -- =========================================================
--- 5. Inter-library loan: ILLRequest
+-- 5. Inter-library loan: ILLBatch, ILLRequest
 -- =========================================================
 
--- ILLRequest: inter-library loan requests to partner libraries
+-- ILLBatch: 'Requested' ILL requests claimed together for one partner by the
+--   dispatcher (see ill.py); 'Sent' once the transport accepted it, 'Failed'
+--   after the last retry (its requests are released for the next run)
+CREATE TABLE ILLBatch (
+  batch_id      INT           PRIMARY KEY,
+  partner_id    INT           NOT NULL,
+  status        VARCHAR(20)   NOT NULL,
+  request_count INT           NOT NULL DEFAULT 0,
+  attempts      INT           NOT NULL DEFAULT 0,
+  created_at    TIMESTAMP     NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  sent_at       TIMESTAMP     NULL,
+  last_error    VARCHAR(255)  NULL,
+  FOREIGN KEY (partner_id) REFERENCES PartnerLibrary(partner_id)
+);
+
+-- ILLRequest: inter-library loan requests to partner libraries.
+--   Requested -> Sent (dispatched in batch_id) -> Shipped -> Received
+--   -> Completed; Requested and Sent requests may be Cancelled.
 CREATE TABLE ILLRequest (
-  request_id   INT         PRIMARY KEY,
-  patron_id    INT         NOT NULL,
-  partner_id   INT         NOT NULL,
-  isbn         CHAR(13)    NOT NULL,
-  status       VARCHAR(20) NOT NULL,
-  requested_at TIMESTAMP   NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  request_id    INT         PRIMARY KEY,
+  patron_id     INT         NOT NULL,
+  partner_id    INT         NOT NULL,
+  isbn          CHAR(13)    NOT NULL,
+  status        VARCHAR(20) NOT NULL,
+  requested_at  TIMESTAMP   NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  batch_id      INT         NULL,
+  dispatched_at TIMESTAMP   NULL,
+  received_at   TIMESTAMP   NULL,
   FOREIGN KEY (patron_id)  REFERENCES Patron(patron_id),
   FOREIGN KEY (partner_id) REFERENCES PartnerLibrary(partner_id),
-  FOREIGN KEY (isbn)       REFERENCES Book(isbn)
+  FOREIGN KEY (isbn)       REFERENCES Book(isbn),
+  FOREIGN KEY (batch_id)   REFERENCES ILLBatch(batch_id)
+);
+
+-- =========================================================
+-- 6. Derived summary tables (maintained by triggers, see 05_triggers.sql
+--    and 08_summaries.sql)
+-- =========================================================
+
+-- DashboardSummary: materialized dashboard counters, striped over 32 slot
+--   rows so that concurrent writers do not queue on one row lock. Each trigger adds its delta to the row of its own connection
+--   (slot = CONNECTION_ID() % 32); readers SUM the slots. Columns marked
+--   "as of" are relative to as_of_date and are rebased by
+--   sp_dashboard_summary_reconcile when the date rolls over, which also folds
+--   the totals back into slot 0. total_subjects is counted on read.
+CREATE TABLE DashboardSummary (
+  slot                 TINYINT        PRIMARY KEY,
+  total_books          INT            NOT NULL DEFAULT 0,
+  total_copies         INT            NOT NULL DEFAULT 0,
+  total_patrons        INT            NOT NULL DEFAULT 0,
+  total_loans          INT            NOT NULL DEFAULT 0,
+  current_loans        INT            NOT NULL DEFAULT 0,
+  closed_duration_days BIGINT         NOT NULL DEFAULT 0,  -- SUM of durations of returned loans
+  open_loan_day_sum    BIGINT         NOT NULL DEFAULT 0,  -- SUM(TO_DAYS(loan_ts)) of open loans
+  total_unpaid_fines   DECIMAL(12,2)  NOT NULL DEFAULT 0,
+  active_patrons_90d   INT            NOT NULL DEFAULT 0,  -- as of as_of_date
+  overdue_loans        INT            NOT NULL DEFAULT 0,  -- as of as_of_date
+  loans_last_7d        INT            NOT NULL DEFAULT 0,  -- as of as_of_date
+  returns_last_7d      INT            NOT NULL DEFAULT 0,  -- as of as_of_date
+  as_of_date           DATE           NOT NULL,
+  reconciled_at        TIMESTAMP      NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  CHECK (slot BETWEEN 0 AND 31)
+);
+
+-- BookSearch: one denormalized search document per book (title, authors,
+--   subjects, publisher) backing the catalog FULLTEXT search. Maintained by
+--   sp_booksearch_refresh from the Book/BookAuthor/BookSubject triggers.
+CREATE TABLE BookSearch (
+  isbn               CHAR(13)       PRIMARY KEY,
+  title              VARCHAR(200)   NOT NULL,
+  pub_year           INT,
+  publisher_name     VARCHAR(120),
+  authors            VARCHAR(1000),
+  subjects           VARCHAR(1000),
+  primary_subject_id INT,           -- MIN(subject_id), used for subject filter/rank
+  FOREIGN KEY (isbn) REFERENCES Book(isbn) ON DELETE CASCADE
+);
+
+-- BookCirculationStats: per-book circulation counters, maintained by the
+--   Book/Copy/Loan triggers and rebuilt by sp_bookcirc_rebuild. subject_rank
+--   (popularity among books sharing the primary subject) is only refreshed
+--   nightly by sp_bookcirc_subject_rank_refresh, as one loan reorders a
+--   whole subject.
+CREATE TABLE BookCirculationStats (
+  isbn             CHAR(13)   PRIMARY KEY,
+  times_loaned     INT        NOT NULL DEFAULT 0,
+  total_copies     INT        NOT NULL DEFAULT 0,
+  available_copies INT        NOT NULL DEFAULT 0,
+  last_loan_ts     TIMESTAMP  NULL,
+  subject_rank     INT        NULL,
+  FOREIGN KEY (isbn) REFERENCES Book(isbn) ON DELETE CASCADE
+);
+
+-- PatronActivity: per-patron loan/fine activity and risk profile, maintained
+--   by the Patron/Loan/Fine triggers. overdue_loans counts open loans due
+--   before PatronActivityState.overdue_as_of; the nightly
+--   sp_patron_activity_overdue_sweep recounts it and moves that date on.
+CREATE TABLE PatronActivity (
+  patron_id     INT            PRIMARY KEY,
+  total_loans   INT            NOT NULL DEFAULT 0,
+  active_loans  INT            NOT NULL DEFAULT 0,
+  overdue_loans INT            NOT NULL DEFAULT 0,
+  late_returns  INT            NOT NULL DEFAULT 0,  -- returned after due_ts
+  last_loan_ts  TIMESTAMP      NULL,
+  total_fines   DECIMAL(10,2)  NOT NULL DEFAULT 0,
+  unpaid_fines  DECIMAL(10,2)  NOT NULL DEFAULT 0,
+  subject_loans INT            NOT NULL DEFAULT 0,  -- sum of PatronSubjectStats.loan_count
+  risk_level    VARCHAR(6) AS (
+                  CASE
+                    WHEN unpaid_fines >= 50 OR overdue_loans >= 3 THEN 'HIGH'
+                    WHEN unpaid_fines BETWEEN 10 AND 49 OR overdue_loans BETWEEN 1 AND 2 THEN 'MEDIUM'
+                    ELSE 'LOW'
+                  END) STORED,
+  risk_rank     TINYINT AS (
+                  CASE
+                    WHEN unpaid_fines >= 50 OR overdue_loans >= 3 THEN 1
+                    WHEN unpaid_fines BETWEEN 10 AND 49 OR overdue_loans BETWEEN 1 AND 2 THEN 2
+                    ELSE 3
+                  END) STORED,
+  FOREIGN KEY (patron_id) REFERENCES Patron(patron_id) ON DELETE CASCADE
+);
+
+-- CoAuthorPair: co-authorship graph, one row per author pair (author1_id <
+--   author2_id) with the number of books they wrote together. Maintained by
+--   the BookAuthor triggers and rebuilt by sp_coauthor_rebuild.
+CREATE TABLE CoAuthorPair (
+  author1_id     INT  NOT NULL,
+  author2_id     INT  NOT NULL,
+  books_together INT  NOT NULL DEFAULT 0,
+  PRIMARY KEY (author1_id, author2_id),
+  FOREIGN KEY (author1_id) REFERENCES Author(author_id) ON DELETE CASCADE,
+  FOREIGN KEY (author2_id) REFERENCES Author(author_id) ON DELETE CASCADE,
+  CHECK (author1_id < author2_id)
+);
+
+-- PatronSubjectStats: per-patron borrowing by subject (loans of books with
+--   that subject, and distinct such books), maintained by the Loan and
+--   BookSubject triggers and rebuilt by sp_patron_subject_rebuild.
+CREATE TABLE PatronSubjectStats (
+  patron_id    INT  NOT NULL,
+  subject_id   INT  NOT NULL,
+  loan_count   INT  NOT NULL DEFAULT 0,
+  unique_books INT  NOT NULL DEFAULT 0,
+  PRIMARY KEY (patron_id, subject_id),
+  FOREIGN KEY (patron_id)  REFERENCES Patron(patron_id) ON DELETE CASCADE,
+  FOREIGN KEY (subject_id) REFERENCES Subject(subject_id) ON DELETE CASCADE
+);
+
+-- EResourceSeat: open AccessSession count per e-resource, the seat counter
+--   the session triggers check against License.concurrent_limit. Rebuilt by
+--   sp_eresource_seat_rebuild.
+CREATE TABLE EResourceSeat (
+  resource_id  INT  PRIMARY KEY,
+  seats_in_use INT  NOT NULL DEFAULT 0,
+  FOREIGN KEY (resource_id) REFERENCES EResource(resource_id) ON DELETE CASCADE
+);
+
+-- EResourceUsageHourly / EResourceUsageDaily: AccessSession rolled up per
+--   resource into hour and day buckets (sessions started, seconds of use,
+--   peak concurrent sessions) by eresource_usage.py. EResourceUsageState
+--   holds the watermark: every hour before rolled_up_to is in the rollups.
+CREATE TABLE EResourceUsageHourly (
+  resource_id      INT       NOT NULL,
+  hour_start       DATETIME  NOT NULL,
+  sessions_started INT       NOT NULL DEFAULT 0,
+  usage_seconds    INT       NOT NULL DEFAULT 0,
+  peak_concurrent  INT       NOT NULL DEFAULT 0,
+  PRIMARY KEY (resource_id, hour_start),
+  FOREIGN KEY (resource_id) REFERENCES EResource(resource_id) ON DELETE CASCADE
+);
+
+CREATE TABLE EResourceUsageDaily (
+  resource_id      INT     NOT NULL,
+  usage_date       DATE    NOT NULL,
+  sessions_started INT     NOT NULL DEFAULT 0,
+  usage_seconds    BIGINT  NOT NULL DEFAULT 0,
+  peak_concurrent  INT     NOT NULL DEFAULT 0,
+  PRIMARY KEY (resource_id, usage_date),
+  FOREIGN KEY (resource_id) REFERENCES EResource(resource_id) ON DELETE CASCADE
+);
+
+-- PatronActivityState: the date PatronActivity.overdue_loans is relative
+--   to. The Loan triggers compare due_ts against it (not CURDATE()), so a
+--   loan that falls due between sweeps is neither added nor removed until
+--   the sweep has counted it.
+CREATE TABLE PatronActivityState (
+  state_id      TINYINT  PRIMARY KEY,
+  overdue_as_of DATE     NOT NULL,
+  CHECK (state_id = 1)
+);
+
+CREATE TABLE EResourceUsageState (
+  state_id     TINYINT   PRIMARY KEY,
+  rolled_up_to DATETIME  NULL,
+  CHECK (state_id = 1)
+);
+
+-- LoanMonthlyRollup: loans per calendar month (first day of the month) and
+--   patron type, written once when a month closes by
+--   sp_loan_monthly_rollup_close. Months after the newest closed month are
+--   counted live from Loan; the Loan triggers correct closed months when a
+--   loan is back-dated into them or deleted.
+CREATE TABLE LoanMonthlyRollup (
+  month       DATE         NOT NULL,
+  patron_type VARCHAR(20)  NOT NULL,
+  loan_count  INT          NOT NULL DEFAULT 0,
+  PRIMARY KEY (month, patron_type)
+);
+
+-- ILLPartnerStats: per-partner ILL dispatch throughput and turnaround,
+--   written by the dispatcher and by status changes in ill.py
+CREATE TABLE ILLPartnerStats (
+  partner_id         INT        PRIMARY KEY,
+  batches_sent       INT        NOT NULL DEFAULT 0,
+  batches_failed     INT        NOT NULL DEFAULT 0,
+  requests_sent      INT        NOT NULL DEFAULT 0,
+  send_attempts      INT        NOT NULL DEFAULT 0,
+  send_ms            BIGINT     NOT NULL DEFAULT 0,  -- transport time of sent batches
+  requests_received  INT        NOT NULL DEFAULT 0,
+  turnaround_seconds BIGINT     NOT NULL DEFAULT 0,  -- SUM(received_at - requested_at)
+  last_dispatch_at   TIMESTAMP  NULL,
+  FOREIGN KEY (partner_id) REFERENCES PartnerLibrary(partner_id) ON DELETE CASCADE
+);
+
+-- =========================================================
+-- 7. Identifier allocation
+-- =========================================================
+
+-- IdSequence: next free id for tables whose primary keys are assigned by the
+--   application (see id_sequence.py). Ids are reserved in blocks with one
+--   single-row UPDATE, floored at the base table's MAX(id) read beforehand
+--   without locks.
+CREATE TABLE IdSequence (
+  seq_name VARCHAR(30) PRIMARY KEY,
+  next_id  INT         NOT NULL
 );
 
 -- =========================================================
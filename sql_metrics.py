@@ -0,0 +1,247 @@
+"""
+Per-request SQL instrumentation for UniLibPlus.
+
+Connections use a cursor class from ``instrumented_cursor``, which times every
+``execute`` and reports it to a SqlMetrics registry together with the
+statement's fingerprint (the SQL with literals and placeholders replaced by
+``?``), the rows it returned or changed, and the Flask endpoint of the request
+that issued it. The registry keeps:
+
+  * per-route request and per-route/per-query latency histograms, rendered in
+    the Prometheus text format by ``prometheus()`` (served at /metrics),
+  * a per-request tally used for the Server-Timing response header
+    (``db``, ``render`` and ``app`` durations, visible in browser devtools),
+  * a log of slow statements (logger ``unilib.sql``) with their EXPLAIN, run
+    at most once per fingerprint per ``explain_interval`` seconds.
+
+The current request is tracked in a context variable; PageExecutor copies the
+context into its worker threads so their queries are attributed too.
+"""
+import bisect
+import contextvars
+import functools
+import hashlib
+import logging
+import re
+import threading
+import time
+
+import pymysql
+
+log = logging.getLogger("unilib.sql")
+
+# Histogram bucket upper bounds, in seconds
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+NO_ROUTE = "none"  # queries issued outside a request (CLI commands, jobs)
+MAX_STATEMENT_LABEL = 200
+
+_request = contextvars.ContextVar("unilib_sql_request", default=None)
+
+_NORMALIZE = [
+    (re.compile(r"'(?:[^'\\]|\\.|'')*'"), "?"),                     # string literals
+    (re.compile(r"%\(\w+\)s|%s"), "?"),                              # DB-API placeholders
+    (re.compile(r"\b\d+(?:\.\d+)?\b"), "?"),                         # numbers
+    (re.compile(r"\s+"), " "),
+    (re.compile(r"\bIN \((?:\?, )*\?\)", re.I), "IN (...)"),
+    (re.compile(r"\bVALUES \((?:\?, )*\?\)(?:, \((?:\?, )*\?\))*", re.I), "VALUES (...)"),
+]
+_EXPLAINABLE = re.compile(r"^\s*(SELECT|WITH)\b", re.I)
+
+
+def _normalize(sql):
+    text = sql.strip()
+    for pattern, replacement in _NORMALIZE:
+        text = pattern.sub(replacement, text)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:12], text
+
+
+_normalize_cached = functools.lru_cache(maxsize=2048)(_normalize)
+
+
+def fingerprint(sql):
+    """(12-hex-digit id, normalized text) of a statement"""
+    if isinstance(sql, bytes):
+        sql = sql.decode("utf-8", "replace")
+    # Templates repeat, so cache them; big generated statements are not worth keeping
+    return _normalize_cached(sql) if len(sql) <= 4096 else _normalize(sql)
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(DURATION_BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(DURATION_BUCKETS, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+
+class RequestStats:
+    """DB and render time of one request"""
+
+    def __init__(self, route):
+        self.route = route
+        self.started = time.perf_counter()
+        self.db_seconds = 0.0
+        self.queries = 0
+        self.render_seconds = 0.0
+        self.render_started = None
+        self._lock = threading.Lock()
+
+    def add_query(self, seconds):
+        with self._lock:
+            self.db_seconds += seconds
+            self.queries += 1
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class SqlMetrics:
+    def __init__(self, slow_ms=200.0, explain_interval=300.0):
+        self.slow_seconds = slow_ms / 1000.0
+        self.explain_interval = explain_interval
+        self._lock = threading.Lock()
+        self._requests = {}     # route -> Histogram
+        self._queries = {}      # (route, query id) -> Histogram
+        self._rows = {}         # (route, query id) -> rows returned/affected
+        self._slow = {}         # (route, query id) -> slow executions
+        self._statements = {}   # query id -> normalized text
+        self._explained = {}    # query id -> time of its last EXPLAIN
+
+    # -- request lifecycle ---------------------------------------------
+
+    def start_request(self, route):
+        _request.set(RequestStats(route))
+
+    def finish_request(self):
+        """Record the request's latency and return its Server-Timing header value"""
+        stats = _request.get()
+        if stats is None:
+            return None
+        elapsed = time.perf_counter() - stats.started
+        with self._lock:
+            self._requests.setdefault(stats.route, Histogram()).observe(elapsed)
+        return 'db;dur=%.1f;desc="%d queries", render;dur=%.1f, app;dur=%.1f' % (
+            stats.db_seconds * 1000, stats.queries, stats.render_seconds * 1000, elapsed * 1000)
+
+    def clear_request(self):
+        _request.set(None)
+
+    def render_started(self):
+        stats = _request.get()
+        if stats is not None:
+            stats.render_started = time.perf_counter()
+
+    def render_finished(self):
+        stats = _request.get()
+        if stats is not None and stats.render_started is not None:
+            stats.render_seconds += time.perf_counter() - stats.render_started
+            stats.render_started = None
+
+    # -- queries -------------------------------------------------------
+
+    def observe_query(self, cursor, sql, seconds):
+        stats = _request.get()
+        route = stats.route if stats is not None else NO_ROUTE
+        if stats is not None:
+            stats.add_query(seconds)
+        query_id, text = fingerprint(sql)
+        rows = max(cursor.rowcount or 0, 0)
+        key = (route, query_id)
+        slow = seconds >= self.slow_seconds
+        explain = False
+        with self._lock:
+            self._queries.setdefault(key, Histogram()).observe(seconds)
+            self._rows[key] = self._rows.get(key, 0) + rows
+            self._statements.setdefault(query_id, text)
+            if slow:
+                self._slow[key] = self._slow.get(key, 0) + 1
+                now = time.monotonic()
+                if now - self._explained.get(query_id, -self.explain_interval) >= self.explain_interval:
+                    self._explained[query_id] = now
+                    explain = True
+        if slow:
+            log.warning("slow query %s on %s: %.1fms, %d rows: %s%s", query_id, route,
+                        seconds * 1000, rows, text[:500],
+                        self._explain(cursor) if explain else "")
+
+    def _explain(self, cursor):
+        executed = getattr(cursor, "_executed", None)
+        if not executed or not _EXPLAINABLE.match(executed):
+            return ""
+        try:
+            with cursor.connection.cursor(pymysql.cursors.DictCursor) as cur:
+                cur.execute("EXPLAIN " + executed)
+                plan = cur.fetchall()
+        except pymysql.MySQLError as exc:
+            return "\n  EXPLAIN failed: %s" % (exc.args[-1] if exc.args else exc)
+        return "".join("\n  %s: type=%s key=%s rows=%s %s" % (
+            row.get("table"), row.get("type"), row.get("key"), row.get("rows"),
+            row.get("Extra") or "") for row in plan)
+
+    # -- export --------------------------------------------------------
+
+    def prometheus(self):
+        """All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            requests = {route: (list(h.counts), h.sum, h.count) for route, h in self._requests.items()}
+            queries = {key: (list(h.counts), h.sum, h.count) for key, h in self._queries.items()}
+            rows, slow, statements = dict(self._rows), dict(self._slow), dict(self._statements)
+
+        lines = []
+
+        def histogram(name, help_text, series):
+            lines.append("# HELP %s %s" % (name, help_text))
+            lines.append("# TYPE %s histogram" % name)
+            for labels, (counts, total, count) in sorted(series.items()):
+                cumulative = 0
+                for bound, bucket in zip(DURATION_BUCKETS + ("+Inf",), counts):
+                    cumulative += bucket
+                    lines.append('%s_bucket{%s,le="%s"} %d' % (name, labels, bound, cumulative))
+                lines.append("%s_sum{%s} %.6f" % (name, labels, total))
+                lines.append("%s_count{%s} %d" % (name, labels, count))
+
+        def counter(name, help_text, series):
+            lines.append("# HELP %s %s" % (name, help_text))
+            lines.append("# TYPE %s counter" % name)
+            for labels, value in sorted(series.items()):
+                lines.append("%s{%s} %d" % (name, labels, value))
+
+        def query_labels(key):
+            return 'route="%s",query="%s"' % (_label(key[0]), key[1])
+
+        histogram("unilib_http_request_duration_seconds", "Request latency by route",
+                  {'route="%s"' % _label(route): value for route, value in requests.items()})
+        histogram("unilib_sql_query_duration_seconds", "SQL statement latency by route and query",
+                  {query_labels(key): value for key, value in queries.items()})
+        counter("unilib_sql_query_rows_total", "Rows returned or affected by route and query",
+                {query_labels(key): value for key, value in rows.items()})
+        counter("unilib_sql_slow_queries_total", "Statements slower than the slow-query threshold",
+                {query_labels(key): value for key, value in slow.items()})
+        lines.append("# HELP unilib_sql_statement_info Normalized SQL text of each query id")
+        lines.append("# TYPE unilib_sql_statement_info gauge")
+        for query_id, text in sorted(statements.items()):
+            lines.append('unilib_sql_statement_info{query="%s",statement="%s"} 1'
+                         % (query_id, _label(text[:MAX_STATEMENT_LABEL])))
+        return "\n".join(lines) + "\n"
+
+
+def instrumented_cursor(metrics, base=pymysql.cursors.DictCursor):
+    """Cursor class that reports every execute() to ``metrics``"""
+
+    class InstrumentedCursor(base):
+        def execute(self, query, args=None):
+            started = time.perf_counter()
+            try:
+                return super().execute(query, args)
+            finally:
+                metrics.observe_query(self, query, time.perf_counter() - started)
+
+    InstrumentedCursor.__name__ = InstrumentedCursor.__qualname__ = "Instrumented" + base.__name__
+    return InstrumentedCursor
@@ -0,0 +1,805 @@
+-- =========================================================
+-- 08_summaries.sql
+-- Stored procedures and scheduled events that (re)build the derived
+-- summary tables defined in 02_schema_tables.sql
+-- (Run after 05_triggers.sql and before loading data, so the
+--  maintenance triggers have their summary rows to update)
+-- =========================================================
+
+USE UniLibPlus;
+
+DELIMITER $$
+
+-- =========================================================
+-- 1. DashboardSummary
+-- =========================================================
+
+-- Procedure: Full recompute of the dashboard counters.
+-- Also rebases the time-window counters (overdue, last 7 / 90 days)
+-- to today's date. The totals go to slot 0 and every other slot is zeroed
+-- in the same statement; triggers add to their own slot between runs.
+DROP PROCEDURE IF EXISTS sp_dashboard_summary_reconcile$$
+CREATE PROCEDURE sp_dashboard_summary_reconcile()
+BEGIN
+    DECLARE v_today  DATE DEFAULT CURDATE();
+    DECLARE v_last_7 DATE DEFAULT DATE_SUB(CURDATE(), INTERVAL 7 DAY);
+    DECLARE v_last_90 DATE DEFAULT DATE_SUB(CURDATE(), INTERVAL 90 DAY);
+
+    INSERT IGNORE INTO DashboardSummary (slot, as_of_date)
+    WITH RECURSIVE slots (slot) AS (
+      SELECT 0
+      UNION ALL
+      SELECT slot + 1 FROM slots WHERE slot < 31
+    )
+    SELECT slot, v_today FROM slots;
+
+    UPDATE DashboardSummary ds
+    CROSS JOIN (
+      SELECT
+        (SELECT COUNT(*) FROM Book)                          AS total_books,
+        (SELECT COUNT(*) FROM Copy)                          AS total_copies,
+        (SELECT COUNT(*) FROM Patron)                        AS total_patrons,
+        (SELECT COUNT(DISTINCT patron_id) FROM Loan
+          WHERE loan_ts >= v_last_90)                        AS active_patrons_90d
+    ) cat
+    CROSS JOIN (
+      SELECT
+        COUNT(*) AS total_loans,
+        COALESCE(SUM(return_ts IS NULL), 0) AS current_loans,
+        COALESCE(SUM(return_ts IS NULL AND due_ts < v_today), 0) AS overdue_loans,
+        COALESCE(SUM(IF(return_ts IS NULL, TO_DAYS(loan_ts), 0)), 0) AS open_loan_day_sum,
+        COALESCE(SUM(IF(return_ts IS NULL, 0, DATEDIFF(return_ts, DATE(loan_ts)))), 0)
+          AS closed_duration_days,
+        COALESCE(SUM(DATE(loan_ts) >= v_last_7), 0) AS loans_last_7d,
+        COALESCE(SUM(COALESCE(DATE(return_ts) >= v_last_7, 0)), 0) AS returns_last_7d
+      FROM Loan
+    ) ls
+    CROSS JOIN (
+      SELECT COALESCE(SUM(amount), 0) AS total_unpaid_fines
+      FROM Fine
+      WHERE status = 'Unpaid'
+    ) fs
+    SET ds.total_books          = IF(ds.slot = 0, cat.total_books, 0),
+        ds.total_copies         = IF(ds.slot = 0, cat.total_copies, 0),
+        ds.total_patrons        = IF(ds.slot = 0, cat.total_patrons, 0),
+        ds.active_patrons_90d   = IF(ds.slot = 0, cat.active_patrons_90d, 0),
+        ds.total_loans          = IF(ds.slot = 0, ls.total_loans, 0),
+        ds.current_loans        = IF(ds.slot = 0, ls.current_loans, 0),
+        ds.overdue_loans        = IF(ds.slot = 0, ls.overdue_loans, 0),
+        ds.open_loan_day_sum    = IF(ds.slot = 0, ls.open_loan_day_sum, 0),
+        ds.closed_duration_days = IF(ds.slot = 0, ls.closed_duration_days, 0),
+        ds.loans_last_7d        = IF(ds.slot = 0, ls.loans_last_7d, 0),
+        ds.returns_last_7d      = IF(ds.slot = 0, ls.returns_last_7d, 0),
+        ds.total_unpaid_fines   = IF(ds.slot = 0, fs.total_unpaid_fines, 0),
+        ds.as_of_date           = v_today,
+        ds.reconciled_at        = CURRENT_TIMESTAMP;
+END$$
+
+-- Event: Nightly reconcile shortly after midnight, when the time-window
+-- counters need rebasing. Requires event_scheduler=ON; otherwise run
+-- `flask reconcile-dashboard` (the dashboard only shows a stale as_of_date).
+DROP EVENT IF EXISTS ev_dashboard_summary_reconcile$$
+CREATE EVENT ev_dashboard_summary_reconcile
+ON SCHEDULE EVERY 1 DAY
+STARTS TIMESTAMP(CURDATE() + INTERVAL 1 DAY, '00:05:00')
+DO
+BEGIN
+    CALL sp_dashboard_summary_reconcile();
+END$$
+
+-- =========================================================
+-- 2. BookSearch (catalog search documents)
+-- =========================================================
+
+-- Procedure: Rebuild the search document for one book.
+-- Removes the document if the book no longer exists.
+DROP PROCEDURE IF EXISTS sp_booksearch_refresh$$
+CREATE PROCEDURE sp_booksearch_refresh(IN p_isbn CHAR(13))
+BEGIN
+    DELETE FROM BookSearch WHERE isbn = p_isbn;
+
+    INSERT INTO BookSearch (isbn, title, pub_year, publisher_name, authors, subjects, primary_subject_id)
+    SELECT
+      b.isbn,
+      b.title,
+      b.pub_year,
+      p.name,
+      (SELECT GROUP_CONCAT(DISTINCT CONCAT(a.first_name, ' ', a.last_name)
+                           ORDER BY a.last_name, a.first_name SEPARATOR ', ')
+         FROM BookAuthor ba
+         JOIN Author a ON ba.author_id = a.author_id
+        WHERE ba.isbn = b.isbn),
+      (SELECT GROUP_CONCAT(DISTINCT s.name ORDER BY s.name SEPARATOR ', ')
+         FROM BookSubject bs
+         JOIN Subject s ON bs.subject_id = s.subject_id
+        WHERE bs.isbn = b.isbn),
+      (SELECT MIN(bs.subject_id) FROM BookSubject bs WHERE bs.isbn = b.isbn)
+    FROM Book b
+    LEFT JOIN Publisher p ON b.publisher_id = p.publisher_id
+    WHERE b.isbn = p_isbn;
+END$$
+
+-- Procedure: Rebuild every search document from scratch
+DROP PROCEDURE IF EXISTS sp_booksearch_rebuild$$
+CREATE PROCEDURE sp_booksearch_rebuild()
+BEGIN
+    DELETE FROM BookSearch;
+
+    INSERT INTO BookSearch (isbn, title, pub_year, publisher_name, authors, subjects, primary_subject_id)
+    SELECT
+      b.isbn,
+      b.title,
+      b.pub_year,
+      p.name,
+      au.authors,
+      su.subjects,
+      su.primary_subject_id
+    FROM Book b
+    LEFT JOIN Publisher p ON b.publisher_id = p.publisher_id
+    LEFT JOIN (
+      SELECT ba.isbn,
+             GROUP_CONCAT(DISTINCT CONCAT(a.first_name, ' ', a.last_name)
+                          ORDER BY a.last_name, a.first_name SEPARATOR ', ') AS authors
+      FROM BookAuthor ba
+      JOIN Author a ON ba.author_id = a.author_id
+      GROUP BY ba.isbn
+    ) au ON b.isbn = au.isbn
+    LEFT JOIN (
+      SELECT bs.isbn,
+             GROUP_CONCAT(DISTINCT s.name ORDER BY s.name SEPARATOR ', ') AS subjects,
+             MIN(bs.subject_id) AS primary_subject_id
+      FROM BookSubject bs
+      JOIN Subject s ON bs.subject_id = s.subject_id
+      GROUP BY bs.isbn
+    ) su ON b.isbn = su.isbn;
+END$$
+
+-- =========================================================
+-- 3. BookCirculationStats (per-book circulation counters)
+-- =========================================================
+
+-- Procedure: Recompute every book's counters from Copy and Loan
+DROP PROCEDURE IF EXISTS sp_bookcirc_rebuild$$
+CREATE PROCEDURE sp_bookcirc_rebuild()
+BEGIN
+    DELETE FROM BookCirculationStats;
+
+    INSERT INTO BookCirculationStats (isbn, times_loaned, total_copies, available_copies, last_loan_ts)
+    SELECT
+      b.isbn,
+      COALESCE(lc.times_loaned, 0),
+      COALESCE(cc.total_copies, 0),
+      COALESCE(cc.total_copies, 0) - COALESCE(lc.open_loans, 0),
+      lc.last_loan_ts
+    FROM Book b
+    LEFT JOIN (
+      SELECT isbn, COUNT(*) AS total_copies
+      FROM Copy
+      GROUP BY isbn
+    ) cc ON b.isbn = cc.isbn
+    LEFT JOIN (
+      SELECT
+        c.isbn,
+        COUNT(*) AS times_loaned,
+        SUM(l.return_ts IS NULL) AS open_loans,
+        MAX(l.loan_ts) AS last_loan_ts
+      FROM Copy c
+      JOIN Loan l ON c.copy_id = l.copy_id
+      GROUP BY c.isbn
+    ) lc ON b.isbn = lc.isbn;
+
+    CALL sp_bookcirc_subject_rank_refresh();
+END$$
+
+-- Procedure: Rank every book by times_loaned among the books sharing its
+-- primary subject (books without a subject rank among themselves), so the
+-- catalog page reads the rank instead of windowing over whole subjects
+DROP PROCEDURE IF EXISTS sp_bookcirc_subject_rank_refresh$$
+CREATE PROCEDURE sp_bookcirc_subject_rank_refresh()
+BEGIN
+    UPDATE BookCirculationStats bcs
+    JOIN (
+      SELECT
+        bsr.isbn,
+        RANK() OVER (
+          PARTITION BY bsr.primary_subject_id
+          ORDER BY COALESCE(c.times_loaned, 0) DESC, bsr.title
+        ) AS subject_rank
+      FROM BookSearch bsr
+      LEFT JOIN BookCirculationStats c ON bsr.isbn = c.isbn
+    ) r ON bcs.isbn = r.isbn
+    SET bcs.subject_rank = r.subject_rank
+    WHERE NOT (bcs.subject_rank <=> r.subject_rank);
+END$$
+
+-- Event: Nightly subject rank refresh
+DROP EVENT IF EXISTS ev_bookcirc_subject_rank_refresh$$
+CREATE EVENT ev_bookcirc_subject_rank_refresh
+ON SCHEDULE EVERY 1 DAY
+STARTS TIMESTAMP(CURDATE() + INTERVAL 1 DAY, '00:30:00')
+DO
+BEGIN
+    CALL sp_bookcirc_subject_rank_refresh();
+END$$
+
+-- =========================================================
+-- 4. PatronActivity (per-patron activity and risk profile)
+-- =========================================================
+
+-- Procedure: Recompute every patron's activity from Loan, Fine and BookSubject
+DROP PROCEDURE IF EXISTS sp_patron_activity_rebuild$$
+CREATE PROCEDURE sp_patron_activity_rebuild()
+BEGIN
+    INSERT INTO PatronActivityState (state_id, overdue_as_of)
+    VALUES (1, CURDATE())
+    ON DUPLICATE KEY UPDATE overdue_as_of = CURDATE();
+
+    DELETE FROM PatronActivity;
+
+    INSERT INTO PatronActivity
+      (patron_id, total_loans, active_loans, overdue_loans, late_returns,
+       last_loan_ts, total_fines, unpaid_fines, subject_loans)
+    SELECT
+      p.patron_id,
+      COALESCE(la.total_loans, 0),
+      COALESCE(la.active_loans, 0),
+      COALESCE(la.overdue_loans, 0),
+      COALESCE(la.late_returns, 0),
+      la.last_loan_ts,
+      COALESCE(fa.total_fines, 0),
+      COALESCE(fa.unpaid_fines, 0),
+      COALESCE(sa.subject_loans, 0)
+    FROM Patron p
+    LEFT JOIN (
+      SELECT
+        patron_id,
+        COUNT(*) AS total_loans,
+        SUM(return_ts IS NULL) AS active_loans,
+        SUM(return_ts IS NULL AND due_ts < CURDATE()) AS overdue_loans,
+        SUM(COALESCE(return_ts > due_ts, 0)) AS late_returns,
+        MAX(loan_ts) AS last_loan_ts
+      FROM Loan
+      GROUP BY patron_id
+    ) la ON p.patron_id = la.patron_id
+    LEFT JOIN (
+      SELECT
+        patron_id,
+        SUM(amount) AS total_fines,
+        SUM(CASE WHEN status = 'Unpaid' THEN amount ELSE 0 END) AS unpaid_fines
+      FROM Fine
+      GROUP BY patron_id
+    ) fa ON p.patron_id = fa.patron_id
+    LEFT JOIN (
+      SELECT l.patron_id, COUNT(*) AS subject_loans
+      FROM Loan l
+      JOIN Copy c ON l.copy_id = c.copy_id
+      JOIN BookSubject bs ON c.isbn = bs.isbn
+      GROUP BY l.patron_id
+    ) sa ON p.patron_id = sa.patron_id;
+END$$
+
+-- Procedure: Recount overdue loans for patrons whose count changed since
+-- loans crossed their due date (only open loans are read), and move
+-- overdue_as_of to today in the same transaction. The Loan triggers read the
+-- state row with a shared lock, so the sweep waits for open loan writes and
+-- they wait for it. Call outside a transaction (it commits its own).
+DROP PROCEDURE IF EXISTS sp_patron_activity_overdue_sweep$$
+CREATE PROCEDURE sp_patron_activity_overdue_sweep()
+BEGIN
+    DECLARE v_changed INT DEFAULT 0;
+
+    START TRANSACTION;
+
+    INSERT INTO PatronActivityState (state_id, overdue_as_of)
+    VALUES (1, CURDATE())
+    ON DUPLICATE KEY UPDATE overdue_as_of = CURDATE();
+
+    UPDATE PatronActivity pa
+    LEFT JOIN (
+      SELECT patron_id, SUM(due_ts < CURDATE()) AS overdue_loans
+      FROM Loan
+      WHERE return_ts IS NULL
+      GROUP BY patron_id
+    ) o ON pa.patron_id = o.patron_id
+    SET pa.overdue_loans = COALESCE(o.overdue_loans, 0)
+    WHERE pa.overdue_loans <> COALESCE(o.overdue_loans, 0);
+    SET v_changed = ROW_COUNT();
+
+    COMMIT;
+    SELECT v_changed AS patrons_updated;
+END$$
+
+-- Event: Nightly overdue sweep, right after loans due yesterday become overdue
+DROP EVENT IF EXISTS ev_patron_activity_overdue_sweep$$
+CREATE EVENT ev_patron_activity_overdue_sweep
+ON SCHEDULE EVERY 1 DAY
+STARTS TIMESTAMP(CURDATE() + INTERVAL 1 DAY, '00:10:00')
+DO
+BEGIN
+    CALL sp_patron_activity_overdue_sweep();
+END$$
+
+-- =========================================================
+-- 5. Copy.current_loan_id (open-loan pointer)
+-- =========================================================
+
+-- Procedure: Re-point every copy at its open loan, if any
+DROP PROCEDURE IF EXISTS sp_copy_current_loan_rebuild$$
+CREATE PROCEDURE sp_copy_current_loan_rebuild()
+BEGIN
+    UPDATE Copy c
+    LEFT JOIN (
+      SELECT copy_id, MAX(loan_id) AS loan_id
+      FROM Loan
+      WHERE return_ts IS NULL
+      GROUP BY copy_id
+    ) ol ON c.copy_id = ol.copy_id
+    SET c.current_loan_id = ol.loan_id
+    WHERE NOT (c.current_loan_id <=> ol.loan_id);
+END$$
+
+-- =========================================================
+-- 6. CoAuthorPair (co-authorship graph)
+-- =========================================================
+
+-- Procedure: Add p_delta (+1 / -1) to every pair formed by p_author_id and
+-- the other authors of p_isbn (except p_skip_author_id, if not NULL); pairs
+-- that drop to zero books are removed
+DROP PROCEDURE IF EXISTS sp_coauthor_adjust$$
+CREATE PROCEDURE sp_coauthor_adjust(IN p_isbn CHAR(13), IN p_author_id INT, IN p_delta INT,
+                                    IN p_skip_author_id INT)
+BEGIN
+    INSERT INTO CoAuthorPair (author1_id, author2_id, books_together)
+    SELECT LEAST(author_id, p_author_id), GREATEST(author_id, p_author_id), p_delta
+    FROM BookAuthor
+    WHERE isbn = p_isbn
+      AND author_id <> p_author_id
+      AND NOT (author_id <=> p_skip_author_id)
+    ON DUPLICATE KEY UPDATE books_together = books_together + p_delta;
+
+    IF p_delta < 0 THEN
+        DELETE FROM CoAuthorPair
+        WHERE (author1_id = p_author_id OR author2_id = p_author_id)
+          AND books_together <= 0;
+    END IF;
+END$$
+
+-- Procedure: Recompute every author pair from BookAuthor
+DROP PROCEDURE IF EXISTS sp_coauthor_rebuild$$
+CREATE PROCEDURE sp_coauthor_rebuild()
+BEGIN
+    DELETE FROM CoAuthorPair;
+
+    INSERT INTO CoAuthorPair (author1_id, author2_id, books_together)
+    SELECT ba1.author_id, ba2.author_id, COUNT(*)
+    FROM BookAuthor ba1
+    JOIN BookAuthor ba2 ON ba1.isbn = ba2.isbn AND ba1.author_id < ba2.author_id
+    GROUP BY ba1.author_id, ba2.author_id;
+END$$
+
+-- =========================================================
+-- 7. PatronSubjectStats (borrowing pattern by subject)
+-- =========================================================
+
+-- Procedure: Add p_delta (+1 / -1) for loan p_loan_id of book p_isbn by
+-- p_patron_id to each of the book's subjects. unique_books changes only when
+-- the patron has no other loan of the book; rows that drop to zero are removed
+DROP PROCEDURE IF EXISTS sp_patron_subject_adjust$$
+CREATE PROCEDURE sp_patron_subject_adjust(IN p_patron_id INT, IN p_isbn CHAR(13),
+                                          IN p_loan_id INT, IN p_delta INT)
+BEGIN
+    DECLARE v_only_loan TINYINT;
+
+    SELECT NOT EXISTS (
+      SELECT 1
+      FROM Loan l
+      JOIN Copy c ON l.copy_id = c.copy_id
+      WHERE l.patron_id = p_patron_id
+        AND c.isbn = p_isbn
+        AND l.loan_id <> p_loan_id
+    ) INTO v_only_loan;
+
+    INSERT INTO PatronSubjectStats (patron_id, subject_id, loan_count, unique_books)
+    SELECT p_patron_id, subject_id, p_delta, p_delta * v_only_loan
+    FROM BookSubject
+    WHERE isbn = p_isbn
+    ON DUPLICATE KEY UPDATE loan_count   = loan_count + p_delta,
+                            unique_books = unique_books + p_delta * v_only_loan;
+
+    IF p_delta < 0 THEN
+        DELETE FROM PatronSubjectStats
+        WHERE patron_id = p_patron_id
+          AND loan_count <= 0;
+    END IF;
+
+    UPDATE PatronActivity
+    SET subject_loans = subject_loans + p_delta * (SELECT COUNT(*) FROM BookSubject WHERE isbn = p_isbn)
+    WHERE patron_id = p_patron_id;
+END$$
+
+-- Procedure: Book p_isbn gained (+1) or lost (-1) subject p_subject_id; apply
+-- that to every patron who has borrowed the book
+DROP PROCEDURE IF EXISTS sp_patron_subject_book_adjust$$
+CREATE PROCEDURE sp_patron_subject_book_adjust(IN p_isbn CHAR(13), IN p_subject_id INT,
+                                               IN p_delta INT)
+BEGIN
+    INSERT INTO PatronSubjectStats (patron_id, subject_id, loan_count, unique_books)
+    SELECT l.patron_id, p_subject_id, p_delta * COUNT(*), p_delta
+    FROM Copy c
+    JOIN Loan l ON c.copy_id = l.copy_id
+    WHERE c.isbn = p_isbn
+    GROUP BY l.patron_id
+    ON DUPLICATE KEY UPDATE loan_count   = loan_count + VALUES(loan_count),
+                            unique_books = unique_books + p_delta;
+
+    IF p_delta < 0 THEN
+        DELETE FROM PatronSubjectStats
+        WHERE subject_id = p_subject_id
+          AND loan_count <= 0;
+    END IF;
+
+    UPDATE PatronActivity pa
+    JOIN (
+      SELECT l.patron_id, COUNT(*) AS loans
+      FROM Copy c
+      JOIN Loan l ON c.copy_id = l.copy_id
+      WHERE c.isbn = p_isbn
+      GROUP BY l.patron_id
+    ) bl ON pa.patron_id = bl.patron_id
+    SET pa.subject_loans = pa.subject_loans + p_delta * bl.loans;
+END$$
+
+-- Procedure: Recompute every patron's subject counts from Loan and BookSubject
+DROP PROCEDURE IF EXISTS sp_patron_subject_rebuild$$
+CREATE PROCEDURE sp_patron_subject_rebuild()
+BEGIN
+    DELETE FROM PatronSubjectStats;
+
+    INSERT INTO PatronSubjectStats (patron_id, subject_id, loan_count, unique_books)
+    SELECT l.patron_id, bs.subject_id, COUNT(*), COUNT(DISTINCT c.isbn)
+    FROM Loan l
+    JOIN Copy c ON l.copy_id = c.copy_id
+    JOIN BookSubject bs ON c.isbn = bs.isbn
+    GROUP BY l.patron_id, bs.subject_id;
+
+    UPDATE PatronActivity pa
+    LEFT JOIN (
+      SELECT patron_id, SUM(loan_count) AS subject_loans
+      FROM PatronSubjectStats
+      GROUP BY patron_id
+    ) ps ON pa.patron_id = ps.patron_id
+    SET pa.subject_loans = COALESCE(ps.subject_loans, 0);
+END$$
+
+-- =========================================================
+-- 8. EResourceSeat (open e-resource sessions)
+-- =========================================================
+
+-- Procedure: Recount every resource's open sessions
+DROP PROCEDURE IF EXISTS sp_eresource_seat_rebuild$$
+CREATE PROCEDURE sp_eresource_seat_rebuild()
+BEGIN
+    DELETE FROM EResourceSeat;
+
+    INSERT INTO EResourceSeat (resource_id, seats_in_use)
+    SELECT r.resource_id, COALESCE(os.open_sessions, 0)
+    FROM EResource r
+    LEFT JOIN (
+      SELECT resource_id, COUNT(*) AS open_sessions
+      FROM AccessSession
+      WHERE end_time IS NULL
+      GROUP BY resource_id
+    ) os ON r.resource_id = os.resource_id;
+END$$
+
+-- Procedure: End open sessions with no heartbeat for p_stale_seconds, as of
+-- their last heartbeat; the AccessSession triggers release their seats
+DROP PROCEDURE IF EXISTS sp_accesssession_reap$$
+CREATE PROCEDURE sp_accesssession_reap(IN p_stale_seconds INT)
+BEGIN
+    UPDATE AccessSession
+    SET end_time = GREATEST(last_seen, start_time)
+    WHERE end_time IS NULL
+      AND last_seen < NOW() - INTERVAL p_stale_seconds SECOND;
+END$$
+
+-- Event: Reap stale sessions every five minutes (STALE_AFTER_S in
+-- eresource_sessions.py)
+DROP EVENT IF EXISTS ev_accesssession_reap$$
+CREATE EVENT ev_accesssession_reap
+ON SCHEDULE EVERY 5 MINUTE
+DO
+BEGIN
+    CALL sp_accesssession_reap(900);
+END$$
+
+-- =========================================================
+-- 9. LoanMonthlyRollup (closed-month loan counts by patron type)
+-- =========================================================
+
+-- Procedure: Write the counts of every month that has ended since the newest
+-- closed month. Closed months are never rescanned; later months stay live.
+-- Closes run one at a time under a named lock, so the start month is read
+-- after any concurrent close has written its months.
+DROP PROCEDURE IF EXISTS sp_loan_monthly_rollup_close$$
+CREATE PROCEDURE sp_loan_monthly_rollup_close()
+BEGIN
+    DECLARE v_from DATE;
+    DECLARE v_to   DATE DEFAULT DATE_FORMAT(CURDATE(), '%Y-%m-01');
+    DECLARE EXIT HANDLER FOR SQLEXCEPTION
+    BEGIN
+        DO RELEASE_LOCK('unilib_loan_monthly_close');
+        RESIGNAL;
+    END;
+
+    IF GET_LOCK('unilib_loan_monthly_close', 60) <> 1 THEN
+        SIGNAL SQLSTATE '45000'
+        SET MESSAGE_TEXT = 'Timed out waiting for another LoanMonthlyRollup close.';
+    END IF;
+
+    SELECT MAX(month) + INTERVAL 1 MONTH INTO v_from
+    FROM LoanMonthlyRollup;
+
+    INSERT INTO LoanMonthlyRollup (month, patron_type, loan_count)
+    SELECT DATE_FORMAT(l.loan_ts, '%Y-%m-01') AS loan_month, p.patron_type, COUNT(*)
+    FROM Loan l
+    JOIN Patron p ON l.patron_id = p.patron_id
+    WHERE l.loan_ts >= COALESCE(v_from, '1000-01-01')
+      AND l.loan_ts < v_to
+    GROUP BY loan_month, p.patron_type;
+
+    DO RELEASE_LOCK('unilib_loan_monthly_close');
+END$$
+
+-- Procedure: Add p_delta (+1 / -1) for a loan made at p_loan_ts by p_patron_id,
+-- if its month is already closed (open months are counted live)
+DROP PROCEDURE IF EXISTS sp_loan_monthly_adjust$$
+CREATE PROCEDURE sp_loan_monthly_adjust(IN p_loan_ts TIMESTAMP, IN p_patron_id INT, IN p_delta INT)
+BEGIN
+    DECLARE v_closed_to DATE;
+    DECLARE v_month DATE DEFAULT DATE_FORMAT(p_loan_ts, '%Y-%m-01');
+
+    SELECT MAX(month) INTO v_closed_to
+    FROM LoanMonthlyRollup;
+
+    IF v_month <= v_closed_to THEN
+        INSERT INTO LoanMonthlyRollup (month, patron_type, loan_count)
+        SELECT v_month, patron_type, p_delta
+        FROM Patron
+        WHERE patron_id = p_patron_id
+        ON DUPLICATE KEY UPDATE loan_count = loan_count + p_delta;
+
+        IF p_delta < 0 THEN
+            DELETE FROM LoanMonthlyRollup
+            WHERE month = v_month
+              AND loan_count <= 0;
+        END IF;
+    END IF;
+END$$
+
+-- Procedure: Recount every closed month from Loan (e.g. after patron types
+-- were reassigned; closed months keep the type a patron had when they closed)
+DROP PROCEDURE IF EXISTS sp_loan_monthly_rollup_rebuild$$
+CREATE PROCEDURE sp_loan_monthly_rollup_rebuild()
+BEGIN
+    DELETE FROM LoanMonthlyRollup;
+    CALL sp_loan_monthly_rollup_close();
+END$$
+
+-- Event: Close the previous month shortly after midnight on the 1st.
+-- Without the event scheduler, run `flask close-loan-months` instead; until
+-- then an ended month is still counted live, which is slower but correct.
+DROP EVENT IF EXISTS ev_loan_monthly_rollup_close$$
+CREATE EVENT ev_loan_monthly_rollup_close
+ON SCHEDULE EVERY 1 MONTH
+STARTS TIMESTAMP(LAST_DAY(CURDATE()) + INTERVAL 1 DAY, '00:15:00')
+DO
+BEGIN
+    CALL sp_loan_monthly_rollup_close();
+END$$
+
+-- =========================================================
+-- 10. Hold queue (Reservation 'Ready' holds and Copy.hold_reservation_id)
+-- =========================================================
+
+-- Procedure: Put copy p_copy_id on the hold shelf for the head of its
+-- (isbn, branch) queue, if the copy is free and anyone is queued. The head is
+-- one probe of idx_reservation_queue; the patron gets a 'Ready' notice.
+DROP PROCEDURE IF EXISTS sp_hold_allocate$$
+CREATE PROCEDURE sp_hold_allocate(IN p_copy_id INT, IN p_pickup_days INT)
+BEGIN
+    DECLARE v_isbn CHAR(13);
+    DECLARE v_branch_id INT;
+    DECLARE v_reservation_id INT;
+    -- No free copy or empty queue: nothing to do (and the NOT FOUND must not
+    -- reach a cursor loop in the caller)
+    DECLARE CONTINUE HANDLER FOR NOT FOUND BEGIN END;
+
+    SELECT isbn, branch_id INTO v_isbn, v_branch_id
+    FROM Copy
+    WHERE copy_id = p_copy_id
+      AND current_loan_id IS NULL
+      AND hold_reservation_id IS NULL
+    FOR UPDATE;
+
+    IF v_isbn IS NOT NULL THEN
+        SELECT reservation_id INTO v_reservation_id
+        FROM Reservation
+        WHERE isbn = v_isbn
+          AND branch_id = v_branch_id
+          AND in_queue = 1
+        ORDER BY created_at, reservation_id
+        LIMIT 1
+        FOR UPDATE;
+
+        IF v_reservation_id IS NOT NULL THEN
+            UPDATE Reservation
+            SET status     = 'Ready',
+                copy_id    = p_copy_id,
+                ready_at   = NOW(),
+                expires_at = NOW() + INTERVAL p_pickup_days DAY
+            WHERE reservation_id = v_reservation_id;
+
+            UPDATE Copy
+            SET hold_reservation_id = v_reservation_id
+            WHERE copy_id = p_copy_id;
+
+            INSERT INTO HoldNotification (reservation_id, patron_id, kind)
+            SELECT reservation_id, patron_id, 'Ready'
+            FROM Reservation
+            WHERE reservation_id = v_reservation_id;
+        END IF;
+    END IF;
+END$$
+
+-- Procedure: Expire every 'Ready' hold not collected by its expires_at (found
+-- in one pass over idx_reservation_status_expires), notify the patrons and
+-- hand each released copy to the next patron in its queue. Each hold is one
+-- short transaction that locks the Copy row before the Reservation, the
+-- order circulation uses, so call it outside a transaction. Returns the count.
+DROP PROCEDURE IF EXISTS sp_hold_expire$$
+CREATE PROCEDURE sp_hold_expire(IN p_pickup_days INT)
+BEGIN
+    DECLARE v_done INT DEFAULT 0;
+    DECLARE v_reservation_id INT;
+    DECLARE v_copy_id INT;
+    DECLARE v_held INT;
+    DECLARE v_expired INT DEFAULT 0;
+    DECLARE due_holds CURSOR FOR
+      SELECT reservation_id, copy_id FROM tmp_expired_hold ORDER BY copy_id;
+    DECLARE CONTINUE HANDLER FOR NOT FOUND SET v_done = 1;
+
+    DROP TEMPORARY TABLE IF EXISTS tmp_expired_hold;
+    CREATE TEMPORARY TABLE tmp_expired_hold (
+      reservation_id INT PRIMARY KEY,
+      copy_id        INT NOT NULL
+    );
+
+    INSERT INTO tmp_expired_hold (reservation_id, copy_id)
+    SELECT reservation_id, copy_id
+    FROM Reservation
+    WHERE status = 'Ready'
+      AND expires_at < NOW();
+
+    OPEN due_holds;
+    expire_loop: LOOP
+        FETCH due_holds INTO v_reservation_id, v_copy_id;
+        IF v_done THEN
+            LEAVE expire_loop;
+        END IF;
+
+        START TRANSACTION;
+
+        SELECT hold_reservation_id INTO v_held
+        FROM Copy
+        WHERE copy_id = v_copy_id
+        FOR UPDATE;
+
+        -- Re-check under the locks: a hold collected meanwhile stays 'Fulfilled'
+        UPDATE Reservation
+        SET status = 'Expired'
+        WHERE reservation_id = v_reservation_id
+          AND status = 'Ready'
+          AND expires_at < NOW();
+
+        IF ROW_COUNT() = 1 THEN
+            SET v_expired = v_expired + 1;
+
+            INSERT INTO HoldNotification (reservation_id, patron_id, kind)
+            SELECT reservation_id, patron_id, 'Expired'
+            FROM Reservation
+            WHERE reservation_id = v_reservation_id;
+
+            IF v_held = v_reservation_id THEN
+                UPDATE Copy
+                SET hold_reservation_id = NULL
+                WHERE copy_id = v_copy_id;
+
+                CALL sp_hold_allocate(v_copy_id, p_pickup_days);
+            END IF;
+        END IF;
+
+        COMMIT;
+    END LOOP;
+    CLOSE due_holds;
+
+    DROP TEMPORARY TABLE tmp_expired_hold;
+    SELECT v_expired AS expired_holds;
+END$$
+
+-- Procedure: Hand every available copy with a queue for it to the head of
+-- that queue (after bulk loads or with holds placed by hand). One
+-- transaction per copy, so sp_hold_allocate's row locks are held until its
+-- writes commit; call it outside a transaction.
+DROP PROCEDURE IF EXISTS sp_hold_allocate_available$$
+CREATE PROCEDURE sp_hold_allocate_available(IN p_pickup_days INT)
+BEGIN
+    DECLARE v_done INT DEFAULT 0;
+    DECLARE v_copy_id INT;
+    DECLARE free_copies CURSOR FOR
+      SELECT c.copy_id
+      FROM Copy c
+      WHERE c.status = 'AVAILABLE'
+        AND EXISTS (
+          SELECT 1
+          FROM Reservation r
+          WHERE r.isbn = c.isbn
+            AND r.branch_id = c.branch_id
+            AND r.in_queue = 1
+        )
+      ORDER BY c.copy_id;
+    DECLARE CONTINUE HANDLER FOR NOT FOUND SET v_done = 1;
+
+    OPEN free_copies;
+    allocate_loop: LOOP
+        FETCH free_copies INTO v_copy_id;
+        IF v_done THEN
+            LEAVE allocate_loop;
+        END IF;
+        START TRANSACTION;
+        CALL sp_hold_allocate(v_copy_id, p_pickup_days);
+        COMMIT;
+    END LOOP;
+    CLOSE free_copies;
+END$$
+
+-- Event: Expire uncollected holds every hour (HOLD_PICKUP_DAYS in
+-- circulation.py)
+DROP EVENT IF EXISTS ev_hold_expire$$
+CREATE EVENT ev_hold_expire
+ON SCHEDULE EVERY 1 HOUR
+DO
+BEGIN
+    CALL sp_hold_expire(3);
+END$$
+
+DELIMITER ;
+
+-- Seed the summary rows so the maintenance triggers can update them
+CALL sp_dashboard_summary_reconcile();
+CALL sp_booksearch_rebuild();
+CALL sp_bookcirc_rebuild();
+CALL sp_patron_activity_rebuild();
+CALL sp_copy_current_loan_rebuild();
+CALL sp_coauthor_rebuild();
+CALL sp_patron_subject_rebuild();
+CALL sp_eresource_seat_rebuild();
+CALL sp_loan_monthly_rollup_close();
+CALL sp_hold_allocate_available(3);
+
+-- Usage rollups start from the first session (see eresource_usage.py)
+INSERT IGNORE INTO EResourceUsageState (state_id, rolled_up_to) VALUES (1, NULL);
+
+-- Id sequences start at 1; allocation skips past any existing ids
+INSERT IGNORE INTO IdSequence (seq_name, next_id) VALUES
+('patron', 1),
+('loan', 1),
+('fine', 1),
+('session', 1),
+('reservation', 1),
+('ill_request', 1),
+('ill_batch', 1);
+
+-- =========================================================
+-- End of 08_summaries.sql
+-- =========================================================
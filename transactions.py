@@ -0,0 +1,51 @@
+"""
+Transaction runner and error type shared by the UniLibPlus write modules.
+
+Pooled connections run in autocommit (see DB_CONFIG in app.py), so a write
+that spans several statements goes through ``run_transaction``: one explicit
+transaction around ``work(cursor)``, rolled back on any error. A transaction
+MySQL picks as a deadlock victim, or that times out waiting for a row lock,
+has been rolled back as a whole and is rerun; ``work`` must therefore only
+touch the database (keep counters and other side effects for after it
+returns).
+
+Rules a request breaks are raised as ``ServiceError`` subclasses, which the
+JSON routes turn into ``{"ok": false, "error": code, "message": ...}`` with
+the error's HTTP status.
+"""
+import pymysql
+
+# ER_LOCK_DEADLOCK and ER_LOCK_WAIT_TIMEOUT: the losing transaction is rerun
+RETRY_ERRORS = (1213, 1205)
+TRANSACTION_ATTEMPTS = 3
+
+
+class ServiceError(Exception):
+    """A request that the library's rules refuse"""
+
+    def __init__(self, code, message, status=409):
+        super().__init__(message)
+        self.code = code
+        self.status = status
+
+    def to_dict(self):
+        return {"ok": False, "error": self.code, "message": str(self)}
+
+
+def run_transaction(conn, work, attempts=TRANSACTION_ATTEMPTS):
+    """Run ``work(cursor)`` in its own transaction and return its result"""
+    for attempt in range(1, attempts + 1):
+        conn.begin()
+        try:
+            with conn.cursor() as cur:
+                result = work(cur)
+            conn.commit()
+            return result
+        except pymysql.MySQLError as exc:
+            conn.rollback()
+            if attempt < attempts and exc.args and exc.args[0] in RETRY_ERRORS:
+                continue
+            raise
+        except BaseException:
+            conn.rollback()
+            raise
@@ -18,15 +18,17 @@ CREATE TRIGGER trg_loan_before_insert
 BEFORE INSERT ON Loan
 FOR EACH ROW
 BEGIN
-    DECLARE active_loan_count INT;
+    DECLARE v_current_loan_id INT;
     
-    -- Check if this copy is already on loan (has an active loan with return_ts IS NULL)
-    SELECT COUNT(*) INTO active_loan_count
-    FROM Loan
+    -- Check if this copy is already on loan: Copy.current_loan_id points at
+    -- its open loan, so this is a primary-key read instead of a Loan scan.
+    -- FOR UPDATE serializes concurrent checkouts of the same copy.
+    SELECT current_loan_id INTO v_current_loan_id
+    FROM Copy
     WHERE copy_id = NEW.copy_id
-      AND return_ts IS NULL;
+    FOR UPDATE;
     
-    IF active_loan_count > 0 THEN
+    IF v_current_loan_id IS NOT NULL THEN
         SIGNAL SQLSTATE '45000'
         SET MESSAGE_TEXT = 'Cannot borrow: This copy is already on loan. Please return it first.';
     END IF;
@@ -126,13 +128,13 @@ FOR EACH ROW
 BEGIN
     DECLARE active_reservation_count INT;
     
-    -- Check for active reservations (exclude 'Fulfilled' and 'Cancelled' as they are completed)
+    -- Check for active reservations (exclude 'Fulfilled', 'Cancelled' and 'Expired' as they are completed)
     SELECT COUNT(*) INTO active_reservation_count
     FROM Reservation
     WHERE patron_id = NEW.patron_id
       AND isbn = NEW.isbn
       AND branch_id = NEW.branch_id
-      AND status NOT IN ('Fulfilled', 'Cancelled');
+      AND status NOT IN ('Fulfilled', 'Cancelled', 'Expired');
     
     IF active_reservation_count > 0 THEN
         SIGNAL SQLSTATE '45000'
@@ -146,40 +148,43 @@ END$$
 
 -- Trigger: Enforce concurrent access limits for e-resources
 -- Business rule: Cannot exceed the concurrent_limit specified in the License
+-- An open session takes a seat with one conditional UPDATE of the resource's
+-- EResourceSeat row. The row stays locked until the insert commits, so
+-- concurrent session starts cannot both take the last seat.
 CREATE TRIGGER trg_accesssession_before_insert
 BEFORE INSERT ON AccessSession
 FOR EACH ROW
 BEGIN
-    DECLARE current_sessions INT;
     DECLARE max_concurrent INT;
-    DECLARE license_id_val INT;
-    
-    -- Get the license_id for this resource
-    SELECT license_id INTO license_id_val
-    FROM EResource
-    WHERE resource_id = NEW.resource_id;
-    
-    -- Get the concurrent limit from the license
-    SELECT concurrent_limit INTO max_concurrent
-    FROM License
-    WHERE license_id = license_id_val;
-    
-    -- Count current active sessions (end_time IS NULL means active)
-    SELECT COUNT(*) INTO current_sessions
-    FROM AccessSession
-    WHERE resource_id = NEW.resource_id
-      AND end_time IS NULL;
-    
-    -- Check if adding this session would exceed the limit
-    IF current_sessions >= max_concurrent THEN
-        SIGNAL SQLSTATE '45000'
-        SET MESSAGE_TEXT = CONCAT('Cannot create access session: Concurrent access limit (', max_concurrent, ') has been reached for this resource.');
-    END IF;
-    
+
     -- Validate start_time
     IF NEW.start_time IS NULL THEN
         SET NEW.start_time = CURRENT_TIMESTAMP;
     END IF;
+
+    IF NEW.last_seen IS NULL THEN
+        SET NEW.last_seen = NEW.start_time;
+    END IF;
+
+    -- Only open sessions (end_time IS NULL) hold a seat
+    IF NEW.end_time IS NULL THEN
+        UPDATE EResourceSeat s
+        JOIN EResource r ON s.resource_id = r.resource_id
+        JOIN License l   ON r.license_id = l.license_id
+        SET s.seats_in_use = s.seats_in_use + 1
+        WHERE s.resource_id = NEW.resource_id
+          AND s.seats_in_use < l.concurrent_limit;
+
+        IF ROW_COUNT() = 0 THEN
+            SELECT l.concurrent_limit INTO max_concurrent
+            FROM EResource r
+            JOIN License l ON r.license_id = l.license_id
+            WHERE r.resource_id = NEW.resource_id;
+
+            SIGNAL SQLSTATE '45000'
+            SET MESSAGE_TEXT = CONCAT('Cannot create access session: Concurrent access limit (', COALESCE(max_concurrent, 0), ') has been reached for this resource.');
+        END IF;
+    END IF;
 END$$
 
 -- Trigger: Validate end_time when updating AccessSession
@@ -307,6 +312,490 @@ BEGIN
     END IF;
 END$$
 
+-- =========================================================
+-- 9. Summary maintenance triggers
+--    Keep DashboardSummary, BookCirculationStats, PatronActivity,
+--    PatronSubjectStats and the closed months of LoanMonthlyRollup
+--    (see 08_summaries.sql) current on every write.
+--    Time-window counters are maintained relative to as_of_date; the
+--    daily reconcile rebases them when the date rolls over. DashboardSummary
+--    deltas go to the writing connection's slot (CONNECTION_ID() % 32), so
+--    concurrent transactions lock different rows and each locks only one.
+-- =========================================================
+
+CREATE TRIGGER trg_loan_after_insert
+AFTER INSERT ON Loan
+FOR EACH ROW
+BEGIN
+    DECLARE v_as_of DATE;
+    DECLARE v_overdue_as_of DATE DEFAULT CURDATE();
+    DECLARE v_isbn CHAR(13);
+
+    SELECT isbn INTO v_isbn
+    FROM Copy
+    WHERE copy_id = NEW.copy_id;
+
+    -- Lending a copy also takes it off the hold shelf
+    IF NEW.return_ts IS NULL THEN
+        UPDATE Copy
+        SET current_loan_id = NEW.loan_id,
+            hold_reservation_id = NULL
+        WHERE copy_id = NEW.copy_id;
+    END IF;
+
+    UPDATE BookCirculationStats
+    SET times_loaned     = times_loaned + 1,
+        available_copies = available_copies - (NEW.return_ts IS NULL),
+        last_loan_ts     = GREATEST(COALESCE(last_loan_ts, NEW.loan_ts), NEW.loan_ts)
+    WHERE isbn = v_isbn;
+
+    CALL sp_loan_monthly_adjust(NEW.loan_ts, NEW.patron_id, 1);
+    CALL sp_patron_subject_adjust(NEW.patron_id, v_isbn, NEW.loan_id, 1);
+
+    -- Shared lock: loan writers do not block each other, only the sweep
+    SELECT overdue_as_of INTO v_overdue_as_of
+    FROM PatronActivityState
+    WHERE state_id = 1
+    FOR SHARE;
+
+    UPDATE PatronActivity
+    SET total_loans   = total_loans + 1,
+        active_loans  = active_loans + (NEW.return_ts IS NULL),
+        overdue_loans = overdue_loans + (NEW.return_ts IS NULL AND NEW.due_ts < v_overdue_as_of),
+        late_returns  = late_returns + COALESCE(NEW.return_ts > NEW.due_ts, 0),
+        last_loan_ts  = GREATEST(COALESCE(last_loan_ts, NEW.loan_ts), NEW.loan_ts)
+    WHERE patron_id = NEW.patron_id;
+
+    SELECT as_of_date INTO v_as_of
+    FROM DashboardSummary
+    WHERE slot = CONNECTION_ID() % 32;
+
+    UPDATE DashboardSummary
+    SET total_loans          = total_loans + 1,
+        current_loans        = current_loans + (NEW.return_ts IS NULL),
+        overdue_loans        = overdue_loans + (NEW.return_ts IS NULL AND NEW.due_ts < v_as_of),
+        open_loan_day_sum    = open_loan_day_sum + IF(NEW.return_ts IS NULL, TO_DAYS(NEW.loan_ts), 0),
+        closed_duration_days = closed_duration_days
+                               + IF(NEW.return_ts IS NULL, 0, DATEDIFF(NEW.return_ts, DATE(NEW.loan_ts))),
+        loans_last_7d        = loans_last_7d + (DATE(NEW.loan_ts) >= DATE_SUB(v_as_of, INTERVAL 7 DAY)),
+        returns_last_7d      = returns_last_7d
+                               + COALESCE(DATE(NEW.return_ts) >= DATE_SUB(v_as_of, INTERVAL 7 DAY), 0),
+        -- A patron becomes "active" with their first loan inside the 90-day window
+        active_patrons_90d   = active_patrons_90d + (
+                                 NEW.loan_ts >= DATE_SUB(v_as_of, INTERVAL 90 DAY)
+                                 AND NOT EXISTS (
+                                   SELECT 1 FROM Loan l
+                                   WHERE l.patron_id = NEW.patron_id
+                                     AND l.loan_id <> NEW.loan_id
+                                     AND l.loan_ts >= DATE_SUB(v_as_of, INTERVAL 90 DAY)
+                                 ))
+    WHERE slot = CONNECTION_ID() % 32;
+END$$
+
+CREATE TRIGGER trg_loan_after_update
+AFTER UPDATE ON Loan
+FOR EACH ROW
+BEGIN
+    DECLARE v_as_of DATE;
+    DECLARE v_overdue_as_of DATE DEFAULT CURDATE();
+
+    IF NOT (OLD.return_ts <=> NEW.return_ts) THEN
+        UPDATE BookCirculationStats
+        SET available_copies = available_copies + (OLD.return_ts IS NULL) - (NEW.return_ts IS NULL)
+        WHERE isbn = (SELECT isbn FROM Copy WHERE copy_id = NEW.copy_id);
+
+        -- Returned: the copy is back on the shelf (return_ts cannot be unset)
+        UPDATE Copy
+        SET current_loan_id = NULL
+        WHERE copy_id = NEW.copy_id
+          AND current_loan_id = NEW.loan_id;
+    END IF;
+
+    IF NOT (OLD.loan_ts <=> NEW.loan_ts) THEN
+        CALL sp_loan_monthly_adjust(OLD.loan_ts, OLD.patron_id, -1);
+        CALL sp_loan_monthly_adjust(NEW.loan_ts, NEW.patron_id, 1);
+    END IF;
+
+    -- Shared lock: loan writers do not block each other, only the sweep
+    SELECT overdue_as_of INTO v_overdue_as_of
+    FROM PatronActivityState
+    WHERE state_id = 1
+    FOR SHARE;
+
+    UPDATE PatronActivity
+    SET active_loans  = active_loans - (OLD.return_ts IS NULL) + (NEW.return_ts IS NULL),
+        overdue_loans = overdue_loans
+                        - (OLD.return_ts IS NULL AND OLD.due_ts < v_overdue_as_of)
+                        + (NEW.return_ts IS NULL AND NEW.due_ts < v_overdue_as_of),
+        late_returns  = late_returns
+                        - COALESCE(OLD.return_ts > OLD.due_ts, 0)
+                        + COALESCE(NEW.return_ts > NEW.due_ts, 0)
+    WHERE patron_id = NEW.patron_id;
+
+    SELECT as_of_date INTO v_as_of
+    FROM DashboardSummary
+    WHERE slot = CONNECTION_ID() % 32;
+
+    -- Subtract the old row's contribution and add the new one
+    UPDATE DashboardSummary
+    SET current_loans        = current_loans - (OLD.return_ts IS NULL) + (NEW.return_ts IS NULL),
+        overdue_loans        = overdue_loans
+                               - (OLD.return_ts IS NULL AND OLD.due_ts < v_as_of)
+                               + (NEW.return_ts IS NULL AND NEW.due_ts < v_as_of),
+        open_loan_day_sum    = open_loan_day_sum
+                               - IF(OLD.return_ts IS NULL, TO_DAYS(OLD.loan_ts), 0)
+                               + IF(NEW.return_ts IS NULL, TO_DAYS(NEW.loan_ts), 0),
+        closed_duration_days = closed_duration_days
+                               - IF(OLD.return_ts IS NULL, 0, DATEDIFF(OLD.return_ts, DATE(OLD.loan_ts)))
+                               + IF(NEW.return_ts IS NULL, 0, DATEDIFF(NEW.return_ts, DATE(NEW.loan_ts))),
+        loans_last_7d        = loans_last_7d
+                               - (DATE(OLD.loan_ts) >= DATE_SUB(v_as_of, INTERVAL 7 DAY))
+                               + (DATE(NEW.loan_ts) >= DATE_SUB(v_as_of, INTERVAL 7 DAY)),
+        returns_last_7d      = returns_last_7d
+                               - COALESCE(DATE(OLD.return_ts) >= DATE_SUB(v_as_of, INTERVAL 7 DAY), 0)
+                               + COALESCE(DATE(NEW.return_ts) >= DATE_SUB(v_as_of, INTERVAL 7 DAY), 0)
+    WHERE slot = CONNECTION_ID() % 32;
+END$$
+
+CREATE TRIGGER trg_loan_after_delete
+AFTER DELETE ON Loan
+FOR EACH ROW
+BEGIN
+    DECLARE v_as_of DATE;
+    DECLARE v_overdue_as_of DATE DEFAULT CURDATE();
+    DECLARE v_isbn CHAR(13);
+
+    SELECT isbn INTO v_isbn
+    FROM Copy
+    WHERE copy_id = OLD.copy_id;
+
+    IF OLD.return_ts IS NULL THEN
+        UPDATE Copy
+        SET current_loan_id = NULL
+        WHERE copy_id = OLD.copy_id
+          AND current_loan_id = OLD.loan_id;
+    END IF;
+
+    UPDATE BookCirculationStats
+    SET times_loaned     = times_loaned - 1,
+        available_copies = available_copies + (OLD.return_ts IS NULL),
+        last_loan_ts     = (SELECT MAX(l.loan_ts)
+                            FROM Copy c
+                            JOIN Loan l ON c.copy_id = l.copy_id
+                            WHERE c.isbn = v_isbn)
+    WHERE isbn = v_isbn;
+
+    CALL sp_loan_monthly_adjust(OLD.loan_ts, OLD.patron_id, -1);
+    CALL sp_patron_subject_adjust(OLD.patron_id, v_isbn, OLD.loan_id, -1);
+
+    -- Shared lock: loan writers do not block each other, only the sweep
+    SELECT overdue_as_of INTO v_overdue_as_of
+    FROM PatronActivityState
+    WHERE state_id = 1
+    FOR SHARE;
+
+    UPDATE PatronActivity
+    SET total_loans   = total_loans - 1,
+        active_loans  = active_loans - (OLD.return_ts IS NULL),
+        overdue_loans = overdue_loans - (OLD.return_ts IS NULL AND OLD.due_ts < v_overdue_as_of),
+        late_returns  = late_returns - COALESCE(OLD.return_ts > OLD.due_ts, 0),
+        last_loan_ts  = (SELECT MAX(l.loan_ts) FROM Loan l WHERE l.patron_id = OLD.patron_id)
+    WHERE patron_id = OLD.patron_id;
+
+    SELECT as_of_date INTO v_as_of
+    FROM DashboardSummary
+    WHERE slot = CONNECTION_ID() % 32;
+
+    UPDATE DashboardSummary
+    SET total_loans          = total_loans - 1,
+        current_loans        = current_loans - (OLD.return_ts IS NULL),
+        overdue_loans        = overdue_loans - (OLD.return_ts IS NULL AND OLD.due_ts < v_as_of),
+        open_loan_day_sum    = open_loan_day_sum - IF(OLD.return_ts IS NULL, TO_DAYS(OLD.loan_ts), 0),
+        closed_duration_days = closed_duration_days
+                               - IF(OLD.return_ts IS NULL, 0, DATEDIFF(OLD.return_ts, DATE(OLD.loan_ts))),
+        loans_last_7d        = loans_last_7d - (DATE(OLD.loan_ts) >= DATE_SUB(v_as_of, INTERVAL 7 DAY)),
+        returns_last_7d      = returns_last_7d
+                               - COALESCE(DATE(OLD.return_ts) >= DATE_SUB(v_as_of, INTERVAL 7 DAY), 0),
+        active_patrons_90d   = active_patrons_90d - (
+                                 OLD.loan_ts >= DATE_SUB(v_as_of, INTERVAL 90 DAY)
+                                 AND NOT EXISTS (
+                                   SELECT 1 FROM Loan l
+                                   WHERE l.patron_id = OLD.patron_id
+                                     AND l.loan_ts >= DATE_SUB(v_as_of, INTERVAL 90 DAY)
+                                 ))
+    WHERE slot = CONNECTION_ID() % 32;
+END$$
+
+CREATE TRIGGER trg_fine_after_insert
+AFTER INSERT ON Fine
+FOR EACH ROW
+BEGIN
+    UPDATE DashboardSummary
+    SET total_unpaid_fines = total_unpaid_fines + IF(NEW.status = 'Unpaid', NEW.amount, 0)
+    WHERE slot = CONNECTION_ID() % 32;
+
+    UPDATE PatronActivity
+    SET total_fines  = total_fines + NEW.amount,
+        unpaid_fines = unpaid_fines + IF(NEW.status = 'Unpaid', NEW.amount, 0)
+    WHERE patron_id = NEW.patron_id;
+END$$
+
+CREATE TRIGGER trg_fine_after_update
+AFTER UPDATE ON Fine
+FOR EACH ROW
+BEGIN
+    UPDATE DashboardSummary
+    SET total_unpaid_fines = total_unpaid_fines
+                             - IF(OLD.status = 'Unpaid', OLD.amount, 0)
+                             + IF(NEW.status = 'Unpaid', NEW.amount, 0)
+    WHERE slot = CONNECTION_ID() % 32;
+
+    UPDATE PatronActivity
+    SET total_fines  = total_fines - OLD.amount,
+        unpaid_fines = unpaid_fines - IF(OLD.status = 'Unpaid', OLD.amount, 0)
+    WHERE patron_id = OLD.patron_id;
+
+    UPDATE PatronActivity
+    SET total_fines  = total_fines + NEW.amount,
+        unpaid_fines = unpaid_fines + IF(NEW.status = 'Unpaid', NEW.amount, 0)
+    WHERE patron_id = NEW.patron_id;
+END$$
+
+CREATE TRIGGER trg_fine_after_delete
+AFTER DELETE ON Fine
+FOR EACH ROW
+BEGIN
+    UPDATE DashboardSummary
+    SET total_unpaid_fines = total_unpaid_fines - IF(OLD.status = 'Unpaid', OLD.amount, 0)
+    WHERE slot = CONNECTION_ID() % 32;
+
+    UPDATE PatronActivity
+    SET total_fines  = total_fines - OLD.amount,
+        unpaid_fines = unpaid_fines - IF(OLD.status = 'Unpaid', OLD.amount, 0)
+    WHERE patron_id = OLD.patron_id;
+END$$
+
+CREATE TRIGGER trg_book_after_insert
+AFTER INSERT ON Book
+FOR EACH ROW
+BEGIN
+    UPDATE DashboardSummary SET total_books = total_books + 1 WHERE slot = CONNECTION_ID() % 32;
+    INSERT IGNORE INTO BookCirculationStats (isbn) VALUES (NEW.isbn);
+    CALL sp_booksearch_refresh(NEW.isbn);
+END$$
+
+CREATE TRIGGER trg_book_after_update
+AFTER UPDATE ON Book
+FOR EACH ROW
+BEGIN
+    CALL sp_booksearch_refresh(NEW.isbn);
+END$$
+
+CREATE TRIGGER trg_book_after_delete
+AFTER DELETE ON Book
+FOR EACH ROW
+BEGIN
+    UPDATE DashboardSummary SET total_books = total_books - 1 WHERE slot = CONNECTION_ID() % 32;
+END$$
+
+CREATE TRIGGER trg_copy_after_insert
+AFTER INSERT ON Copy
+FOR EACH ROW
+BEGIN
+    UPDATE DashboardSummary SET total_copies = total_copies + 1 WHERE slot = CONNECTION_ID() % 32;
+
+    -- A new copy has no loans yet, so it is available
+    INSERT INTO BookCirculationStats (isbn, total_copies, available_copies)
+    VALUES (NEW.isbn, 1, 1)
+    ON DUPLICATE KEY UPDATE
+      total_copies     = total_copies + 1,
+      available_copies = available_copies + 1;
+END$$
+
+CREATE TRIGGER trg_copy_after_delete
+AFTER DELETE ON Copy
+FOR EACH ROW
+BEGIN
+    UPDATE DashboardSummary SET total_copies = total_copies - 1 WHERE slot = CONNECTION_ID() % 32;
+
+    -- Copies with loan history cannot be deleted (Loan FK), so it was available
+    UPDATE BookCirculationStats
+    SET total_copies     = total_copies - 1,
+        available_copies = available_copies - 1
+    WHERE isbn = OLD.isbn;
+END$$
+
+CREATE TRIGGER trg_patron_after_insert
+AFTER INSERT ON Patron
+FOR EACH ROW
+BEGIN
+    UPDATE DashboardSummary SET total_patrons = total_patrons + 1 WHERE slot = CONNECTION_ID() % 32;
+    INSERT IGNORE INTO PatronActivity (patron_id) VALUES (NEW.patron_id);
+END$$
+
+CREATE TRIGGER trg_patron_after_delete
+AFTER DELETE ON Patron
+FOR EACH ROW
+BEGIN
+    UPDATE DashboardSummary SET total_patrons = total_patrons - 1 WHERE slot = CONNECTION_ID() % 32;
+END$$
+
+-- =========================================================
+-- 10. E-resource seat maintenance triggers
+--     Keep EResourceSeat.seats_in_use equal to the resource's open
+--     AccessSession rows (seats are taken in the BEFORE INSERT trigger).
+-- =========================================================
+
+-- Ending (or deleting) an open session gives its seat back
+CREATE TRIGGER trg_accesssession_after_update
+AFTER UPDATE ON AccessSession
+FOR EACH ROW
+BEGIN
+    IF NOT (OLD.end_time <=> NEW.end_time AND OLD.resource_id = NEW.resource_id) THEN
+        IF OLD.end_time IS NULL THEN
+            UPDATE EResourceSeat
+            SET seats_in_use = seats_in_use - 1
+            WHERE resource_id = OLD.resource_id;
+        END IF;
+        IF NEW.end_time IS NULL THEN
+            UPDATE EResourceSeat
+            SET seats_in_use = seats_in_use + 1
+            WHERE resource_id = NEW.resource_id;
+        END IF;
+    END IF;
+END$$
+
+CREATE TRIGGER trg_accesssession_after_delete
+AFTER DELETE ON AccessSession
+FOR EACH ROW
+BEGIN
+    IF OLD.end_time IS NULL THEN
+        UPDATE EResourceSeat
+        SET seats_in_use = seats_in_use - 1
+        WHERE resource_id = OLD.resource_id;
+    END IF;
+END$$
+
+CREATE TRIGGER trg_eresource_after_insert
+AFTER INSERT ON EResource
+FOR EACH ROW
+BEGIN
+    INSERT INTO EResourceSeat (resource_id) VALUES (NEW.resource_id);
+END$$
+
+-- =========================================================
+-- 11. Catalog search maintenance triggers
+--     Keep BookSearch documents in step with the catalog tables.
+-- =========================================================
+
+-- BookAuthor also maintains the CoAuthorPair graph (see 08_summaries.sql)
+CREATE TRIGGER trg_bookauthor_after_insert
+AFTER INSERT ON BookAuthor
+FOR EACH ROW
+BEGIN
+    CALL sp_booksearch_refresh(NEW.isbn);
+    CALL sp_coauthor_adjust(NEW.isbn, NEW.author_id, 1, NULL);
+END$$
+
+CREATE TRIGGER trg_bookauthor_after_update
+AFTER UPDATE ON BookAuthor
+FOR EACH ROW
+BEGIN
+    -- The row already reads as NEW: when only the author changed, the old
+    -- author never co-wrote this book with the new one, so skip that pair
+    IF NOT (OLD.isbn <=> NEW.isbn AND OLD.author_id <=> NEW.author_id) THEN
+        CALL sp_coauthor_adjust(OLD.isbn, OLD.author_id, -1,
+                                IF(OLD.isbn = NEW.isbn, NEW.author_id, NULL));
+        CALL sp_coauthor_adjust(NEW.isbn, NEW.author_id, 1, NULL);
+        CALL sp_booksearch_refresh(OLD.isbn);
+        CALL sp_booksearch_refresh(NEW.isbn);
+    END IF;
+END$$
+
+CREATE TRIGGER trg_bookauthor_after_delete
+AFTER DELETE ON BookAuthor
+FOR EACH ROW
+BEGIN
+    CALL sp_booksearch_refresh(OLD.isbn);
+    CALL sp_coauthor_adjust(OLD.isbn, OLD.author_id, -1, NULL);
+END$$
+
+-- BookSubject also maintains PatronSubjectStats for every borrower of the book
+CREATE TRIGGER trg_booksubject_after_insert
+AFTER INSERT ON BookSubject
+FOR EACH ROW
+BEGIN
+    CALL sp_booksearch_refresh(NEW.isbn);
+    CALL sp_patron_subject_book_adjust(NEW.isbn, NEW.subject_id, 1);
+END$$
+
+CREATE TRIGGER trg_booksubject_after_delete
+AFTER DELETE ON BookSubject
+FOR EACH ROW
+BEGIN
+    CALL sp_booksearch_refresh(OLD.isbn);
+    CALL sp_patron_subject_book_adjust(OLD.isbn, OLD.subject_id, -1);
+END$$
+
+-- Renaming an author, subject or publisher refreshes every affected book
+CREATE TRIGGER trg_author_after_update
+AFTER UPDATE ON Author
+FOR EACH ROW
+BEGIN
+    DECLARE done INT DEFAULT 0;
+    DECLARE v_isbn CHAR(13);
+    DECLARE cur_books CURSOR FOR
+        SELECT isbn FROM BookAuthor WHERE author_id = NEW.author_id;
+    DECLARE CONTINUE HANDLER FOR NOT FOUND SET done = 1;
+
+    IF NOT (OLD.first_name <=> NEW.first_name AND OLD.last_name <=> NEW.last_name) THEN
+        OPEN cur_books;
+        refresh_loop: LOOP
+            FETCH cur_books INTO v_isbn;
+            IF done THEN
+                LEAVE refresh_loop;
+            END IF;
+            CALL sp_booksearch_refresh(v_isbn);
+        END LOOP;
+        CLOSE cur_books;
+    END IF;
+END$$
+
+CREATE TRIGGER trg_subject_after_update
+AFTER UPDATE ON Subject
+FOR EACH ROW
+BEGIN
+    DECLARE done INT DEFAULT 0;
+    DECLARE v_isbn CHAR(13);
+    DECLARE cur_books CURSOR FOR
+        SELECT isbn FROM BookSubject WHERE subject_id = NEW.subject_id;
+    DECLARE CONTINUE HANDLER FOR NOT FOUND SET done = 1;
+
+    IF NOT (OLD.name <=> NEW.name) THEN
+        OPEN cur_books;
+        refresh_loop: LOOP
+            FETCH cur_books INTO v_isbn;
+            IF done THEN
+                LEAVE refresh_loop;
+            END IF;
+            CALL sp_booksearch_refresh(v_isbn);
+        END LOOP;
+        CLOSE cur_books;
+    END IF;
+END$$
+
+CREATE TRIGGER trg_publisher_after_update
+AFTER UPDATE ON Publisher
+FOR EACH ROW
+BEGIN
+    IF NOT (OLD.name <=> NEW.name) THEN
+        UPDATE BookSearch bsr
+        JOIN Book b ON bsr.isbn = b.isbn
+        SET bsr.publisher_name = NEW.name
+        WHERE b.publisher_id = NEW.publisher_id;
+    END IF;
+END$$
+
 DELIMITER ;
 
 -- =========================================================
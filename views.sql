@@ -41,6 +41,7 @@ SELECT
   b.title,
   br.branch_id,
   br.name          AS branch_name,
+  c.status,
   t.term_id        AS checkin_term_id,
   CONCAT(t.name, ' ', t.year) AS checkin_term
 FROM Copy c
@@ -203,7 +204,10 @@ SELECT
   ir.patron_id,
   CONCAT(p.first_name, ' ', p.last_name) AS patron_name,
   ir.partner_id,
-  pl.name AS partner_name
+  pl.name AS partner_name,
+  ir.batch_id,
+  ir.dispatched_at,
+  ir.received_at
 FROM ILLRequest ir
 JOIN Patron        p  ON ir.patron_id  = p.patron_id
 JOIN PartnerLibrary pl ON ir.partner_id = pl.partner_id